@@ -6,7 +6,7 @@ from PyQt5.QtWidgets import *
 
 import struct
 from cringe.shared import terminal_colors as tc
-from cringe.shared import log
+from cringe.shared import log, profiling
 
 
 class dfbChn(QWidget):
@@ -524,6 +524,7 @@ class dfbChn(QWidget):
  
         msg = struct.pack('BBBBB', b0, b1, b2, b3, b4)
         self.serialport.write(msg)
+        profiling.count("register writes")
         time.sleep(0.001)
         
     def packState(self):
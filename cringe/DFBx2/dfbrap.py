@@ -10,7 +10,7 @@ from PyQt5.QtWidgets import *
 import named_serial
 from .dfbchn import dfbChn
 from cringe.shared import terminal_colors as tc
-from cringe.shared import log
+from cringe.shared import log, profiling
 
 
 class dfbrap(QWidget):
@@ -1055,6 +1055,7 @@ class dfbrap(QWidget):
 		b4 = (self.address << 1) + 1		   # Address shifted up 1 bit with address bit set
 		msg = struct.pack('BBBBB', b0, b1, b2, b3, b4)
 		self.serialport.write(msg)
+		profiling.count("register writes")
 		time.sleep(0.001)
 
 	def packCHglobals(self):
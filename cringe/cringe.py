@@ -16,7 +16,7 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 import named_serial
 
 from cringe.shared import terminal_colors as tc
-from cringe.shared import log, logging
+from cringe.shared import log, logging, profiling
 
 from cringe.DFBx2.dfbcard import dfbcard
 from cringe.BADASS.badcard import badcard
@@ -24,10 +24,11 @@ from cringe.DFBx2.dfbclkcard import dfbclkcard
 from cringe.emu_card import EMU_Card
 from cringe.DFBx2.dfbscard import dfbscard
 from cringe.tune.tunetab import TuneTab
+from cringe.tune.autotune import parse_channels
 from cringe.tower import towerwidget
 from cringe.calibration.caltab import CalTab
 
-from cringe.cringe_control import CRINGE_COMMANDS, build_zmq_addr
+from cringe.cringe_control import CRINGE_COMMANDS, TUNE_SAFE_COMMANDS, build_zmq_addr
 from cringe.zmq_rep import ZmqRep
 
 class Cringe(QtWidgets.QWidget):
@@ -916,7 +917,12 @@ class Cringe(QtWidgets.QWidget):
         # original commands were uppercase - still accept those
         command = command_words[0].lower()
         command_args = command_words[1:]
-        if command in self.cringe_commands:
+        if command in self.cringe_commands and command not in TUNE_SAFE_COMMANDS and \
+                self.tune_widget.vphidemo.tuneRunning():
+            # the tune runs on a worker thread, so these would otherwise change the hardware between tune stages
+            success = False
+            extra_info = f"`{message}` refused, a tune started from the tune tab is running, try again when it is done"
+        elif command in self.cringe_commands:
             f = self.cringe_commands[command]['func']
             llog.info(f"calling: {f}")
             try:
@@ -969,9 +975,19 @@ class Cringe(QtWidgets.QWidget):
         connected = self.tune_widget.vphidemo.c.startclient()
         if not connected:
             return False, "tune client failed to connect, is dastard lancero source running?"
-        self.tune_widget.vphidemo.fullTune()
+        result = self.tune_widget.vphidemo.fullTuneHeadless()
         llog.debug("done")
-        return True, ""
+        timings = ", ".join(f"{stage} {elapsed_s:.1f} s" for stage, elapsed_s in result.timings.items())
+        return True, f"{np.sum(result.chanisgood)} of {result.chanisgood.size} channels locked, {timings}"
+
+    def extern_retune(self, col_rows):
+        llog = log.child("extern_retune")
+        llog.debug("start")
+        channels = None if col_rows == "bad" else parse_channels(col_rows)
+        result = self.tune_widget.vphidemo.retuneHeadless(channels)
+        llog.debug("done")
+        timings = ", ".join(f"{stage} {elapsed_s:.1f} s" for stage, elapsed_s in result.timings.items())
+        return True, f"{np.sum(result.chanisgood)} of {result.chanisgood.size} channels locked, {timings}"
 
     def rpc_set_tower_channel(self, cardname, bayname, dacvalue):
         self.tune_widget.mm.setTowerChannelDAC(cardname, bayname, int(dacvalue))
@@ -986,6 +1002,13 @@ class Cringe(QtWidgets.QWidget):
         return True, ""
             
 
+    def rpc_relock_fba_rows(self, col_rows):
+        for col_and_rows in col_rows.split(";"):
+            col, rows = col_and_rows.split(":")
+            for row in rows.split(","):
+                self.tune_widget.mm.relockFBA(int(col), int(row))
+        return True, ""
+
     def rpc_relock_fbb(self, col, row):
         self.tune_widget.mm.relockFBB(int(col), int(row))    
         return True, ""
@@ -2295,6 +2318,7 @@ class Cringe(QtWidgets.QWidget):
         b4 = (addr << 1) + 1
         msg = struct.pack('BBBBB', b0, b1, b2, b3, b4)
         self.serialport.write(msg)
+        profiling.count("register writes")
         time.sleep(0.001)
 
     def saveSettings(self):
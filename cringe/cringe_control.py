@@ -13,8 +13,10 @@ CRINGE_PORT = 5509
 CRINGE_COMMANDS = {
     'setup_crate':{'fname':'full_crate_init', 'args':None, 'help':'Full crate init'},
     'full_tune':{'fname': 'extern_tune', 'args':None, 'help':'Full tune'},
+    'retune':{'fname': 'extern_retune', 'args':['col_rows'], 'help':'retune some channels after a full tune, leaving the others, col_rows is col:row,row;col eg 0:1,5;3 for col 0 rows 1 and 5 and all of col 3, or bad for the channels the last tune left unlocked'},
     'relock_fba':{'fname':'rpc_relock_fba', 'args': ['col', 'row'], 'help': 'relock FBA for col and row, column matches dastard after tune'},
     'relock_all_locked_fba':{'fname':'rpc_relock_all_locked_fba', 'args': ['col'], 'help': 'relock FBA for each row in col that is locked'},
+    'relock_fba_rows':{'fname':'rpc_relock_fba_rows', 'args': ['col_rows'], 'help': 'relock FBA for many rows in one request, col_rows is col:row,row;col:row eg 0:1,5;2:3'},
     'relock_fbb':{'fname':'rpc_relock_fbb', 'args': ['col', 'row'], 'help': 'relock FBB for col and row, column matches dastard after tune'},
     'set_arl_off':{'fname':'rpc_set_arl_off', 'args':None, 'help': 'set ARL (autorelock) off for all rows in this column'},
     'set_fba_offset':{'fname':'rpc_set_fba_offset', 'args':['col', 'fba_offset'], 'help':'set fba_offset for all rows in this column'},
@@ -29,6 +31,9 @@ CRINGE_COMMANDS = {
 #    'cmd':{'fname':name, 'args':[], 'help':''},      
     }
 
+# while a tune started from the tune tab runs cringe only serves these, the others change the hardware under the tune
+TUNE_SAFE_COMMANDS = ['get_fba_offsets']
+
 
 def build_zmq_addr(host='localhost', port=CRINGE_PORT):
     return 'tcp://%s:%d' % (host,port)
@@ -58,6 +63,16 @@ class CringeControl:
         reply = self.send(command)
         return reply
 
+    def retune(self, col_rows):
+        ''' retune the channels in col_rows, a dict of col: list of rows, or None for the whole column '''
+        arg = ';'.join(str(int(col)) if rows is None else '%d:%s' % (int(col), ','.join(str(int(row)) for row in rows))
+                       for col, rows in col_rows.items() if rows is None or len(rows) > 0)
+        return self.send(' '.join(('retune', arg)))
+
+    def retune_bad(self):
+        ''' retune the channels the last tune left unlocked '''
+        return self.send('retune bad')
+
     def set_tower_channel(self, cardname, bayname, dacvalue):
         return self.send(' '.join(('set_tower_channel', cardname, bayname, str(int(dacvalue)))))
 
@@ -67,6 +82,12 @@ class CringeControl:
     def relock_fba(self, col, row):
         return self.send(' '.join(('relock_fba', str(int(col)), str(int(row)))))
 
+    def relock_fba_rows(self, col_rows):
+        ''' relock FBA for every row in col_rows, a dict of col: list of rows, in one request '''
+        arg = ';'.join('%d:%s' % (int(col), ','.join(str(int(row)) for row in rows))
+                       for col, rows in col_rows.items() if len(rows) > 0)
+        return self.send(' '.join(('relock_fba_rows', arg)))
+
     def relock_fbb(self, col, row):
         return self.send(' '.join(('relock_fbb', str(int(col)), str(int(row)))))
 
@@ -10,3 +10,10 @@ if not os.path.isdir(SAVEDIR):
 
 def get_savepath(name):
     return os.path.join(SAVEDIR, name)
+
+
+def jsonable(x):
+    """json.dump default for numpy arrays and scalars, anything else is written as its str"""
+    if hasattr(x, "tolist"):
+        return x.tolist()
+    return str(x)
@@ -0,0 +1,143 @@
+"""nested timing spans and counters, to find where the time goes in long sequences like the full tune
+
+    profiler = Profiler("full tune")
+    with profiler.active():
+        with span("fbb vphi"):
+            data = getNewData()
+            count("frames acquired", data.shape[2])
+    profiler.write(get_savepath("last_tune_profile.json"))
+
+span and count do nothing when no profiler is active, so library code like the MuxMaster and sendReg can call
+them unconditionally. spans with the same name under the same parent are merged, with their calls counted.
+counts are added to every open span, so each span's counts include its children's. there is one stack of open
+spans shared by all threads, so register writes made on the gui thread while a worker waits on it count
+towards the worker's span.
+"""
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from cringe.shared import jsonable
+
+_active = None
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.counts = {}
+        self.children = {}
+
+    def child(self, name):
+        if name not in self.children:
+            self.children[name] = Span(name)
+        return self.children[name]
+
+    def to_dict(self):
+        return {"name": self.name, "seconds": self.seconds, "calls": self.calls, "counts": dict(self.counts),
+                "children": [c.to_dict() for c in self.children.values()]}
+
+
+class Profiler:
+    def __init__(self, name):
+        self.root = Span(name)
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.info = {}  # extra values for the report, eg settings
+        self._stack = [self.root]
+        self._lock = threading.RLock()
+        self._t_start = None
+
+    @contextmanager
+    def active(self):
+        """send span and count to this profiler while in the with block, and time the root span"""
+        global _active
+        previous, _active = _active, self
+        self._t_start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            _active = previous
+            self.root.seconds += time.perf_counter()-self._t_start
+            self.root.calls += 1
+
+    @contextmanager
+    def span(self, name):
+        with self._lock:
+            s = self._stack[-1].child(name)
+            self._stack.append(s)
+        t_start = time.perf_counter()
+        try:
+            yield s
+        finally:
+            with self._lock:
+                s.seconds += time.perf_counter()-t_start
+                s.calls += 1
+                self._stack.remove(s)
+
+    def count(self, name, n=1):
+        with self._lock:
+            for s in self._stack:
+                s.counts[name] = s.counts.get(name, 0)+n
+
+    def add(self, name, seconds):
+        """record a span timed elsewhere, eg on another thread, directly under the root"""
+        with self._lock:
+            s = self.root.child(name)
+            s.seconds += seconds
+            s.calls += 1
+
+    def report(self):
+        with self._lock:
+            return {"started": self.started, "info": self.info, "spans": self.root.to_dict()}
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1, default=jsonable)
+        return path
+
+    def summary(self, depth=2):
+        """lines of name, seconds and counts, indented by depth"""
+        lines = []
+
+        def visit(s, level):
+            counts = "".join(f", {v} {k}" for k, v in s.counts.items())
+            lines.append(f"{'  '*level}{s.name}: {s.seconds:.3f} s in {s.calls} calls{counts}")
+            if level < depth:
+                for c in s.children.values():
+                    visit(c, level+1)
+        with self._lock:
+            visit(self.root, 0)
+        return "\n".join(lines)
+
+
+@contextmanager
+def span(name):
+    profiler = _active
+    if profiler is None:
+        yield None
+    else:
+        with profiler.span(name) as s:
+            yield s
+
+
+def count(name, n=1):
+    profiler = _active
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+def profiled(name=None):
+    """decorator, run the function in a span named after it"""
+    def decorator(f):
+        spanname = f.__name__ if name is None else name
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(spanname):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
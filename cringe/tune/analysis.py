@@ -51,8 +51,7 @@ def conditionvphi(triangle, signal, tridwell, tristeps, tristepsize):
         #     ind = np.where(~a)[0][0]
         #     print(f"i={i} s={s} {ind}")
         if s > 1:  # also allow one tolerance here
-            np.save(os.path.join(
-                savedir, "last_failed_sampledtriangle"), sampledtriangle)
+            np.save(get_savepath("last_failed_sampledtriangle"), sampledtriangle)
             np.save(get_savepath("last_failed_triangle"), triangle)
             np.save(get_savepath("last_failed_signal"), signal)
             ind = np.where(~b)[0][0]
@@ -79,26 +78,91 @@ def conditionvphi(triangle, signal, tridwell, tristeps, tristepsize):
     return oneramp, outSignalUp, outSignalDown
 
 
-def conditionvphis(triangle, signal, tridwell, tristeps, tristepsize):
-    ncol, nrow, _ = signal.shape
+def conditionvphis(triangle, signal, tridwell, tristeps, tristepsize, return_quality=False):
+    """conditionvphi for every (col, row) channel at once, triangle and signal are (col, row, frame).
+    returns oneramp and the (col, row, linsteps//2-1) averaged up and down ramps of signal.
+    raises if any channel's triangle is imperfect, unless return_quality is True, then the (col, row) bool
+    mask of channels with a good triangle is returned as well and the bad channels' ramps should be ignored.
+    """
+    llog = log.child("analysis.conditionvphis")
+    ncol, nrow, nframes = signal.shape
     lindwell, linperiod, linsteps, linstepsize = lineartriangleparams(
         tridwell, tristeps, tristepsize)
-    outsigsup = np.zeros((ncol, nrow, linsteps//2 - 1))
+    triangle = np.asarray(triangle).reshape(ncol*nrow, nframes)
+    signal = np.asarray(signal).reshape(ncol*nrow, nframes)
+    nchan = ncol*nrow
+
+    # truncate each channel to a full number of periods, from its first minimum to its last
+    ismin = triangle == np.amin(triangle, axis=-1, keepdims=True)
+    first = np.argmax(ismin, axis=-1)
+    last = nframes - 1 - np.argmax(ismin[:, ::-1], axis=-1)
+    if np.any(first == last):
+        bad = np.nonzero(first == last)[0]
+        raise AssertionError("triangle has fewer than 2 minima, (col, row) {}".format(
+            [divmod(int(i), nrow) for i in bad]))
+    # sample only the last point from each dwell (to let PID settle)
+    nsampled = (last - lindwell + 1 - first - lindwell) // lindwell + 1
+    nperiods = nsampled // linsteps
+    assert np.all(nsampled % linsteps == 0) and np.all(nperiods > 0), "triangle is not a whole number of periods"
+
+    outsigsup = np.zeros((nchan, linsteps//2 - 1))
     outsigsdown = np.zeros_like(outsigsup)
-    outtriangles = np.zeros_like(outsigsup)
-    for col in range(ncol):
-        for row in range(nrow):
-            try:
-                triout, sigup, sigdown = conditionvphi(
-                    triangle[col, row, :], signal[col, row, :], tridwell, tristeps, tristepsize)
-            except Exception as ex:
-                raise type(ex)("{}, col {}, row {}".format(ex, col, row))
-            outsigsup[col, row, :] = sigup
-            outsigsdown[col, row, :] = sigdown
-            outtriangles[col, row, :] = triout
+    onetriangles = np.zeros_like(outsigsup)
+    good = np.ones(nchan, dtype="bool")
+    # the channels are normally in step, so this is one pass, but each number of periods gets its own
+    for n in np.unique(nperiods):
+        chans = np.nonzero(nperiods == n)[0]
+        inds = (chans*nframes + first[chans])[:, np.newaxis] + lindwell - 1 + lindwell*np.arange(n*linsteps)
+        sampledtriangle = triangle.reshape(-1)[inds].reshape(len(chans), n, linsteps)
+        sampledsignal = signal.reshape(-1)[inds].reshape(len(chans), n, linsteps)
+
+        # make sure the triangle is periodic, allowing one sample per period off by 1 unit (bit errors)
+        if np.any(sampledtriangle != sampledtriangle[:, :1, :]):
+            llog.error(
+                "biterrors detected, ignoring them for now. but you should recalibrate")
+            a = np.abs(sampledtriangle - sampledtriangle[:, :1, :])
+            good[chans] = np.all(np.sum(a >= 2, axis=-1) <= 1, axis=-1)
+        onetriangles[chans] = sampledtriangle[:, 0, 1:linsteps//2]
+
+        # average all the values at the same place in the triangle together
+        outsigsup[chans] = _median_over_periods(sampledsignal[:, :, 1:linsteps//2])
+        outsigsdown[chans] = _median_over_periods(sampledsignal[:, :, :linsteps//2:-1])
+
     # make sure all triangles are the same
-    for col in range(ncol):
-        for row in range(nrow):
-            assert all(outtriangles[col, row, :] == outtriangles[0, 0, :])
+    oneramp = onetriangles[np.argmax(good)]
+    good &= np.all(onetriangles == oneramp, axis=-1)
+    if not np.all(good):
+        bad = np.nonzero(~good)[0]
+        msg = "triangle appears imperfect, (col, row) {}".format([divmod(int(i), nrow) for i in bad])
+        if not return_quality:
+            np.save(get_savepath("last_failed_triangle"), triangle[bad[0]])
+            np.save(get_savepath("last_failed_signal"), signal[bad[0]])
+            raise Exception(msg)
+        llog.error(msg)
+    if np.any(good):
+        # make sure oneramp is monotonic increasing with even spacing
+        assert np.std(np.diff(oneramp)) < 1e-17
+        assert np.mean(np.diff(oneramp)) > 0
+
+    outsigsup = outsigsup.reshape(ncol, nrow, -1)
+    outsigsdown = outsigsdown.reshape(ncol, nrow, -1)
+    if return_quality:
+        return oneramp, outsigsup, outsigsdown, good.reshape(ncol, nrow)
+    return oneramp, outsigsup, outsigsdown
+
 
-    return outtriangles[0, 0, :], outsigsup, outsigsdown
+def _median_over_periods(x):
+    """np.median(x, axis=1), for the few periods in a capture an odd-even transposition sort of whole
+    (chan, sample) slices is several times faster than np.median's per-sample partition"""
+    n = x.shape[1]
+    if n > 16:
+        return np.median(x, axis=1)
+    s = np.moveaxis(x, 1, 0).astype("float64")
+    for p in range(n):
+        for i in range(p % 2, n - 1, 2):
+            lo = np.minimum(s[i], s[i + 1])
+            np.maximum(s[i], s[i + 1], out=s[i + 1])
+            s[i] = lo
+    if n % 2:
+        return s[n//2]
+    return (s[n//2 - 1] + s[n//2])/2
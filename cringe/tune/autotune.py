@@ -0,0 +1,592 @@
+"""the full tune without Qt, so it can run from a script, from cringe_control or on a worker thread
+
+mm is a MuxMaster (or anything with the same methods, eg one that forwards calls to the GUI thread) and
+easy_client is a connected nasa_client.EasyClient.
+
+    engine = AutoTuneEngine(mm, easy_client, TuneSettings(PercentFromBottom=20), progress=print_progress)
+    result = engine.fullTune()
+
+progress is called after each stage with the stage name, the seconds it took and the TuneResult so far, from
+whatever thread fullTune runs on. result.timings has the seconds for every stage. result.profiler has nested
+spans for acquisition, analysis and the MuxMaster calls of each stage, with counts of register writes and frames
+acquired, it is written to last_tune_profile.json and a timestamped tune_profile_*.json in the tune files.
+
+to touch up a few channels after a full tune, without disturbing the others
+
+    result = engine.retune(parse_channels("0:1,5;3"), result)  # col 0 rows 1 and 5, all of col 3
+"""
+import copy
+import os
+import pickle
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict, replace
+from typing import Any
+
+import numpy as np
+from . import analysis
+from . import vphistats
+from .vphicache import VphiCache
+from cringe import log
+from cringe.shared import get_savepath
+from cringe.shared.profiling import Profiler, span, count
+
+STAGES = ["fbb vphi", "locked fba vphi", "fbb2 vphi", "fba vphi", "calculate", "program rows", "send mix"]
+# crossings searches the data for level crossings, fft fits a periodic model and rates each vphi by its "quality"
+VPHI_ANALYZERS = {"crossings": vphistats.vPhiStats, "fft": vphistats.vPhiStatsFFT}
+
+
+def print_progress(stage, elapsed_s, result):
+    print(f"tune: {stage} took {elapsed_s:.2f} s")
+
+
+@dataclass
+class TuneSettings:
+    """the values from the vphi and tuning part of the tune tab"""
+    ISlopeProduct: int = -150
+    MixSlopeProduct: int = -400
+    PercentFromBottom: int = 18  # lockpoint % from bottom of vphi
+    minimumD2aAValue: int = 200
+    d2aBshift: int = 0
+    lockSlopeSign: bool = False  # lock FBA on the + slope
+    lockSlopeSignFBB: bool = False  # put the sq1 on the + slope of the SA
+    sendMix: bool = True
+    useVphiCache: bool = False  # reuse vphis of columns whose configuration hasn't changed
+    vphiCacheMaxAgeS: float = 600
+    vphiAnalyzer: str = "crossings"  # a key of VPHI_ANALYZERS
+    minVphiQuality: float = 0.9  # with the fft analyzer, leave channels with a worse vphi in any stage unlocked
+
+
+@dataclass
+class TuneResult:
+    """everything fullTune measured and chose, filled in stage by stage, arrays are (col, row) unless noted"""
+    settings: TuneSettings
+    fbbtriangle: Any = None  # (nsteps,)
+    fbbsigsup: Any = None  # (col, row, nsteps)
+    fbbstats: Any = None  # dict from vPhiStats
+    lfbatriangle: Any = None
+    lfbasigsup: Any = None
+    lfbastats: Any = None
+    fbb2triangle: Any = None
+    fbb2sigsup: Any = None
+    fbb2stats: Any = None
+    d2aBupwardSlope: Any = None
+    d2aBdownwardSlope: Any = None
+    fbatriangle: Any = None
+    fbasigsup: Any = None
+    fbastats: Any = None
+    d2aA: Any = None
+    d2aB: Any = None
+    a2d: Any = None
+    I: Any = None
+    Mix: Any = None
+    chanisgood: Any = None
+    sq1periods: Any = None  # (col,) median sq1 period
+    old_flux_jump_threshold: Any = None
+    flux_jump_threshold: Any = None
+    timings: dict = field(default_factory=dict)  # seconds per stage
+    profiler: Any = None
+
+    def badChannels(self):
+        """(col, row) of every channel the tune left unlocked, to pass to retune"""
+        return [(int(col), int(row)) for col, row in zip(*np.nonzero(~self.chanisgood))]
+
+
+class AutoTuneEngine:
+    def __init__(self, mm, easy_client, settings=None, progress=None):
+        self.mm = mm
+        self.ec = easy_client
+        self.settings = TuneSettings() if settings is None else settings
+        self.progress = progress
+        self.cache = VphiCache(max_age_s=self.settings.vphiCacheMaxAgeS) if self.settings.useVphiCache else None
+
+    @property
+    def ncol(self):
+        return self.ec.ncol
+
+    @property
+    def nrow(self):
+        return self.ec.nrow
+
+    def validateServerSettings(self):
+        """raise if nrow, nsamp or lsync differ between the server and cringe"""
+        if (self.ec.nrow, self.ec.num_of_samples, self.ec.lsync) != (self.mm.seqln, self.mm.NSAMP, self.mm.lsync):
+            raise Exception("NROW, NSAMP, LSYNC must match between cringe and server for tune.\n"
+                            "Server NROW {}, NSAMP {}, LSYNC {}.\nCringe NROW {}, NSAMP {}, LSYNC {}.".format(
+                                self.ec.nrow, self.ec.num_of_samples, self.ec.lsync,
+                                self.mm.seqln, self.mm.NSAMP, self.mm.lsync))
+
+    def getNewData(self, *args, **kwargs):
+        with span("getNewData"):
+            data = self.ec.getNewData(*args, **kwargs)
+            count("frames acquired", data.shape[2])
+        return data
+
+    def conditionvphis(self, triangle, signal, tridwell, tristeps, tristepsize):
+        """rather than failing the whole tune, a channel with an imperfect triangle gets flat ramps, so its stats
+        are all 0 and chooseLockpoints leaves it unlocked"""
+        with span("conditionvphis"):
+            oneramp, sigsup, sigsdown, good = analysis.conditionvphis(triangle, signal, tridwell, tristeps,
+                                                                      tristepsize, return_quality=True)
+            sigsup[~good] = 0
+            sigsdown[~good] = 0
+            if not np.all(good):
+                count("imperfect triangles", int(np.sum(~good)))
+            return oneramp, sigsup, sigsdown
+
+    def vPhiStats(self, triangle, signals, **kwargs):
+        with span("vPhiStats"):
+            return VPHI_ANALYZERS[self.settings.vphiAnalyzer](triangle, signals, **kwargs)
+
+    def FBAvphi(self):
+        tridwell, tristeps, tristepsize = 2, 9, 10
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        self.mm.setdfball(tria=1)
+        data = self.getNewData(0.1, minimumNumPoints=4096*6)
+        np.save(get_savepath("last_fba_vphi"), data)
+        return self.conditionvphis(data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
+
+    def FBBvphi(self):
+        tridwell, tristeps, tristepsize = 2, 9, 20
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        # Triangle feedback on FB[B], SendMode : FBB, ERR
+        self.mm.setdfball(trib=1, data_packet=1)
+        data = self.getNewData(0.1, minimumNumPoints=4096*6)
+        np.save(get_savepath("last_fbb_vphi"), data)
+        return self.conditionvphis(data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
+
+    def lockedFBAvphi(self, d2aB=8000, a2d=1200, I=10):
+        tridwell, tristeps, tristepsize = 2, 9, 20
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        self.mm.setdfball(tria=1, ARL=1, data_packet=2, FBB=1, I=I, d2aB=d2aB, a2d=a2d)
+        data = self.getNewData(0.1, minimumNumPoints=4096*6, sendMode=2)
+        np.save(get_savepath("last_locked_fba_vphi"), data)
+        return self.conditionvphis(data[:, :, :, 0], data[:, :, :, 1], tridwell, tristeps, tristepsize)
+
+    def lockedFBAvphi_colsettings(self, d2aB, a2d, I):
+        tridwell, tristeps, tristepsize = 2, 9, 15
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        for col in range(self.ncol):
+            self.mm.setdfballrow(col, tria=1, ARL=1, data_packet=2,
+                                 FBB=1, I=I[col], d2aB=d2aB[col], a2d=a2d[col])
+        data = self.getNewData(0.1, minimumNumPoints=4096*6, sendMode=2)
+        np.save(get_savepath("last_locked_fba_vphi"), data)
+        return self.conditionvphis(data[:, :, :, 0], data[:, :, :, 1], tridwell, tristeps, tristepsize)
+
+    def FBB2vphi(self, d2aA):
+        """fbb vphi with fba at d2aA for each (col, row)"""
+        for col in range(self.ncol):
+            for row in range(self.nrow):
+                self.mm.setdfbrow(col, row, trib=1, d2aA=d2aA[col, row], data_packet=1)
+        tridwell, tristeps, tristepsize = 2, 9, 20
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        data = self.getNewData(0.1, minimumNumPoints=4096*6)
+        np.save(get_savepath("last_fbb2_vphi"), data)
+        return self.conditionvphis(data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
+
+    def FBAvphi_at_d2aB(self, d2aB):
+        """fba vphi with the final d2aB for each (col, row)"""
+        tridwell, tristeps, tristepsize = 2, 8, 30
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        for col in range(self.ncol):
+            for row in range(self.nrow):
+                self.mm.setdfbrow(col, row, tria=1, d2aB=d2aB[col, row])
+        data = self.getNewData(0.1, minimumNumPoints=4096*6)
+        np.save(get_savepath("last_fba_vphi"), data)
+        return self.conditionvphis(data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
+
+    @contextmanager
+    def _stage(self, name, result):
+        t_start = time.time()
+        with span(name):
+            yield
+        elapsed_s = time.time() - t_start
+        result.timings[name] = elapsed_s
+        log.debug(f"tune stage {name} took {elapsed_s:.2f} s")
+        if self.progress is not None:
+            self.progress(name, elapsed_s, result)
+
+    def fullTune(self):
+        """fbb vphi, locked fba vphi, fbb vphi with fba at the sq1 minimum, then fba vphi with the chosen d2aB,
+        choose a2d, d2aA, d2aB, I and Mix for every row and program them. returns a TuneResult"""
+        result = TuneResult(settings=self.settings)
+        result.profiler = Profiler("full tune")
+        result.profiler.info.update(settings=asdict(self.settings), ncol=self.ncol, nrow=self.nrow,
+                                    nsamp=self.ec.num_of_samples, lsync=self.ec.lsync)
+        try:
+            with result.profiler.active():
+                self._fullTune(result)
+        finally:
+            self.writeProfile(result)
+        log.info("tune profile:\n" + result.profiler.summary(depth=1))
+        return result
+
+    def writeProfile(self, result):
+        """write the profile to last_tune_profile.json and tune_profile_<start time>.json, returns the 2nd path"""
+        result.profiler.write(get_savepath("last_tune_profile.json"))
+        stamp = result.profiler.started.replace("-", "").replace(":", "").replace("T", "_")
+        return result.profiler.write(get_savepath(f"tune_profile_{stamp}.json"))
+
+    def _fullTune(self, result):
+        s = self.settings
+        log.info("start fbb vphi")
+        self.validateServerSettings()
+        with self._stage("fbb vphi", result):
+            self.ec.setMixToZero()
+            result.fbbtriangle, result.fbbsigsup, result.fbbstats = self._cachedVphis(
+                "fbb vphi", lambda: self._withStats(self.FBBvphi()), self._fbbVphisOf,
+                [{"triangle": (2, 9, 20)}]*self.ncol)
+            fbbstats = result.fbbstats
+            # get settings for locked vphis from those vphis
+            a2dlockpoints = np.median(fbbstats['midPoint'], axis=1)
+            d2aB = np.ones(len(a2dlockpoints))*8000
+            # choose I for fbb such you get 10 for nsamp = 4, and 5 for nsamp =8
+            I = np.ones(len(a2dlockpoints))*int(round(10*4/float(self.mm.NSAMP)))
+            # set the ARL setting to 10 % more than a fbb vphi
+            result.old_flux_jump_threshold = self.mm.flux_jump_threshold
+            self.mm.setFluxJumpThreshold(np.median(fbbstats["periodXUnits"])*1.1)
+
+        log.info("start locked fba vphi")
+        with self._stage("locked fba vphi", result):
+            result.lfbatriangle, result.lfbasigsup, result.lfbastats = self._cachedVphis(
+                "locked fba vphi", lambda: self._withStats(self.lockedFBAvphi_colsettings(d2aB, a2dlockpoints, I)),
+                lambda sel: self._lfbaVphisOf(sel, a2dlockpoints, I),
+                [{"triangle": (2, 9, 15), "a2d": a2dlockpoints[col], "I": I[col], "d2aB": d2aB[col],
+                  "flux_jump_threshold": self.mm.flux_jump_threshold} for col in range(self.ncol)])
+            lfbastats = result.lfbastats
+
+        log.info("taking 2nd fbb vphi, fba set to first minimum from locked vphi")
+        with self._stage("fbb2 vphi", result):
+            d2aA = lfbastats["firstMinimumX"]
+            result.fbb2triangle, result.fbb2sigsup, result.fbb2stats = self._cachedVphis(
+                "fbb2 vphi", lambda: self._withStats(self.FBB2vphi(d2aA)),
+                lambda sel: self._fbb2VphisOf(sel, d2aA),
+                [{"triangle": (2, 9, 20), "d2aA": d2aA[col]} for col in range(self.ncol)])
+            self.chooseD2aB(result)
+
+        with self._stage("fba vphi", result):
+            # take fba vphis with correct d2aB values
+            fracFromBottom = s.PercentFromBottom*0.01
+            result.fbatriangle, result.fbasigsup, result.fbastats = self._cachedVphis(
+                "fba vphi", lambda: self._withStats(self.FBAvphi_at_d2aB(result.d2aB), fracFromBottom=fracFromBottom),
+                lambda sel: self._fbaVphisOf(sel, result.d2aB, fracFromBottom),
+                [{"triangle": (2, 8, 30), "d2aB": result.d2aB[col], "fracFromBottom": fracFromBottom}
+                 for col in range(self.ncol)])
+            fbastats = result.fbastats
+            with open("last_fbastats", "wb") as f:
+                pickle.dump(fbastats, f)
+
+        with self._stage("calculate", result):
+            self.chooseLockpoints(result)
+
+        with self._stage("program rows", result):
+            self.programRows(result)
+
+        with self._stage("send mix", result):
+            if s.sendMix:
+                log.info("sending mix values after full tune")
+                log.debug(result.Mix/100.0)
+                self.ec.setMix(result.Mix/100.0)
+
+    def channelSelection(self, channels):
+        """(cols, rows) index arrays for channels, a list of (col, row) pairs and/or ints for whole columns"""
+        selected = np.zeros((self.ncol, self.nrow), dtype="bool")
+        for channel in channels:
+            if np.ndim(channel) == 0:
+                selected[channel, :] = True
+            else:
+                col, row = channel
+                selected[col, row] = True
+        return np.nonzero(selected)
+
+    def _setSelectedRows(self, sel, **kwargs):
+        """setdfbrow for each (col, row) in sel, (col, row) array values are indexed per row, 1d per column"""
+        for col, row in zip(*sel):
+            self.mm.setdfbrow(col, row, **{k: v[col, row] if np.ndim(v) == 2 else v[col] if np.ndim(v) == 1 else v
+                                           for k, v in kwargs.items()})
+
+    def _selectedVphis(self, sel, triangle_index, tridwell, tristeps, tristepsize, sendMode=None, **statskwargs):
+        """take data, condition and analyze the vphis of just the channels in sel, as a single column.
+        returns the triangle, the sigsup of sel and a dict of stats for sel"""
+        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+        kwargs = {} if sendMode is None else {"sendMode": sendMode}
+        data = self.getNewData(0.1, minimumNumPoints=4096*6, **kwargs)[sel][np.newaxis]
+        triangle, sigsup, _ = self.conditionvphis(data[..., triangle_index], data[..., 1-triangle_index],
+                                                  tridwell, tristeps, tristepsize)
+        stats = self.vPhiStats(triangle, sigsup, **statskwargs)
+        return triangle, sigsup[0], {k: v[0] for k, v in stats.items()}
+
+    def _fbbVphisOf(self, sel):
+        self._setSelectedRows(sel, trib=1, data_packet=1)
+        return self._selectedVphis(sel, 1, 2, 9, 20)
+
+    def _lfbaVphisOf(self, sel, a2dlockpoints, I):
+        self._setSelectedRows(sel, tria=1, ARL=1, data_packet=2, FBB=1, I=I, d2aB=8000, a2d=a2dlockpoints)
+        return self._selectedVphis(sel, 0, 2, 9, 15, sendMode=2)
+
+    def _fbb2VphisOf(self, sel, d2aA):
+        self._setSelectedRows(sel, trib=1, d2aA=d2aA, data_packet=1)
+        return self._selectedVphis(sel, 1, 2, 9, 20)
+
+    def _fbaVphisOf(self, sel, d2aB, fracFromBottom):
+        self._setSelectedRows(sel, tria=1, d2aB=d2aB)
+        return self._selectedVphis(sel, 1, 2, 8, 30, fracFromBottom=fracFromBottom)
+
+    def _withStats(self, vphis, **statskwargs):
+        triangle, sigsup, _ = vphis
+        return triangle, sigsup, self.vPhiStats(triangle, sigsup, **statskwargs)
+
+    def _cachedVphis(self, stage, full, subset, inputs):
+        """(triangle, sigsup, stats) of every channel for a stage of the full tune, from full() without a cache.
+        with one, the columns with a fresh entry for the same configuration and inputs[col] are loaded and only
+        the others are measured, with subset(sel). the measured columns are saved to the cache"""
+        if self.cache is None:
+            return full()
+        config = self.mm.tuneConfiguration()
+        fingerprints = [self.cache.fingerprint(config, stage, col, dict(inputs[col], analyzer=self.settings.vphiAnalyzer))
+                        for col in range(self.ncol)]
+        cached = [self.cache.load(stage, col, fingerprint) for col, fingerprint in enumerate(fingerprints)]
+        missing = [col for col in range(self.ncol) if cached[col] is None]
+        count("cached columns", self.ncol-len(missing))
+        if len(missing) == self.ncol:
+            triangle, sigsup, stats = full()
+        else:
+            triangle, onesigsup, onestats = next(c for c in cached if c is not None)
+            sigsup = np.zeros((self.ncol, self.nrow, len(triangle)), dtype=onesigsup.dtype)
+            stats = {k: np.zeros((self.ncol, self.nrow), dtype=v.dtype) for k, v in onestats.items()}
+            for col, c in enumerate(cached):
+                if c is not None:
+                    sigsup[col] = c[1]
+                    for k in stats:
+                        stats[k][col] = c[2][k]
+            if len(missing) > 0:
+                sel = self.channelSelection(missing)
+                newtriangle, sigsup[sel], newstats = subset(sel)
+                if not np.array_equal(newtriangle, triangle):
+                    raise Exception(f"{stage} triangle differs from the cached one, clear the vphi cache")
+                for k in stats:
+                    stats[k][sel] = newstats[k]
+        for col in missing:
+            self.cache.save(stage, col, fingerprints[col], triangle, sigsup[col],
+                            {k: v[col] for k, v in stats.items()})
+        log.info(f"{stage}: {self.ncol-len(missing)} of {self.ncol} columns from the vphi cache")
+        return triangle, sigsup, stats
+
+    def _mergeVphis(self, result, name, sel, triangle, sigsup, stats):
+        """put the vphis of sel into result's <name>triangle, <name>sigsup and <name>stats"""
+        old = getattr(result, name+"triangle")
+        if len(old) != len(triangle) or not np.all(old == triangle):
+            raise Exception(f"{name} triangle differs from the previous tune, do a full tune")
+        getattr(result, name+"sigsup")[sel] = sigsup
+        for k, v in getattr(result, name+"stats").items():
+            v[sel] = stats[k]
+
+    def retune(self, channels, previous):
+        """tune only channels, a list of (col, row) pairs and/or whole columns, leaving every other row as it is.
+        previous is the TuneResult of the last full tune or retune, its vphis stand in for the other channels.
+        only the selected rows get triangles and are programmed, the mix of the others is kept.
+        returns a new TuneResult with the selected channels updated"""
+        self.validateServerSettings()
+        sel = self.channelSelection(channels)
+        if previous.fbastats is None or previous.fbbsigsup.shape[:2] != (self.ncol, self.nrow):
+            raise Exception("retune needs a previous full tune of this crate")
+        result = copy.deepcopy(replace(previous, settings=self.settings, timings={}, profiler=None))
+        result.profiler = Profiler("retune")
+        result.profiler.info.update(settings=asdict(self.settings), ncol=self.ncol, nrow=self.nrow,
+                                    channels=[[int(col), int(row)] for col, row in zip(*sel)])
+        log.info(f"retune {len(sel[0])} channels")
+        try:
+            with result.profiler.active():
+                self._retune(result, sel)
+        finally:
+            self.writeProfile(result)
+        log.info("tune profile:\n" + result.profiler.summary(depth=1))
+        return result
+
+    def _retune(self, result, sel):
+        s = self.settings
+        with self._stage("fbb vphi", result):
+            mix = result.Mix.copy()
+            mix[sel] = 0
+            self.ec.setMix(mix/100.0)
+            self._mergeVphis(result, "fbb", sel, *self._fbbVphisOf(sel))
+            a2dlockpoints = np.median(result.fbbstats['midPoint'], axis=1)
+            I = np.ones(len(a2dlockpoints))*int(round(10*4/float(self.mm.NSAMP)))
+            result.old_flux_jump_threshold = self.mm.flux_jump_threshold
+            self.mm.setFluxJumpThreshold(np.median(result.fbbstats["periodXUnits"])*1.1)
+
+        with self._stage("locked fba vphi", result):
+            self._mergeVphis(result, "lfba", sel, *self._lfbaVphisOf(sel, a2dlockpoints, I))
+
+        with self._stage("fbb2 vphi", result):
+            self._mergeVphis(result, "fbb2", sel, *self._fbb2VphisOf(sel, result.lfbastats["firstMinimumX"]))
+            self.chooseD2aB(result, sel)
+
+        with self._stage("fba vphi", result):
+            self._mergeVphis(result, "fba", sel, *self._fbaVphisOf(sel, result.d2aB, s.PercentFromBottom*0.01))
+            with open("last_fbastats", "wb") as f:
+                pickle.dump(result.fbastats, f)
+
+        with self._stage("calculate", result):
+            self.chooseLockpoints(result, sel)
+
+        with self._stage("program rows", result):
+            self.programRows(result, sel)
+
+        with self._stage("send mix", result):
+            if s.sendMix:
+                log.info("sending mix values after retune")
+                self.ec.setMix(result.Mix/100.0)
+
+    def chooseD2aB(self, result, sel=None):
+        """place the sq1 curve on the SA curve from the locked fba and 2nd fbb vphis, only for the (cols, rows)
+        in sel if given"""
+        s = self.settings
+        fbbstats, lfbastats, fbb2stats = result.fbbstats, result.lfbastats, result.fbb2stats
+        # here we choose where the sq1 curve lies on the SA curve
+        # the right side of the sq1 curve is at d2aB
+        # Xup is the size of the upward slope in FBB units
+        Xup = fbb2stats["firstMaximumX"] - fbb2stats["firstMinimumX"]
+        Xup[Xup < 0] += fbb2stats["periodXUnits"][Xup < 0]
+        # Xdown is the size of the downward slope in FBB units
+        Xdown = fbb2stats["firstMinimumX"] - fbb2stats["firstMaximumX"]
+        Xdown[Xdown < 0] += fbb2stats["periodXUnits"][Xdown < 0]
+        # d2aBupwardSlpe is the d2aB value that places the Sq1 approximatley midpoint on the upward slope
+        # d2aBshift is a user settable parameter to shift the position of the Sq1 on the SA
+        result.d2aBupwardSlope = fbb2stats["firstMinimumX"] + \
+            lfbastats["modDepth"]+(Xup-lfbastats["modDepth"])/2.0+s.d2aBshift
+        result.d2aBdownwardSlope = fbb2stats["firstMaximumX"] + \
+            lfbastats["modDepth"]+(Xdown-lfbastats["modDepth"])/2.0+s.d2aBshift
+        d2aB = (result.d2aBupwardSlope if s.lockSlopeSignFBB else result.d2aBdownwardSlope).copy()
+        # d2aB must be positive, so add enough periods to make it positive
+        period = fbb2stats["periodXUnits"]
+        negative = (period > 0) & (d2aB < 0)
+        d2aB[negative] += np.ceil(-d2aB[negative]/period[negative])*period[negative]
+        _assign(result, "d2aB", d2aB, sel)
+
+        np.save(get_savepath("last_fbb2_firstMinimumX"), fbb2stats["firstMinimumX"])
+        np.save(get_savepath("last_lfba_modDepth"), lfbastats["modDepth"])
+        np.save(get_savepath("last_lfba_firstMinimumY"), lfbastats["firstMinimumY"])
+        np.save(get_savepath("last_fbb2_periodXUnits"), fbbstats["periodXUnits"])
+
+    def chooseLockpoints(self, result, sel=None):
+        """pick d2aA, a2d, I and Mix from the final fba vphis, only for the (cols, rows) in sel if given, and write
+        the mix files"""
+        s = self.settings
+        fbastats = result.fbastats
+        if s.lockSlopeSign:
+            d2aA = fbastats["positiveCrossingFirstX"].copy()
+            slope = fbastats["positiveCrossingSlope"]
+        else:
+            d2aA = fbastats["negativeCrossingFirstX"].copy()
+            slope = fbastats["negativeCrossingSlope"]
+
+        minimum_d2aA = s.minimumD2aAValue
+        log.debug(("using {} as minimum_d2aA".format(minimum_d2aA)))
+        period = fbastats["periodXUnits"]
+        low = (d2aA <= minimum_d2aA) & (period > 0)
+        nPeriodToAdd = np.zeros(d2aA.shape)
+        nPeriodToAdd[low] = np.ceil((minimum_d2aA-d2aA[low])/period[low])
+        d2aA += nPeriodToAdd*period
+        for col, row in zip(*np.nonzero(low)):
+            log.debug(("col %g, row %g FBA lockpoint shift up %g phi because it was below %g" % (
+                col, row, nPeriodToAdd[col, row], minimum_d2aA)))
+        _assign(result, "d2aA", d2aA, sel)
+        _assign(result, "a2d", fbastats["crossingPoint"].copy(), sel)
+
+        I = np.array(np.round(s.ISlopeProduct/slope), dtype="int64")
+        chanisgood = np.ones(I.shape, dtype="bool")
+        chanisgood[I > 511] = False
+        chanisgood[I < -511] = False
+        chanisgood[period < 200] = False
+        # no period in an earlier stage means its vphi, eg from an imperfect triangle, gave nothing to lock with
+        for stats in [result.fbbstats, result.lfbastats, result.fbb2stats]:
+            chanisgood[stats["periodXUnits"] == 0] = False
+        for stats in [result.fbbstats, result.lfbastats, result.fbb2stats, fbastats]:
+            if "quality" in stats:
+                chanisgood[stats["quality"] < s.minVphiQuality] = False
+        _assign(result, "I", I, sel)
+        _assign(result, "chanisgood", chanisgood, sel)
+        result.sq1periods = np.median(period, axis=1)
+        _assign(result, "Mix", chanisgood*s.MixSlopeProduct/slope, sel)
+        Mix = result.Mix
+
+        np.save(get_savepath("last_mix_values"), Mix/100.0)
+        matter_mix_dir = os.path.expanduser("~/nasa_daq/matter/")
+        matter_mix_file = os.path.join(matter_mix_dir, "autotune_mix.mixing")
+        try:
+            writeMixFile(matter_mix_file, Mix/100.0)
+        except FileNotFoundError as ex:
+            print(f"not writing f{matter_mix_file}, probably because f{matter_mix_dir} doesn't exist.\
+            This is fine unless you need to load the mix file from matter.")
+        # cringe should have created this directory earlier
+        np.save(os.path.expanduser("~/.cringe/mix_fractions"), Mix/100.0)
+        Mix[np.isnan(Mix)] = 0  # don't send NaN, its invalid for mix
+        result.Mix = Mix
+
+    def programRows(self, result, sel=None):
+        """send the chosen settings to every row, or the (cols, rows) in sel, and set the ARL threshold from the
+        sq1 periods"""
+        minimum_d2aA = self.settings.minimumD2aAValue
+        sq1periods = result.sq1periods
+        if sel is None:
+            sel = np.nonzero(np.ones((self.ncol, self.nrow), dtype="bool"))
+        for col, row in zip(*sel):
+            if result.chanisgood[col, row]:
+                self.mm.setdfbrow(col, row, a2d=result.a2d[col, row], I=result.I[col, row],
+                                  d2aA=result.d2aA[col, row], d2aB=result.d2aB[col, row], FBA=1, ARL=1)
+            else:
+                # set D2A values for bad channels to the midpoint of the intended distribution of other D2A values
+                # the minimum value is minimum_d2aA, all D2A values should be with sq1periods[col] of the minimum
+                # this should reduce the maximum difference in D2A between two different rows
+                # having large D2A changes between rows causes crosstalk
+                self.mm.setdfbrow(
+                    col, row, a2d=0, I=0, d2aA=minimum_d2aA+0.5*sq1periods[col], d2aB=0, FBA=0, ARL=0)
+
+        sq1periodsstrs = ["col %g %g" % (i, int(round(sq1periods[i]))) for i in range(len(sq1periods))]
+        log.info(("median sq1 periods by column (arbs):\n " + "\n".join(sq1periodsstrs)))
+        log.info(("median of all columns: %g arbs" % np.median(sq1periods)))
+        goodfluxjumpthreshold = int(np.median(sq1periods)*0.8)
+        log.info(("typically the ARL FluxJumpThreshold should be around 0.8 the sq1 period, so %g could be good" %
+                  goodfluxjumpthreshold))
+        log.info(("This value was set for you, your previous value was %g" % result.old_flux_jump_threshold))
+        self.mm.setFluxJumpThreshold(goodfluxjumpthreshold)
+        result.flux_jump_threshold = goodfluxjumpthreshold
+
+
+def parse_channels(text):
+    """channels for retune from text like 0:1,5;3, that is col 0 rows 1 and 5 and all of col 3"""
+    channels = []
+    for col_and_rows in text.split(";"):
+        if ":" in col_and_rows:
+            col, rows = col_and_rows.split(":")
+            channels += [(int(col), int(row)) for row in rows.split(",")]
+        elif col_and_rows.strip():
+            channels.append(int(col_and_rows))
+    return channels
+
+
+def _assign(result, name, value, sel):
+    """set result.name to value, or only its (cols, rows) in sel"""
+    if sel is None:
+        setattr(result, name, value)
+    else:
+        getattr(result, name)[sel] = value[sel]
+
+
+def writeMixFile(fname, mix):
+    log.info(('writing mix to %s' % fname))
+    ncol, nrow = mix.shape
+    f = open(fname, 'w')
+    for col in range(ncol):
+        for row in range(nrow):
+            errorChan = col*2*nrow+row*2
+            fbChan = errorChan+1
+            f.write('CH%d_decimateAvgFlag: 1\nCH%d_decimateFlag: 0\nCH%d_mixFlag: 1\nCH%d_mixInversionFlag: 0\n' % (
+                errorChan, errorChan, errorChan, errorChan))
+            f.write('CH%d_decimateAvgFlag: 1\n' % fbChan)
+            f.write('CH%d_decimateFlag: 0\n' % fbChan)
+            f.write('CH%d_mixFlag: %d\n' % (fbChan, 1))  # 0 disables mix
+            f.write('CH%d_mixInversionFlag: 0\n' % fbChan)
+            f.write('CH%d_mixLevel: %f\n' % (fbChan, mix[col, row]))
+    f.close()
@@ -1,5 +1,6 @@
 import numpy as np
 from cringe import log
+from cringe.shared.profiling import profiled
 
 class MuxMaster():
     def __init__(self,cringe):
@@ -93,6 +94,20 @@ class MuxMaster():
                 baddacHighs.append(chn.d2a_hi_slider.value())
         return baddacHighs
 
+    def getTowerDacs(self):
+        if self.cringe.tower_widget is None:
+            return {}
+        return {name: [tchn.dacspin.value() for tchn in tc.towerchannels]
+                for name, tc in self.cringe.tower_widget.towercards.items()}
+
+    def tuneConfiguration(self):
+        "everything besides the dfb row settings that changes a vphi, for the vphi cache"
+        return {"seqln": self.seqln, "lsync": self.lsync, "NSAMP": self.NSAMP, "SETT": self.SETT,
+                "prop_delay": self.prop_delay, "dfb_delay": self.dfb_delay, "bad_delay": self.bad_delay,
+                "baddacHighs": [chn.d2a_hi_slider.value() for badrap in self.badraps for chn in badrap.chn_vectors],
+                "towerDacs": self.getTowerDacs(),
+                "columns": [dfbrap.chID for dfbrap in self.dfbraps]}
+
     def setbaddacHighsSame(self, val):
         for badrap in self.badraps:
             for chn in badrap.chn_vectors:
@@ -110,6 +125,7 @@ class MuxMaster():
                 log.debug("muxmaster:checked",checked)
         return roworder
 
+    @profiled()
     def changedfbrow(self,col=None,row=None,tria=None,trib=None,a2d=None,d2aA=None,d2aB=None,P=None,I=None,FBA=None,FBB=None,ARL=None,data_packet=None,dynamic=None):
         """
         setdfbrow(self,col=0,row=0,tria=0,trib=0,a2d=0,d2aA=0,d2aB=0,P=0,I=0,FBA=0,FBB=0,ARL=0,data_packet=0,dynamic=1)
@@ -158,6 +174,7 @@ class MuxMaster():
                 chn.FBA_button.setChecked(lock)
 
 
+    @profiled()
     def setdfbrow(self,col=0,row=0,tria=0,trib=0,a2d=0,d2aA=0,d2aB=0,P=0,I=0,FBA=0,FBB=0,ARL=0,data_packet=0,dynamic=1):
         """
         setdfbrow(self,col=0,row=0,tria=0,trib=0,a2d=0,d2aA=0,d2aB=0,P=0,I=0,FBA=0,FBB=0,ARL=0,data_packet=0,dynamic=1)
@@ -183,12 +200,14 @@ class MuxMaster():
         chn.FBA_button.setChecked(FBA)
         chn.FBB_button.setChecked(FBB)
 
+    @profiled()
     def setdfballrow(self,col=0,tria=0,trib=0,a2d=0,d2aA=0,d2aB=0,P=0,I=0,FBA=0,FBB=0,ARL=0,data_packet=0,dynamic=1):
         #rows = range(len(self.dfbraps[col].state_vectors))+["master"]
         rows = list(range(self.seqln))
         for row in rows:
             self.setdfbrow(col,row,tria,trib,a2d,d2aA,d2aB,P,I,FBA,FBB,ARL,data_packet,dynamic)
 
+    @profiled()
     def setdfball(self,tria=0,trib=0,a2d=0,d2aA=0,d2aB=0,P=0,I=0,FBA=0,FBB=0,ARL=0,data_packet=0,dynamic=1):
         for col in range(len(self.dfbraps)):
             self.setdfballrow(col,tria,trib,a2d,d2aA,d2aB,P,I,FBA,FBB,ARL,data_packet,dynamic)
@@ -201,6 +220,7 @@ class MuxMaster():
             chn = dfbrap.state_vectors[row]
         chn.d2a_A_spin.setValue(d2aA)
 
+    @profiled()
     def settriangleparams(self,dwell=0,steps=10,stepsize=8,timebase=1):
         # timebase = 0 gives lsync, timebase = 1 gives frame
         # frame is wanted for all tuning,it makes all rows have same values in triangle
@@ -233,6 +253,7 @@ class MuxMaster():
             self.cringe.SETT_spin.setValue(sett)
             self.cringe.change_SETT()
 
+    @profiled()
     def setFluxJumpThreshold(self,flux_jump_threshold):
         flux_jump_threshold= int(flux_jump_threshold)
         if flux_jump_threshold != self.flux_jump_threshold:
@@ -0,0 +1,86 @@
+"""noise spectra of every channel from repeated getNewData blocks
+
+    noise = measure_noise(client.getNewData, client.sample_rate, num_points=2**14, navgs=40)
+    noise.band_level(15000, 40000)  # (col, row) arbs/sqrt(hz)
+
+each block is (col, row, frame), each segment of it is transformed with one np.fft.rfft call along the frame
+axis for all channels, and the welch average of |fft|^2 is accumulated as blocks arrive, so blocks are not kept.
+measure_noise acquires block k+1 on a worker thread while block k is transformed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.signal
+
+
+@dataclass
+class NoiseSpectrum:
+    freqs: np.ndarray  # hz
+    asd: np.ndarray  # (col, row, freq) one sided amplitude spectral density, arbs/sqrt(hz)
+    nsegments: int  # number of segments averaged
+
+    def band_level(self, flo, fhi):
+        """(col, row) median of the asd from flo to fhi, the white noise level when the band is flat"""
+        ilo, ihi = np.searchsorted(self.freqs, [flo, fhi])
+        return np.median(self.asd[..., ilo:ihi], axis=-1)
+
+
+class WelchAccumulator:
+    """running welch average, add (col, row, frame) blocks then take spectrum()
+
+    segments of nperseg frames overlapping by overlap of a segment are taken within each block, never across
+    blocks since consecutive blocks from getNewData are not contiguous. each segment has its mean removed and
+    is windowed, scaled like scipy.signal.welch with scaling="density"
+    """
+
+    def __init__(self, nperseg, sample_rate, window="hann", overlap=0.5):
+        self.nperseg = nperseg
+        self.sample_rate = float(sample_rate)
+        self.window = scipy.signal.get_window(window, nperseg)
+        self.step = max(1, int(round(nperseg*(1-overlap))))
+        self.freqs = np.fft.rfftfreq(nperseg, 1/self.sample_rate)
+        self.power = None
+        self.nsegments = 0
+
+    def add(self, block):
+        block = np.asarray(block)
+        nframes = block.shape[-1]
+        if nframes < self.nperseg:
+            raise ValueError(f"block has {nframes} frames, need at least nperseg={self.nperseg}")
+        if self.power is None:
+            self.power = np.zeros(block.shape[:-1]+self.freqs.shape)
+        for start in range(0, nframes-self.nperseg+1, self.step):
+            segment = block[..., start:start+self.nperseg].astype("float64")
+            segment -= segment.mean(axis=-1, keepdims=True)
+            segment *= self.window
+            spec = np.fft.rfft(segment, axis=-1)
+            self.power += spec.real**2+spec.imag**2
+            self.nsegments += 1
+
+    def spectrum(self):
+        psd = self.power/(self.nsegments*self.sample_rate*np.sum(self.window**2))
+        # one sided, dc and nyquist are not doubled
+        psd[..., 1:] *= 2
+        if self.nperseg % 2 == 0:
+            psd[..., -1] /= 2
+        return NoiseSpectrum(self.freqs, np.sqrt(psd), self.nsegments)
+
+
+def measure_noise(getNewData, sample_rate, num_points=2**14, navgs=40, data_index=1, nperseg=None,
+                  window="hann", overlap=0.5):
+    """welch spectrum of navgs blocks of num_points frames of data[..., data_index] (1 is the feedback),
+    by default one segment per block"""
+    welch = WelchAccumulator(num_points if nperseg is None else nperseg, sample_rate, window, overlap)
+
+    def acquire():
+        return getNewData(0.001, minimumNumPoints=num_points, exactNumPoints=True)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(acquire)
+        for i in range(navgs):
+            data = pending.result()
+            if i+1 < navgs:
+                pending = pool.submit(acquire)
+            welch.add(data[..., data_index])
+    return welch.spectrum()
@@ -0,0 +1,197 @@
+"""plots of every row in every column, one axes per column and one collection per axes for all its rows
+
+    cols = ColFigure.offscreen(ncol, nrow)
+    cols.plot(triangle, sigsup)  # sigsup is (col, row, point)
+    PngWriter(get_savepath("tune_plots")).save(cols.figure, "fbb vphi")
+
+ColFigure draws on any matplotlib Figure, the ColPlots dialog in tunetab puts one in a qt canvas. plotting again
+replaces the traces by updating the collections (set_segments, set_offsets) rather than adding artists, so live
+plots like the bit error test don't pile up lines. PngWriter saves figures with agg on a worker thread, for
+unattended tunes.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.figure import Figure
+from cringe import log
+
+PLOT_MODES = ["show plots", "no plots", "save pngs"]
+
+
+def cycle_colors():
+    """(ncolor, 4) rgba of the color cycle, row r gets color r % ncolor like separate lines would"""
+    return to_rgba_array(matplotlib.rcParams["axes.prop_cycle"].by_key()["color"])
+
+
+class ColFigure:
+    def __init__(self, figure, ncol, nrow):
+        self.figure = figure
+        self.ncol = ncol
+        self.nrow = nrow
+        self.numXSubplots, self.numYSubplots = self.layout(ncol)
+        self.axes = [figure.add_subplot(self.numYSubplots, self.numXSubplots, col+1) for col in range(ncol)]
+        self.cycle = cycle_colors()
+        self.colors = self.cycle[np.arange(nrow) % len(self.cycle)]
+        self.lines = [None]*ncol
+        self.points = [None]*ncol
+        self.npoints = [0]*ncol
+        self.plottitle()
+
+    @staticmethod
+    def layout(ncol):
+        return int((ncol+1)/2.0), 1+int(ncol > 1)
+
+    @classmethod
+    def offscreen(cls, ncol, nrow):
+        numXSubplots, numYSubplots = cls.layout(ncol)
+        return cls(Figure(figsize=(numXSubplots*6, numYSubplots*4)), ncol, nrow)
+
+    def plot(self, x, y):
+        self.drawrows(x, y, lines=True, points=True)
+
+    def plotbigx(self, x, y):
+        self.drawrows(x, y, lines=True)
+
+    def semilogy(self, x, y):
+        self.drawrows(x, y, points=True, yscale="log")
+
+    def semilogx(self, x, y):
+        self.drawrows(x, y, lines=True, xscale="log")
+
+    def plotdiffx(self, x, y):
+        self.drawrows(x, y, points=True)
+
+    def drawrows(self, x, y, lines=False, points=False, xscale="linear", yscale="linear"):
+        """y is (col, row, point), x is (point,), (col, point) or (col, row, point)"""
+        y = np.asarray(y, dtype="float64")[:self.ncol, :self.nrow]
+        x = np.asarray(x, dtype="float64")
+        if x.ndim == 2:
+            x = x[:self.ncol, np.newaxis, :]
+        elif x.ndim == 3:
+            x = x[:self.ncol, :self.nrow]
+        xy = np.stack(np.broadcast_arrays(x, y), axis=-1)
+        # nan points are left out, so log axes don't try to place values <= 0
+        if xscale == "log":
+            xy[xy[..., 0] <= 0] = np.nan
+        if yscale == "log":
+            xy[xy[..., 1] <= 0] = np.nan
+        for col in range(self.ncol):
+            ax = self.axes[col]
+            ax.set_xscale(xscale)
+            ax.set_yscale(yscale)
+            segments = xy[col]
+            self.npoints[col] = segments.shape[1]
+            self.lines[col] = self._lines(col, segments if lines else None)
+            self.points[col] = self._points(col, segments if points else None)
+            finite = segments[np.all(np.isfinite(segments), axis=-1)]
+            ax.ignore_existing_data_limits = True
+            if len(finite) > 0:
+                ax.update_datalim(finite)
+            ax.autoscale_view()
+
+    def _lines(self, col, segments):
+        artist = self.lines[col]
+        if segments is None:
+            if artist is not None:
+                artist.remove()
+            return None
+        if artist is None:
+            artist = LineCollection(segments, colors=self.colors[:len(segments)], picker=5, label=f"col {col}")
+            return self.axes[col].add_collection(artist, autolim=False)
+        artist.set_segments(segments)
+        artist.set_color(self.colors[:len(segments)])
+        return artist
+
+    def _points(self, col, segments):
+        """one marker only Line2D per color holding every row with that color, agg draws markers much faster than
+        a scatter collection"""
+        artists = self.points[col]
+        groups = [] if segments is None else [segments[c::len(self.cycle)].reshape(-1, 2)
+                                              for c in range(min(len(segments), len(self.cycle)))]
+        if artists is not None and len(artists) != len(groups):
+            for artist in artists:
+                artist.remove()
+            artists = None
+        if len(groups) == 0:
+            return None
+        if artists is None:
+            return [self.axes[col].plot(xy[:, 0], xy[:, 1], ".", color=self.cycle[c], picker=5,
+                                        label=f"col {col}")[0] for c, xy in enumerate(groups)]
+        for artist, xy in zip(artists, groups):
+            artist.set_data(xy[:, 0], xy[:, 1])
+        return artists
+
+    def picked(self, event):
+        """'col c, row r' for a pick event on one of the collections, None for other artists"""
+        for col in range(self.ncol):
+            if event.artist is self.lines[col]:
+                rows = event.ind
+            elif self.points[col] is not None and event.artist in self.points[col]:
+                c = self.points[col].index(event.artist)
+                rows = c+len(self.cycle)*(np.asarray(event.ind)//self.npoints[col])
+            else:
+                continue
+            return ", ".join("col %g, row%g" % (col, row) for row in sorted(set(rows)))
+        return None
+
+    def title(self, s=""):
+        self.figure.suptitle(s)
+
+    def xlabel(self, s):
+        for col in range(self.ncol):
+            if col >= self.numXSubplots*(self.numYSubplots-1):
+                self.axes[col].set_xlabel(s)
+
+    def ylabel(self, s):
+        for col in range(self.ncol):
+            if col % self.numXSubplots == 0:
+                self.axes[col].set_ylabel(s)
+
+    def plottitle(self, s=[""]*32):
+        for col in range(self.ncol):
+            self.axes[col].set_title(("col %g" % col)+s[col])
+
+    def xlim(self, xlims):
+        for ax in self.axes:
+            ax.set_xlim(xlims)
+
+    def ylim(self, ylims):
+        for ax in self.axes:
+            ax.set_ylim(ylims)
+
+    def grid(self, x=True):
+        for ax in self.axes:
+            ax.grid(x)
+
+    def cla(self):
+        for ax in self.axes:
+            ax.clear()
+        self.lines = [None]*self.ncol
+        self.points = [None]*self.ncol
+
+
+class PngWriter:
+    """save figures as pngs in directory on a worker thread, so a tune doesn't wait on rendering.
+    don't change a figure after passing it to save"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+
+    def save(self, figure, name):
+        path = os.path.join(self.directory, name.replace(" ", "_")+".png")
+        self.pending.append(self.pool.submit(figure.savefig, path))
+        return path
+
+    def wait(self):
+        """block until every png is written, raises the first error from saving"""
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+        log.info(f"saved {len(pending)} plots in {self.directory}")
@@ -0,0 +1,99 @@
+"""parameter sweeps: set a value, take data, reduce it, for each value
+
+    sweep = SweepEngine("SETT", mm.setSETT, SETTs, client.getNewData, errfbStats,
+                        acquisition=dict(delaySeconds=0.01, minimumNumPoints=10000, divideNsamp=False),
+                        checkpoint=get_savepath("last_sett_sweep.npz"))
+    result = sweep.run()
+    result["errstd"]  # (col, row, value)
+
+the setter and getNewData run on the calling thread, since setters usually change widgets. reduce runs on a
+worker thread, so step k is reduced while the value for step k+1 is set and settles. the settle is settleS of
+sleep after the setter, then with discardData one acquisition that is thrown away (it flushes commands still
+queued after a big change, like bias steps), then the getNewData delay.
+stopWhen(reduced) is checked as each step's reduction finishes; by then the next step has been taken, and it is
+dropped. with a checkpoint path the values and reductions so far are written after every step, so an
+interrupted sweep keeps what it measured, read it back with SweepResult.load.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+from cringe import log
+
+
+@dataclass
+class SweepResult:
+    name: str
+    values: np.ndarray  # the values reduced, fewer than asked for if stopped early
+    reduced: dict = field(default_factory=dict)  # name: (..., value), each reduction stacked on the last axis
+    stopped: bool = False
+
+    def __getitem__(self, key):
+        return self.reduced[key]
+
+    def save(self, path):
+        np.savez(path, name=self.name, values=self.values, stopped=self.stopped,
+                 **{"reduced_"+k: v for k, v in self.reduced.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            reduced = {k[len("reduced_"):]: f[k] for k in f.files if k.startswith("reduced_")}
+            return cls(str(f["name"]), f["values"], reduced, bool(f["stopped"]))
+
+
+class SweepEngine:
+    def __init__(self, name, setter, values, getNewData, reduce, acquisition=None, stopWhen=None,
+                 checkpoint=None, settleS=0, discardData=False):
+        """setter(value) sets the parameter, getNewData(**acquisition) takes the data, reduce(data) returns a
+        dict of arrays for that step"""
+        self.name = name
+        self.setter = setter
+        self.values = np.asarray(values)
+        self.getNewData = getNewData
+        self.reduce = reduce
+        self.acquisition = {} if acquisition is None else acquisition
+        self.stopWhen = stopWhen
+        self.checkpoint = checkpoint
+        self.settleS = settleS
+        self.discardData = discardData
+
+    def run(self):
+        result = SweepResult(self.name, self.values[:0])
+        steps = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = None
+            for value in self.values:
+                log.info(f"sweep {self.name} = {value:g}")
+                self.setter(value)
+                time.sleep(self.settleS)
+                if self.discardData:
+                    self.getNewData(**self.acquisition)
+                data = self.getNewData(**self.acquisition)
+                if pending is not None and self._finish(result, steps, *pending):
+                    break
+                pending = (value, pool.submit(self.reduce, data))
+            else:
+                if pending is not None:
+                    self._finish(result, steps, *pending)
+        return result
+
+    def _finish(self, result, steps, value, future):
+        """add a reduced step to result, True if the sweep should stop"""
+        reduced = future.result()
+        steps.append(reduced)
+        result.values = self.values[:len(steps)]
+        result.reduced = {k: np.stack([np.asarray(step[k]) for step in steps], axis=-1) for k in reduced}
+        result.stopped = self.stopWhen is not None and bool(self.stopWhen(reduced))
+        if self.checkpoint is not None:
+            result.save(self.checkpoint)
+        if result.stopped:
+            log.info(f"sweep {self.name} stopped at {value:g}")
+        return result.stopped
+
+
+def errfbStats(data):
+    """median and std dev over frames of the error and feedback, each (col, row)"""
+    return {"err": np.median(data[:, :, :, 0], axis=2), "errstd": np.std(data[:, :, :, 0], axis=2),
+            "fb": np.median(data[:, :, :, 1], axis=2), "fbstd": np.std(data[:, :, :, 1], axis=2)}
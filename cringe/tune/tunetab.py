@@ -15,12 +15,17 @@ from PyQt5.QtWidgets import *
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
 from .tuneclient import TuneClient
 from .muxmaster import MuxMaster
 from . import analysis
 from . import vphistats
+from .autotune import AutoTuneEngine, TuneSettings, VPHI_ANALYZERS, parse_channels, print_progress, writeMixFile
+from .vphicache import VphiCache
+from .noise import measure_noise
+from .plotting import ColFigure, PngWriter, PLOT_MODES
+from .sweep import SweepEngine, errfbStats
 from cringe import log
 from cringe.shared import get_savepath
 
@@ -120,6 +125,10 @@ class VPhiDemo(QWidget):
         layout.addWidget(self.vphi_type_combo)
         self.layout.addLayout(layout)
         self.vphi_functions = [self.FBAvphi, self.FBBvphi, self.lockedFBAvphi]
+        self.tuneworker = None
+        self.last_tune_result = None
+        self.plotmode = PLOT_MODES[0]
+        self.pngwriter = None
 
         layout = QHBoxLayout()
 
@@ -136,6 +145,11 @@ class VPhiDemo(QWidget):
         layout2.addWidget(self.sendmixcheckbox_label)
         layout.addLayout(layout2)
 
+        self.plotModeCombo = QComboBox(self)
+        self.plotModeCombo.addItems(PLOT_MODES)
+        layout.addWidget(QLabel("tune plots"))
+        layout.addWidget(self.plotModeCombo)
+
         self.learn_columns_button = QPushButton(self, text="learn columns")
         self.learn_columns_button.clicked.connect(self.learnColumns)
         layout.addWidget(self.learn_columns_button)
@@ -150,6 +164,16 @@ class VPhiDemo(QWidget):
 
         self.layout.addLayout(layout)
 
+        layout = QHBoxLayout()
+        self.retunebutton = QPushButton(self, text="retune channels")
+        self.retunebutton.clicked.connect(self.retune)
+        layout.addWidget(self.retunebutton)
+        self.retune_channels_edit = QLineEdit(self)
+        self.retune_channels_edit.setPlaceholderText(
+            "col:row,row;col eg 0:1,5;3 for col 0 rows 1 and 5, all of col 3, empty for the channels left unlocked")
+        layout.addWidget(self.retune_channels_edit)
+        self.layout.addLayout(layout)
+
         layout = QHBoxLayout()
         self.ISlopeProductSpin = QSpinBox()
         self.ISlopeProductSpin.setRange(-1000, 1000)
@@ -194,6 +218,32 @@ class VPhiDemo(QWidget):
         layout.addWidget(self.minimumD2AValueSpin)
         self.layout.addLayout(layout)
 
+        layout = QHBoxLayout()
+        self.useVphiCacheCheckBox = QCheckBox("reuse vphis of unchanged columns in full tune", self)
+        layout.addWidget(self.useVphiCacheCheckBox)
+        self.vphiCacheMaxAgeSpin = QSpinBox()
+        self.vphiCacheMaxAgeSpin.setRange(0, 24*3600)
+        self.vphiCacheMaxAgeSpin.setValue(600)
+        layout.addWidget(QLabel("for up to (s)"))
+        layout.addWidget(self.vphiCacheMaxAgeSpin)
+        self.clearVphiCacheButton = QPushButton(self, text="clear vphi cache")
+        self.clearVphiCacheButton.clicked.connect(lambda: VphiCache().clear())
+        layout.addWidget(self.clearVphiCacheButton)
+        self.layout.addLayout(layout)
+
+        layout = QHBoxLayout()
+        self.vphiAnalyzerCombo = QComboBox(self)
+        self.vphiAnalyzerCombo.addItems(list(VPHI_ANALYZERS.keys()))
+        layout.addWidget(QLabel("vphi analyzer"))
+        layout.addWidget(self.vphiAnalyzerCombo)
+        self.minVphiQualitySpin = QDoubleSpinBox()
+        self.minVphiQualitySpin.setRange(0, 1)
+        self.minVphiQualitySpin.setSingleStep(0.05)
+        self.minVphiQualitySpin.setValue(0.9)
+        layout.addWidget(QLabel("fft minimum vphi quality"))
+        layout.addWidget(self.minVphiQualitySpin)
+        self.layout.addLayout(layout)
+
         layout = QHBoxLayout()
         grabd2abutton = QPushButton(
             self, text="grab d2aA values, assumes feedback is on")
@@ -244,360 +294,224 @@ class VPhiDemo(QWidget):
         plots.ylabel("signal")
         plots.show()
 
-    def FBAvphi(self):
-        tridwell, tristeps, tristepsize = 2, 9, 10
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
-        self.mm.setdfball(tria=1)
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6)
-        fba = data[0, 0, :, 1]  # triangle
-        err = data[0, 0, :, 0]  # signal
-        np.save(get_savepath("last_fba_vphi"), data)
+    def engine(self, progress=None):
+        return AutoTuneEngine(self.mm, self.c.client, self.tuneSettings(), progress)
+
+    def tuneSettings(self):
+        return TuneSettings(ISlopeProduct=self.ISlopeProductSpin.value(),
+                            MixSlopeProduct=self.MixSlopeProductSpin.value(),
+                            PercentFromBottom=self.PercentFromBottomSpin.value(),
+                            minimumD2aAValue=self.minimumD2AValueSpin.value(),
+                            d2aBshift=self.d2aBshiftSpin.value(),
+                            lockSlopeSign=self.lockSlopeSignCheckBox.isChecked(),
+                            lockSlopeSignFBB=self.lockSlopeSignFBBCheckBox.isChecked(),
+                            sendMix=self.shouldSendMixAfterFullTune(),
+                            useVphiCache=self.useVphiCacheCheckBox.isChecked(),
+                            vphiCacheMaxAgeS=self.vphiCacheMaxAgeSpin.value(),
+                            vphiAnalyzer=self.vphiAnalyzerCombo.currentText(),
+                            minVphiQuality=self.minVphiQualitySpin.value())
 
-        outtriangle, outsigsup, outsigsdown = analysis.conditionvphis(
-            data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
-        return outtriangle, outsigsup, outsigsdown
+    def FBAvphi(self):
+        return self.engine().FBAvphi()
 
     def FBBvphi(self):
-        tridwell, tristeps, tristepsize = 2, 9, 20
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
-        # Triangle feedback on FB[B], SendMode : FBB, ERR
-        self.mm.setdfball(trib=1, data_packet=1)
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6)
-        fbb = data[0, 0, :, 1]  # triangle
-        err = data[0, 0, :, 0]  # signal
-        np.save(get_savepath("last_fbb_vphi"), data)
-
-        outtriangle, outsigsup, outsigsdown = analysis.conditionvphis(
-            data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
-        return outtriangle, outsigsup, outsigsdown
+        return self.engine().FBBvphi()
 
     def shouldSendMixAfterFullTune(self):
         return self.sendmixcheckbox.isChecked()
 
     def lockedFBAvphi(self, d2aB=8000, a2d=1200, I=10):
-        tridwell, tristeps, tristepsize = 2, 9, 20
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
-        self.mm.setdfball(tria=1, ARL=1, data_packet=2,
-                          FBB=1, I=I, d2aB=d2aB, a2d=a2d)
-
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6, sendMode=2)
-        fba = data[0, 0, :, 1]  # signal
-        fbb = data[0, 0, :, 0]  # triangle
-        np.save(get_savepath("last_locked_fba_vphi"), data)
-
-        outtriangle, outsigsup, outsigsdown = analysis.conditionvphis(
-            data[:, :, :, 0], data[:, :, :, 1], tridwell, tristeps, tristepsize)
-        return outtriangle, outsigsup, outsigsdown
-
-    def lockedFBAvphi_colsettings(self, d2aB, a2d, I):
-        tridwell, tristeps, tristepsize = 2, 9, 15
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
-
-        # for col in range(self.c.ncol):
-        #     self.mm.setdfballrow(col,tria=1,ARL=1,data_packet=2, FBB=0, I=I[col], d2aB=d2aB[col], a2d=a2d[col])
-        for col in range(self.c.ncol):
-            self.mm.setdfballrow(col, tria=1, ARL=1, data_packet=2,
-                                 FBB=1, I=I[col], d2aB=d2aB[col], a2d=a2d[col])
-
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6, sendMode=2)
-        fba = data[0, 0, :, 1]  # signal
-        fbb = data[0, 0, :, 0]  # triangle
-        np.save(get_savepath("last_locked_fba_vphi"), data)
-
-        outtriangle, outsigsup, outsigsdown = analysis.conditionvphis(
-            data[:, :, :, 0], data[:, :, :, 1], tridwell, tristeps, tristepsize)
-        return outtriangle, outsigsup, outsigsdown
-
-    def validateServerSettings(self):
-        """
-        return True if nrow, nsamp, lsync all match between the server and cringe
-        return False Otherwise, also pop-up a warning
-        """
-        returnVal = True
-        if not self.c.nrow == self.mm.seqln:
-            returnVal = False
-        if not self.c.nsamp == self.mm.NSAMP:
-            returnVal = False
-        if not self.c.lsync == self.mm.lsync:
-            returnVal = False
-        if not returnVal:
-            msg = QMessageBox()
-            msg.setIcon(QMessageBox.Critical)
-            msg.setText("NROW, NSAMP, LSYNC must match between cringe and server for tune.\nServer NROW {}, NSAMP {}, LSYNC {}.\nCringe NROW {}, NSAMP {}, LSYNC {}.".format(
-                self.c.nrow, self.c.nsamp, self.c.lsync,
-                self.mm.seqln, self.mm.NSAMP, self.mm.lsync))
-            msg.setWindowTitle("Server Problem")
-            msg.setStandardButtons(QMessageBox.Ok)
-            msg.exec_()
-
-        return returnVal
+        return self.engine().lockedFBAvphi(d2aB, a2d, I)
 
     def fullTune(self):
-        try:
-            self._fullTune()
-        except Exception as ex:
-            import traceback
-            import sys
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            s = traceback.format_exception(exc_type, exc_value, exc_traceback)
-            print("TRACEBACK")
-            print("".join(s))
-            print("TRACEBACK DONE")
-            msg = QMessageBox()
-            msg.setIcon(QMessageBox.Critical)
-            msg.setText(f"Tune Failed: Do you need to learn columns?\nexception was:\n{ex}\n")
-            msg.setWindowTitle("Tune Failed")
-            msg.setStandardButtons(QMessageBox.Ok)
-            msg.exec_()
-
-    def _fullTune(self):
-        log.info("start fbb vphi")
-        if not self.validateServerSettings():
+        """run the tune on a worker thread, plotting each stage as it finishes"""
+        self.startTuneWorker()
+
+    def retune(self):
+        """retune the channels in the retune box, or those the last tune left unlocked, on a worker thread, the
+        others keep their last tune"""
+        if self.last_tune_result is None:
+            log.info("retune needs a full tune first")
             return
-        self.c.client.setMixToZero()
-        fbbtriangle, fbbsigsup, fbbsigsdown = self.FBBvphi()
-        fbbstats = vphistats.vPhiStats(fbbtriangle, fbbsigsup)
-
-        # get settings for locked vphis from those vphis
-        a2dlockpoints = np.median(fbbstats['midPoint'], axis=1)
-        d2aB = np.ones(len(a2dlockpoints))*8000
-        # choose I for fbb such you get 10 for nsamp = 4, and 5 for nsamp =8
-        I = np.ones(len(a2dlockpoints))*int(round(10*4/float(self.mm.NSAMP)))
-        # set the ARL setting to 10 % more than a fbb vphi
-        oldfluxjumpthreshold = self.mm.flux_jump_threshold
-        self.mm.setFluxJumpThreshold(np.median(fbbstats["periodXUnits"])*1.1)
-
-        plots = ColPlots(self, self.c.ncol, self.c.nrow)
-        plots.plot(fbbtriangle, fbbsigsup)
-        plots.title("fbb vphi")
-        plots.xlabel("fbb triangle")
-        plots.ylabel("error")
-        plots.show()
-
-        log.info("start locked fba vphi")
-        lfbatriangle, lfbasigsup, lfbasigsdown = self.lockedFBAvphi_colsettings(
-            d2aB, a2dlockpoints, I)
-        lfbastats = vphistats.vPhiStats(lfbatriangle, lfbasigsup)
-
-        plots = ColPlots(self, self.c.ncol, self.c.nrow)
-        plots.plot(lfbatriangle, lfbasigsup)
-        plots.title("locked fba vphi")
-        plots.xlabel("fba triangle")
-        plots.ylabel("fbb feedback")
-        plots.show()
-
-        log.info("taking 2nd fbb vphi, fba set to first minimum from locked vphi")
-        d2aA_forfbb2 = lfbastats["firstMinimumX"]
-        for col in range(self.c.ncol):
-            for row in range(self.c.nrow):
-                self.mm.setdfbrow(col, row, trib=1,
-                                  d2aA=d2aA_forfbb2[col, row], data_packet=1)
-        tridwell, tristeps, tristepsize = 2, 9, 20
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6)
-        fbb = data[0, 0, :, 1]  # triangle
-        err = data[0, 0, :, 0]  # signal
-        np.save(get_savepath("last_fbb2_vphi"), data)
-        fbb2triangle, fbb2sigsup, fbb2sigsdown = analysis.conditionvphis(
-            data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
-        fbb2stats = vphistats.vPhiStats(fbb2triangle, fbb2sigsup)
-
-        plots = ColPlots(self, self.c.ncol, self.c.nrow)
-        plots.plot(fbb2triangle, fbb2sigsup)
-        plots.title("fbb2 vphi,fba set to first minium from locked vphi")
-        plots.xlabel("fbb triangle")
-        plots.ylabel("error")
-        plots.show()
-
-        # here we choose where the sq1 curve lies on the SA curve
-        # the right side of the sq1 curve is at d2aB
-        # Xup is the size of the upward slope in FBB units
-        Xup = fbb2stats["firstMaximumX"] - fbb2stats["firstMinimumX"]
-        Xup[Xup < 0] += fbb2stats["periodXUnits"][Xup < 0]
-        # Xdown is the size of the downward slope in FBB units
-        Xdown = fbb2stats["firstMinimumX"] - fbb2stats["firstMaximumX"]
-        Xdown[Xdown < 0] += fbb2stats["periodXUnits"][Xdown < 0]
-        #d2aBupwardSlpe is the d2aB value that places the Sq1 approximatley midpoint on the upward slope
-        #d2aBshift is a user settable parameter to shift the position of the Sq1 on the SA
-        d2aBshift = self.d2aBshiftSpin.value()
-        d2aBupwardSlope = fbb2stats["firstMinimumX"] + \
-            lfbastats["modDepth"]+(Xup-lfbastats["modDepth"])/2.0+d2aBshift
-        d2aBdownwardSlope = fbb2stats["firstMaximumX"] + \
-            lfbastats["modDepth"]+(Xdown-lfbastats["modDepth"])/2.0+d2aBshift
-
-
-        if self.lockSlopeSignFBBCheckBox.isChecked():
-            d2aB = d2aBupwardSlope
-        else:
-            d2aB = d2aBdownwardSlope
-        for col in range(self.c.ncol):
-            for row in range(self.c.nrow):
-                period = fbb2stats["periodXUnits"][col, row]
-                d2aBval = d2aB[col, row]
-                if period > 0 and d2aBval < 0:
-                    nPeriodToAdd = int(np.ceil(-d2aBval/period))
-                    if nPeriodToAdd > 0:
-                        d2aB[col, row] = d2aBval + nPeriodToAdd*period
-
-        oneplot = OnePlot(self)
-
-        plt.plot(fbb2triangle, fbb2sigsup[0, 0])
-        sq1x = np.linspace(
-            d2aBupwardSlope[0, 0], d2aBupwardSlope[0, 0]-lfbastats["modDepth"][0, 0])
-        sq1y = np.interp(sq1x, fbb2triangle, fbb2sigsup[0, 0])
-        plt.plot(sq1x, sq1y, lw=3, label="upward")
-        sq1x = np.linspace(
-            d2aBdownwardSlope[0, 0], d2aBdownwardSlope[0, 0]-lfbastats["modDepth"][0, 0])
-        sq1y = np.interp(sq1x, fbb2triangle, fbb2sigsup[0, 0])
-        plt.plot(sq1x, sq1y, lw=3, label="down")
-        plt.plot(fbb2stats["firstMinimumX"][0, 0],
-                 fbb2stats["firstMinimumY"][0, 0], "o", label="minimum")
-        plt.plot(fbb2stats["firstMaximumX"][0, 0],
-                 fbb2stats["firstMaximumY"][0, 0], "o", label="maximum")
-        if self.lockSlopeSignFBBCheckBox.isChecked():
-            plt.title("show where sq1 goes for col 0, row 0\nupward chosen")
-        else:
-            plt.title("show where sq1 goes for col 0, row 0\ndownward chosen")
-        plt.xlabel("fbb triangle")
-        plt.ylabel("error")
-        plt.legend()
-        oneplot.show()
-        # oneplot.figure.canvas.draw()
-        QApplication.processEvents()  # process gui events
-
-        log.debug(("added {} Phi0s".format(self.minimumD2AValueSpin.value())))
-
-        np.save(get_savepath("last_fbb2_firstMinimumX"),
-                fbb2stats["firstMinimumX"])
-        np.save(get_savepath("last_lfba_modDepth"),
-                lfbastats["modDepth"])
-        np.save(get_savepath("last_lfba_firstMinimumY"),
-                lfbastats["firstMinimumY"])
-        np.save(get_savepath("last_fbb2_periodXUnits"),
-                fbbstats["periodXUnits"])
-
-        # take fba vphis with correct d2aB values
-        tridwell, tristeps, tristepsize = 2, 8, 30
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
-        for col in range(self.c.ncol):
-            for row in range(self.c.nrow):
-                self.mm.setdfbrow(col, row, tria=1, d2aB=d2aB[col, row])
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6)
-        fba = data[0, 0, :, 1]  # triangle
-        err = data[0, 0, :, 0]  # signal
-        np.save(get_savepath("last_fba_vphi"), data)
-
-        fracFromBottom = self.PercentFromBottomSpin.value()*0.01
-
-        fbatriangle, fbasigsup, fbasigsdown = analysis.conditionvphis(
-            data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
-        fbastats = vphistats.vPhiStats(
-            fbatriangle, fbasigsup, fracFromBottom=fracFromBottom)
-        with open("last_fbastats", "wb") as f:
-            pickle.dump(fbastats, f)
-
-        if self.lockSlopeSignCheckBox.isChecked():
-            d2aA = fbastats["positiveCrossingFirstX"]
+        channels = parse_channels(self.retune_channels_edit.text()) or self.last_tune_result.badChannels()
+        if len(channels) == 0:
+            log.info("no channels to retune, the last tune locked them all")
+            return
+        self.startTuneWorker(channels, self.last_tune_result)
+
+    def tuneRunning(self):
+        return self.tuneworker is not None and self.tuneworker.isRunning()
+
+    def setTuneRunning(self, running):
+        """the worker uses the client, which isn't thread safe, so while it runs disable every control in the
+        tune tab that uses the client from the gui thread"""
+        tab = self.parent()
+        if running and tab.biterrordemo.timer.isActive():
+            tab.biterrordemo.stop()
+            log.info("stopped the bit error test for the tune")
+        buttons = [button for button in self.findChildren(QPushButton) if button.parent() is self]
+        for widget in buttons+[tab.c, tab.biterrordemo, tab.settSweep, tab.biasSweeper]:
+            widget.setEnabled(not running)
+
+    def startTuneWorker(self, channels=None, previous=None):
+        if self.tuneRunning():
+            log.info("tune already running")
+            return
+        # the muxmaster changes widgets, so its methods still run on the gui thread
+        mm = GuiThreadProxy(self.mm)
+        self.tuneworker = TuneWorker(self, AutoTuneEngine(mm, self.c.client, self.tuneSettings()), channels, previous)
+        self.tuneworker.progressed.connect(self.plotTuneStage)
+        self.tuneworker.tuned.connect(self.tuneDone)
+        self.tuneworker.failed.connect(self.tuneFailed)
+        self.setTuneRunning(True)
+        self.startPlots()
+        self.tuneworker.start()
+
+    def fullTuneHeadless(self):
+        """run the tune on this thread without plot windows, for cringe_control. returns the TuneResult"""
+        if self.tuneRunning():
+            raise Exception("a tune is already running")
+        result = self.engine(self.headlessProgress()).fullTune()
+        self.finishPlots()
+        self.mix_afer_full_tune = result.Mix
+        self.last_tune_result = result
+        return result
+
+    def retuneHeadless(self, channels=None):
+        """retune channels, or those the last tune left unlocked, on this thread without plot windows, for
+        cringe_control. returns the TuneResult"""
+        if self.tuneRunning():
+            raise Exception("a tune is already running")
+        if self.last_tune_result is None:
+            raise Exception("retune needs a full tune first")
+        if channels is None:
+            channels = self.last_tune_result.badChannels()
+        result = self.engine(self.headlessProgress()).retune(channels, self.last_tune_result)
+        self.finishPlots()
+        self.mix_afer_full_tune = result.Mix
+        self.last_tune_result = result
+        return result
+
+    def headlessProgress(self):
+        """print each stage, and in save pngs mode plot it too"""
+        self.startPlots()
+        if self.pngwriter is None:
+            return print_progress
+
+        def progress(stage, elapsed_s, result):
+            print_progress(stage, elapsed_s, result)
+            self.plotTuneStage(stage, elapsed_s, result)
+        return progress
+
+    def tuneDone(self, result):
+        self.mix_afer_full_tune = result.Mix
+        self.last_tune_result = result
+        self.finishPlots()
+        # again, now the plot times are in
+        self.tuneworker.engine.writeProfile(result)
+        self.setTuneRunning(False)
+
+    def tuneFailed(self, ex):
+        self.finishPlots()
+        self.setTuneRunning(False)
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Critical)
+        msg.setText(f"Tune Failed: Do you need to learn columns?\nexception was:\n{ex}\n")
+        msg.setWindowTitle("Tune Failed")
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.exec_()
+
+    def plotTuneStage(self, stage, elapsed_s, r):
+        if self.plotmode == "no plots":
+            return
+        t_start = time.time()
+        if self._plotTuneStage(stage, r):
+            r.profiler.add(f"plot {stage}", time.time()-t_start)
+
+    def _plotTuneStage(self, stage, r):
+        if stage == "fbb vphi":
+            plots = self.stagePlots()
+            plots.plot(r.fbbtriangle, r.fbbsigsup)
+            plots.title("fbb vphi")
+            plots.xlabel("fbb triangle")
+            plots.ylabel("error")
+            self.showStagePlots(plots, stage)
+        elif stage == "locked fba vphi":
+            plots = self.stagePlots()
+            plots.plot(r.lfbatriangle, r.lfbasigsup)
+            plots.title("locked fba vphi")
+            plots.xlabel("fba triangle")
+            plots.ylabel("fbb feedback")
+            self.showStagePlots(plots, stage)
+        elif stage == "fbb2 vphi":
+            plots = self.stagePlots()
+            plots.plot(r.fbb2triangle, r.fbb2sigsup)
+            plots.title("fbb2 vphi,fba set to first minium from locked vphi")
+            plots.xlabel("fbb triangle")
+            plots.ylabel("error")
+            self.showStagePlots(plots, stage)
+
+            oneplot = OnePlot(self) if self.pngwriter is None else None
+            ax = Figure().add_subplot() if oneplot is None else oneplot.ax
+            ax.plot(r.fbb2triangle, r.fbb2sigsup[0, 0])
+            for d2aBslope, label in [(r.d2aBupwardSlope, "upward"), (r.d2aBdownwardSlope, "down")]:
+                sq1x = np.linspace(d2aBslope[0, 0], d2aBslope[0, 0]-r.lfbastats["modDepth"][0, 0])
+                sq1y = np.interp(sq1x, r.fbb2triangle, r.fbb2sigsup[0, 0])
+                ax.plot(sq1x, sq1y, lw=3, label=label)
+            ax.plot(r.fbb2stats["firstMinimumX"][0, 0],
+                    r.fbb2stats["firstMinimumY"][0, 0], "o", label="minimum")
+            ax.plot(r.fbb2stats["firstMaximumX"][0, 0],
+                    r.fbb2stats["firstMaximumY"][0, 0], "o", label="maximum")
+            if r.settings.lockSlopeSignFBB:
+                ax.set_title("show where sq1 goes for col 0, row 0\nupward chosen")
+            else:
+                ax.set_title("show where sq1 goes for col 0, row 0\ndownward chosen")
+            ax.set_xlabel("fbb triangle")
+            ax.set_ylabel("error")
+            ax.legend()
+            if oneplot is None:
+                self.pngwriter.save(ax.figure, "fbb2 sq1 col 0 row 0")
+            else:
+                oneplot.show()
+        elif stage == "calculate":
+            fbatriangles = np.array(r.fbatriangle[np.newaxis, np.newaxis, :]-r.d2aA[:, :, np.newaxis], dtype="int64")
+            fbasigsupShifted = r.fbasigsup-r.a2d[:, :, np.newaxis]
+            plots = self.stagePlots()
+            plots.plotbigx(fbatriangles, fbasigsupShifted)
+            plots.title("final fba vphis analyzed and shifted to lockpoint")
+            plots.xlabel("fba triangle")
+            plots.ylabel("error")
+            plots.grid(True)
+            self.showStagePlots(plots, "fba vphi shifted to lockpoint")
         else:
-            d2aA = fbastats["negativeCrossingFirstX"]
-
-        minimum_d2aA = self.minimumD2AValueSpin.value()
-        log.debug(("using {} as minimum_d2aA".format(
-            self.minimumD2AValueSpin.value())))
-        for col in range(self.c.ncol):
-            for row in range(self.c.nrow):
-                if d2aA[col, row] <= minimum_d2aA and period > 0:
-                    nPeriodToAdd = int(
-                        np.ceil((minimum_d2aA-d2aA[col, row])/period))
-                    d2aA[col, row] += nPeriodToAdd * \
-                        fbastats["periodXUnits"][col, row]
-                    log.debug(("col %g, row %g FBA lockpoint shift up %g phi because it was below %g" % (
-                        col, row, nPeriodToAdd, minimum_d2aA)))
-        a2d = fbastats["crossingPoint"]
-
-        fbatriangles = np.zeros(
-            (self.c.ncol, self.c.nrow, len(fbatriangle)), dtype="int64")
-        fbasigsupShifted = fbasigsup[:]
-        for col in range(self.c.ncol):
-            for row in range(self.c.nrow):
-                fbatriangles[col, row, :] = fbatriangle-d2aA[col, row]
-                fbasigsupShifted[col, row,
-                                 :] = fbasigsup[col, row, :]-a2d[col, row]
-
-        plots = ColPlots(self, self.c.ncol, self.c.nrow)
-        plots.plotbigx(fbatriangles, fbasigsupShifted)
-        plots.title("final fba vphis analyzed and shifted to lockpoint")
-        plots.xlabel("fba triangle")
-        plots.ylabel("error")
-        plots.grid(True)
-        plots.show()
-
-        ISlopeProduct = self.ISlopeProductSpin.value()
-        MixSlopeProduct = self.MixSlopeProductSpin.value()
-
-        if self.lockSlopeSignCheckBox.isChecked():
-            I = ISlopeProduct/fbastats["positiveCrossingSlope"]
+            return False
+        return True
+
+    def startPlots(self):
+        """take the plot mode for the tune about to start, saving pngs goes in a new tune_plots directory"""
+        self.plotmode = self.plotModeCombo.currentText()
+        if self.plotmode == "save pngs":
+            self.pngwriter = PngWriter(get_savepath(os.path.join("tune_plots", time.strftime("%Y%m%d_%H%M%S"))))
         else:
-            I = ISlopeProduct/fbastats["negativeCrossingSlope"]
-
-        I = np.array(np.round(I), dtype="int64")
-        chanisgood = np.ones(I.shape, dtype="bool")
-        chanisgood[I > 511] = False
-        chanisgood[I < -511] = False
-        chanisgood[fbastats["periodXUnits"] < 200] = False
-
-        sq1periods = np.median(fbastats["periodXUnits"], axis=1)
-
-        if self.lockSlopeSignCheckBox.isChecked():
-            Mix = chanisgood*MixSlopeProduct/fbastats["positiveCrossingSlope"]
+            self.pngwriter = None
+
+    def finishPlots(self):
+        if self.pngwriter is not None:
+            try:
+                self.pngwriter.wait()
+            except Exception as ex:
+                log.error(f"saving tune plots failed: {ex}")
+
+    def stagePlots(self):
+        if self.pngwriter is None:
+            return ColPlots(self, self.c.ncol, self.c.nrow)
+        return ColFigure.offscreen(self.c.ncol, self.c.nrow)
+
+    def showStagePlots(self, plots, name):
+        if self.pngwriter is None:
+            plots.show()
         else:
-            Mix = chanisgood*MixSlopeProduct/fbastats["negativeCrossingSlope"]
-
-        np.save(get_savepath("last_mix_values"), Mix/100.0)
-        matter_mix_dir = os.path.expanduser("~/nasa_daq/matter/")
-        matter_mix_file = os.path.join(matter_mix_dir, "autotune_mix.mixing")
-        try:
-            writeMixFile(matter_mix_file, Mix/100.0)
-        except FileNotFoundError as ex:
-            print(f"not writing f{matter_mix_file}, probably because f{matter_mix_dir} doesn't exist.\
-            This is fine unless you need to load the mix file from matter.")
-        # cringe should have created this directory earlier
-        np.save(os.path.expanduser("~/.cringe/mix_fractions"), Mix/100.0)
-
-        for col in range(self.c.ncol):
-            for row in range(self.c.nrow):
-                if chanisgood[col, row]:
-                    self.mm.setdfbrow(
-                        col, row, a2d=a2d[col, row], I=I[col, row], d2aA=d2aA[col, row], d2aB=d2aB[col, row], FBA=1, ARL=1)
-                else:
-                    # set D2A values for bad channels to the midpoint of the intended distribution of other D2A values
-                    # the minimum value is minimum_d2aA, all D2A values should be with sq1periods[col] of the minimum
-                    # this should reduce the maximum difference in D2A between two different rows
-                    # having large D2A changes between rows causes crosstalk
-                    self.mm.setdfbrow(
-                        col, row, a2d=0, I=0, d2aA=minimum_d2aA+0.5*sq1periods[col], d2aB=0, FBA=0, ARL=0)
-
-        sq1periodsstrs = ["col %g %g" % (
-            i, int(round(sq1periods[i]))) for i in range(len(sq1periods))]
-        log.info(("median sq1 periods by column (arbs):\n " +
-                  "\n".join(sq1periodsstrs)))
-        log.info(("median of all columns: %g arbs" % np.median(sq1periods)))
-        goodfluxjumpthreshold = int(np.median(sq1periods)*0.8)
-        log.info(("typically the ARL FluxJumpThreshold should be around 0.8 the sq1 period, so %g could be good" %
-                  goodfluxjumpthreshold))
-        log.info(("This value was set for you, your previous value was %g" %
-                  oldfluxjumpthreshold))
-        self.mm.setFluxJumpThreshold(goodfluxjumpthreshold)
-        
-        Mix[np.isnan(Mix)] = 0  # don't send NaN, its invalid for mix
-        self.mix_afer_full_tune = Mix
-
-        if self.shouldSendMixAfterFullTune():
-            log.info("sending mix values after full tune")
-            log.debug("mix before nan check", Mix)
-            log.debug("mix before divide by 100", Mix)
-            log.debug(Mix/100.0)
-            self.c.client.setMix(Mix/100.0)
+            self.pngwriter.save(plots.figure, name)
 
     def prune_bad_channels(self):
         log.info("prune_bad_channels")
@@ -660,23 +574,11 @@ class VPhiDemo(QWidget):
         """dont change anything, grab some data, take the fft, plot the noise"""
         num_points = 2**14
         navgs = 40
-        sample_spacing_s = 1/float(self.c.sample_rate)
         log.info("taking noise psd, not changin any settings, so make sure you have FBA locked and the correct send mode, and the mix on")
-        log.info("sample time = %g s" % sample_spacing_s)
-        freqs = np.fft.rfftfreq(num_points, sample_spacing_s)
-        ffts = np.zeros((self.c.ncol, self.c.nrow, len(freqs)))
-        df = float(freqs[1]-freqs[0])
-        log.info("frequency spacing of psd =  %0.2f hz" % df)
-
-        for i in range(navgs):
-            data = self.c.getNewData(
-                0.001, minimumNumPoints=num_points, exactNumPoints=True)
-            for col in range(self.c.ncol):
-                for row in range(self.c.nrow):
-                    ffts[col, row,
-                         :] += np.abs(np.fft.rfft(data[col, row, :, 1]))
-        ffts /= float(navgs)
-        psd = 2*ffts/np.sqrt(float(self.c.sample_rate)*num_points)
+        log.info("sample time = %g s" % (1/float(self.c.sample_rate)))
+        noise = measure_noise(self.c.getNewData, self.c.sample_rate, num_points, navgs)
+        freqs, psd = noise.freqs, noise.asd
+        log.info("frequency spacing of psd =  %0.2f hz" % (freqs[1]-freqs[0]))
 
         plots = ColPlots(self, self.c.ncol, self.c.nrow)
         plots.semilogx(freqs[1:], psd[:, :, 1:])
@@ -688,12 +590,12 @@ class VPhiDemo(QWidget):
         plots.show()
 
         np.save(get_savepath("last_noise_freqs_hz"), freqs)
-        np.save(get_savepath("last_noise_psd_arbs_per_sqrt_hz"), ffts)
+        np.save(get_savepath("last_noise_psd_arbs_per_sqrt_hz"), psd)
 
         flo = 15000
         fhi = 40000
         ilo, ihi = np.searchsorted(freqs, [flo, fhi])
-        medpsd = np.median(psd[:, :, ilo:ihi], axis=-1)
+        medpsd = noise.band_level(flo, fhi)
         medpsdcol = np.median(medpsd, axis=-1)
         noisestr = ["col %d %0.4f" % (i, medpsdcol[i])
                     for i in range(self.c.ncol)]
@@ -751,6 +653,12 @@ class SettlingTimeSweeper(QWidget):
             data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
         return outtriangle, outsigsup, outsigsdown
 
+    def settSweep(self, SETTs, checkpoint):
+        """error and feedback median and std dev at each SETT, (col, row, SETT)"""
+        return SweepEngine("SETT", self.mm.setSETT, SETTs, self.c.getNewData, errfbStats,
+                           acquisition=dict(delaySeconds=0.01, minimumNumPoints=10000, divideNsamp=False),
+                           checkpoint=checkpoint).run()
+
     def sweepUnlocked(self):
         """set nsamp to 1, sweep thru settling times, measure error and fb,
         plot them, change back nsamp and settinling time to original values"""
@@ -804,24 +712,8 @@ class SettlingTimeSweeper(QWidget):
         maxSETT = self.mm.lsync-2-1
 
         SETTs = np.arange(maxSETT, -1, -1)
-        errs = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        fbs = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        errstds = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        fbstds = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        for i, SETT in enumerate(SETTs):
-            log.info(("sweep SETT = %g" % SETT))
-            self.mm.setSETT(SETT)
-
-            data = self.c.getNewData(
-                0.01, minimumNumPoints=10000, divideNsamp=False)
-            err = np.median(data[:, :, :, 0], axis=2)
-            errstd = np.std(data[:, :, :, 0], axis=2)
-            fb = np.median(data[:, :, :, 1], axis=2)
-            fbstd = np.std(data[:, :, :, 1], axis=2)
-            errs[:, :, i] = err
-            errstds[:, :, i] = errstd
-            fbs[:, :, i] = fb
-            fbstds[:, :, i] = fbstd
+        sweep = self.settSweep(SETTs, get_savepath("last_unlocked_sett_sweep.npz"))
+        errs, errstds = sweep["err"], sweep["errstd"]
 
         np.save(get_savepath("last_unlocked_sett_sweep_SETTs"), SETTs)
         np.save(get_savepath("last_unlocked_sett_sweep_errs"), errs)
@@ -853,24 +745,8 @@ class SettlingTimeSweeper(QWidget):
         maxSETT = self.mm.lsync-2-1
 
         SETTs = np.arange(maxSETT, -1, -1)
-        errs = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        fbs = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        errstds = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        fbstds = np.zeros((self.c.ncol, self.c.nrow, len(SETTs)))
-        for i, SETT in enumerate(SETTs):
-            log.info(("sweep SETT = %g" % SETT))
-            self.mm.setSETT(SETT)
-
-            data = self.c.getNewData(
-                0.01, minimumNumPoints=10000, divideNsamp=False)
-            err = np.median(data[:, :, :, 0], axis=2)
-            errstd = np.std(data[:, :, :, 0], axis=2)
-            fb = np.median(data[:, :, :, 1], axis=2)
-            fbstd = np.std(data[:, :, :, 1], axis=2)
-            errs[:, :, i] = err
-            errstds[:, :, i] = errstd
-            fbs[:, :, i] = fb
-            fbstds[:, :, i] = fbstd
+        sweep = self.settSweep(SETTs, get_savepath("last_locked_sett_sweep.npz"))
+        fbs, fbstds = sweep["fb"], sweep["fbstd"]
 
         plots = ColPlots(self, self.c.ncol, self.c.nrow)
         plots.plot(SETTs, fbstds)
@@ -929,7 +805,6 @@ class BitErrorDemo(QWidget):
                     self.errormedians[col, row]-self.ehhw, self.errormedians[col, row]+self.ehhw)
                 c, _ = np.histogram(data[col, row, :, 0], bins)
                 self.hists[col, row, :] += c
-        self.plots.cla()
         self.plots.xlabel("error - median(error)")
         self.plots.ylabel("number of occurences")
         self.plots.plottitle(
@@ -1045,24 +920,22 @@ class BiasSweeper(QWidget):
             data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
         return outtriangle, outsigsup, outsigsdown
 
-    def lockedFBAvphi_colsettings(self, d2aB, a2d, I):
-        tridwell, tristeps, tristepsize = 2, 9, 15
-        self.mm.settriangleparams(tridwell, tristeps, tristepsize)
+    def setupLockedFBAvphi(self, d2aB, a2d, I):
+        self.mm.settriangleparams(2, 9, 15)
 
         for col in range(self.c.ncol):
             self.mm.setdfballrow(col, tria=1, ARL=1, data_packet=2,
                                  FBB=1, I=I[col], d2aB=d2aB[col], a2d=a2d[col])
 
-        data = self.c.getNewData(0.1, minimumNumPoints=4096*6, sendMode=2)
-        fba = data[0, 0, :, 1]  # signal
-        fbb = data[0, 0, :, 0]  # triangle
-
+    def lockedFBAModDepth(self, data):
+        """reduce for sweeps of locked fba vphis, data from getNewData with sendMode=2"""
         outtriangle, outsigsup, outsigsdown = analysis.conditionvphis(
-            data[:, :, :, 0], data[:, :, :, 1], tridwell, tristeps, tristepsize)
-        return outtriangle, outsigsup, outsigsdown
-
-    def sweepBAD16FBA(self):
+            data[:, :, :, 0], data[:, :, :, 1], 2, 9, 15)
+        return {"modDepth": vphistats.vPhiStats(outtriangle, outsigsup)["modDepth"]}
 
+    def lockedFBAvphiSweep(self, name, setter, vals, settleS=0, discardData=False):
+        """locked fba vphi modDepth at each value, the rows are set once up front since the setter doesn't
+        change them"""
         self.c.client.setMixToZero()
         fbbtriangle, fbbsigsup, fbbsigsdown = self.FBBvphi_from_file()
         fbbstats = vphistats.vPhiStats(fbbtriangle, fbbsigsup)
@@ -1075,23 +948,21 @@ class BiasSweeper(QWidget):
         # set the ARL setting to 10 % more than a fbb vphi
         oldfluxjumpthreshold = self.mm.flux_jump_threshold
         self.mm.setFluxJumpThreshold(np.median(fbbstats["periodXUnits"])*1.1)
+        try:
+            self.setupLockedFBAvphi(d2aB, a2dlockpoints, I)
+            return SweepEngine(name, setter, vals, self.c.getNewData, self.lockedFBAModDepth,
+                               acquisition=dict(delaySeconds=0.1, minimumNumPoints=4096*6, sendMode=2),
+                               checkpoint=get_savepath(f"last_{name}_sweep.npz"), settleS=settleS,
+                               discardData=discardData).run()
+        finally:
+            self.mm.setFluxJumpThreshold(oldfluxjumpthreshold)
 
+    def sweepBAD16FBA(self):
         vals = np.arange(0, 15000, 1000)
-        modDepths = np.zeros((self.c.ncol, self.c.nrow, len(vals)))
-
-        for i in range(len(vals)):
-            val = vals[i]
-            self.mm.setbaddacHighsSame(val)
-            lfbatriangle, lfbasigsup, lfbasigsdown = self.lockedFBAvphi_colsettings(
-                d2aB, a2dlockpoints, I)
-            lfbastats = vphistats.vPhiStats(lfbatriangle, lfbasigsup)
-
-            modDepths[:, :, i] = lfbastats["modDepth"]
-
-        self.mm.setFluxJumpThreshold(oldfluxjumpthreshold)
+        sweep = self.lockedFBAvphiSweep("BAD16_high", self.mm.setbaddacHighsSame, vals)
 
         plots = ColPlots(self, self.c.ncol, self.c.nrow)
-        plots.plot(vals, modDepths)
+        plots.plot(sweep.values, sweep["modDepth"])
         plots.title("FBA vphis, sweep BAD16 high")
         plots.xlabel("BAD16 high")
         plots.ylabel("FBA modDepth")
@@ -1110,65 +981,32 @@ class BiasSweeper(QWidget):
         # setup for vphi, ignore first datadata
         # probably there are command left in serial que after big cahnges
         data = self.c.getNewData(0.1, minimumNumPoints=4096*6)
-        fbbtriangle, fbbsigsup, fbbsigsdown = analysis.conditionvphis(
-            data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
 
-        modDepths = np.zeros((self.c.ncol, self.c.nrow, len(vals)))
-        for i in range(len(vals)):
-            val = vals[i]
-            self.setSAB(val)
-            data = self.c.getNewData(0.1, minimumNumPoints=4096*6)
+        def reduce(data):
             fbbtriangle, fbbsigsup, fbbsigsdown = analysis.conditionvphis(
                 data[:, :, :, 1], data[:, :, :, 0], tridwell, tristeps, tristepsize)
-            fbbstats = vphistats.vPhiStats(fbbtriangle, fbbsigsup)
-            modDepths[:, :, i] = fbbstats["modDepth"]
+            return {"modDepth": vphistats.vPhiStats(fbbtriangle, fbbsigsup)["modDepth"]}
+        sweep = SweepEngine("SAb", self.setSAB, vals, self.c.getNewData, reduce,
+                            acquisition=dict(delaySeconds=0.1, minimumNumPoints=4096*6),
+                            checkpoint=get_savepath("last_SAb_sweep.npz")).run()
 
         plots = ColPlots(self, self.c.ncol, 1)
-        plots.plot(vals, modDepths)
+        plots.plot(sweep.values, sweep["modDepth"])
         plots.title("FBA vphis, sweep SAb")
         plots.xlabel("SAb")
         plots.ylabel("FBB modDepth")
         plots.show()
 
     def sweepSQ1FBA(self):
-        self.c.client.setMixToZero()
-        fbbtriangle, fbbsigsup, fbbsigsdown = self.FBBvphi_from_file()
-        fbbstats = vphistats.vPhiStats(fbbtriangle, fbbsigsup)
-
-        # get settings for locked vphis from those vphis
-        a2dlockpoints = np.median(fbbstats['midPoint'], axis=1)
-        d2aB = np.ones(len(a2dlockpoints))*8000
-        # choose I for fbb such you get 10 for nsamp = 4, and 5 for nsamp =8
-        I = np.ones(len(a2dlockpoints))*int(round(10*4/float(self.mm.NSAMP)))
-        # set the ARL setting to 10 % more than a fbb vphi
-        oldfluxjumpthreshold = self.mm.flux_jump_threshold
-        self.mm.setFluxJumpThreshold(np.median(fbbstats["periodXUnits"])*1.1)
-
         vals = np.arange(0, 8000, 600)
         self.setSQ1(vals[0])
         time.sleep(.2)  # go to the first value, and wait a while
         # this avoid settling time issues from the potentially large change
-
-        modDepths = np.zeros((self.c.ncol, self.c.nrow, len(vals)))
-        for i in range(len(vals)):
-            val = vals[i]
-            self.setSQ1(val)
-            data = self.c.getNewData(0.1, minimumNumPoints=4096*2)
-            lfbatriangle, lfbasigsup, lfbasigsdown = self.lockedFBAvphi_colsettings(
-                d2aB, a2dlockpoints, I)
-            lfbastats = vphistats.vPhiStats(lfbatriangle, lfbasigsup)
-            modDepths[:, :, i] = lfbastats["modDepth"]
-
-#             plots = ColPlots(self,self.c.ncol,self.c.nrow)
-#             plots.plot(lfbatriangle,lfbasigsup)
-#             plots.title("locked fba vphis vs SQ1b, val =%g"%val)
-#             plots.xlabel("fba")
-#             plots.ylabel("fbb (locked signal)")
-#             plots.show()
-        self.mm.setFluxJumpThreshold(oldfluxjumpthreshold)
+        # each step settles and throws away one acquisition after the bias change before measuring
+        sweep = self.lockedFBAvphiSweep("SQ1b", self.setSQ1, vals, settleS=0.1, discardData=True)
 
         plots = ColPlots(self, self.c.ncol, self.c.nrow)
-        plots.plot(vals, modDepths)
+        plots.plot(sweep.values, sweep["modDepth"])
         plots.title("FBA vphis, sweep SQ1")
         plots.xlabel("SQ1")
         plots.ylabel("FBA modDepth")
@@ -1185,28 +1023,100 @@ class BiasSweeper(QWidget):
             towerchannel.dacspin.setValue(val)
 
 
+class GuiThreadProxy:
+    """forwards attribute reads and method calls to obj on the gui thread, blocking until they return, so
+    code on a worker thread can use objects that touch widgets, like the MuxMaster"""
+
+    def __init__(self, obj):
+        self._obj = obj
+        self._caller = GuiThreadCaller()
+
+    def __getattr__(self, name):
+        value = self._caller(getattr, self._obj, name)
+        if callable(value):
+            return lambda *args, **kwargs: self._caller(value, *args, **kwargs)
+        return value
+
+
+class GuiThreadCaller(QtCore.QObject):
+    """create on the gui thread, calling it from any thread runs f there and returns or raises its result"""
+    _call = QtCore.pyqtSignal(object)
+
+    def __init__(self):
+        super(type(self), self).__init__()
+        self._call.connect(self._run, QtCore.Qt.BlockingQueuedConnection)
+
+    def _run(self, job):
+        job()
+
+    def __call__(self, f, *args, **kwargs):
+        if QtCore.QThread.currentThread() is self.thread():
+            return f(*args, **kwargs)
+        out = {}
+
+        def job():
+            try:
+                out["value"] = f(*args, **kwargs)
+            except Exception as ex:
+                out["error"] = ex
+        self._call.emit(job)
+        if "error" in out:
+            raise out["error"]
+        return out["value"]
+
+
+class TuneWorker(QtCore.QThread):
+    """runs engine.fullTune(), or engine.retune(channels, previous) with channels, the signals are delivered on
+    the gui thread"""
+    progressed = QtCore.pyqtSignal(str, float, object)
+    tuned = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent, engine, channels=None, previous=None):
+        super(type(self), self).__init__(parent)
+        self.engine = engine
+        self.engine.progress = self.progressed.emit
+        self.channels, self.previous = channels, previous
+
+    def run(self):
+        try:
+            if self.channels is None:
+                result = self.engine.fullTune()
+            else:
+                result = self.engine.retune(self.channels, self.previous)
+        except Exception as ex:
+            import traceback
+            print("TRACEBACK")
+            print(traceback.format_exc())
+            print("TRACEBACK DONE")
+            self.failed.emit(ex)
+            return
+        self.tuned.emit(result)
+
+
 class OnePlot(QDialog):
     def __init__(self, parent):
         super(type(self), self).__init__(parent)
-        self.figure = plt.figure()
+        self.figure = Figure()
         self.canvas = FigureCanvas(self.figure)
         self.toolbar = NavigationToolbar(self.canvas, self)
         layout = QVBoxLayout()
         layout.addWidget(self.canvas)
         layout.addWidget(self.toolbar)
         self.setLayout(layout)
-        self.ax = plt.gca()
+        self.ax = self.figure.add_subplot()
 
 
 class ColPlots(QDialog):
+    """a ColFigure in a dialog, plotting draws the canvas right away"""
+
     def __init__(self, parent, ncol, nrow):
         super(type(self), self).__init__(parent)
         self.ncol = ncol
         self.nrow = nrow
-        self.numXSubplots = int((ncol+1)/2.0)
-        self.numYSubplots = 1+int(ncol > 1)
-        self.figure = plt.figure(
-            figsize=(self.numXSubplots*6, self.numYSubplots*4))
+        self.cols = ColFigure.offscreen(ncol, nrow)
+        self.figure = self.cols.figure
+        self.axes = self.cols.axes
         self.canvas = FigureCanvas(self.figure)
         self.titlelabel = QLabel("")
         self.toolbar = NavigationToolbar(self.canvas, self)
@@ -1216,8 +1126,6 @@ class ColPlots(QDialog):
         layout.addWidget(self.toolbar)
         self.setLayout(layout)
 
-        self.createaxes()
-        self.plottitle()
         self.xlabel("triangle")
         self.ylabel("err")
         self.title("joint title")
@@ -1225,112 +1133,54 @@ class ColPlots(QDialog):
         cid = self.canvas.mpl_connect('pick_event', self.onclick)
 
     def onclick(self, event):
-        log.info(event.artist.get_label()+" was clicked")
-
-    def createaxes(self):
-        self.axes = []
-        for col in range(self.ncol):
-            ax = plt.subplot(self.numYSubplots, self.numXSubplots, col+1)
-            self.axes.append(ax)
+        picked = self.cols.picked(event)
+        if picked is not None:
+            log.info(picked+" was clicked")
 
     def xlabel(self, s):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            if col >= self.numXSubplots*(self.numYSubplots-1):
-                ax.set_xlabel(s)
+        self.cols.xlabel(s)
 
     def ylabel(self, s):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            if col % self.numXSubplots == 0:
-                ax.set_ylabel(s)
+        self.cols.ylabel(s)
 
     def plottitle(self, s=[""]*32):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            ax.set_title(("col %g" % col)+s[col])
+        self.cols.plottitle(s)
 
     def plot(self, x, y):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            for row in range(self.nrow):
-                ax.plot(x, y[col, row, :], ".-", picker=5,
-                        label="col %g, row%g" % (col, row))
+        self.cols.plot(x, y)
         self.draw()
 
     def plotbigx(self, x, y):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            for row in range(self.nrow):
-                ax.plot(x[col, row, :], y[col, row, :], picker=5,
-                        label="col %g, row%g" % (col, row))
+        self.cols.plotbigx(x, y)
         self.draw()
 
     def semilogy(self, x, y):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            for row in range(self.nrow):
-                ax.semilogy(x, y[col, row, :], ".", picker=5,
-                            label="col %g, row%g" % (col, row))
+        self.cols.semilogy(x, y)
         self.draw()
 
     def semilogx(self, x, y):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            for row in range(self.nrow):
-                ax.semilogx(x, y[col, row, :], picker=5,
-                            label="col %g, row%g" % (col, row))
+        self.cols.semilogx(x, y)
         self.draw()
 
     def plotdiffx(self, x, y):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            for row in range(self.nrow):
-                ax.plot(x[col], y[col, row, :], ".", picker=5,
-                        label="col %g, row%g" % (col, row))
+        self.cols.plotdiffx(x, y)
         self.draw()
 
     def title(self, s=""):
         self.titlelabel.setText(s)
 
     def xlim(self, xlims):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            ax.set_xlim(xlims)
+        self.cols.xlim(xlims)
 
     def ylim(self, ylims):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            ax.set_ylim(ylims)
+        self.cols.ylim(ylims)
 
     def cla(self):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            ax.clear()
+        self.cols.cla()
 
     def grid(self, x=True):
-        for col in range(self.ncol):
-            ax = self.axes[col]
-            ax.grid(x)
+        self.cols.grid(x)
 
     def draw(self):
         self.canvas.draw()
         QApplication.processEvents()  # process gui events
-
-
-def writeMixFile(fname, mix):
-    log.info(('writing mix to %s' % fname))
-    ncol, nrow = mix.shape
-    f = open(fname, 'w')
-    for col in range(ncol):
-        for row in range(nrow):
-            errorChan = col*2*nrow+row*2
-            fbChan = errorChan+1
-            f.write('CH%d_decimateAvgFlag: 1\nCH%d_decimateFlag: 0\nCH%d_mixFlag: 1\nCH%d_mixInversionFlag: 0\n' % (
-                errorChan, errorChan, errorChan, errorChan))
-            f.write('CH%d_decimateAvgFlag: 1\n' % fbChan)
-            f.write('CH%d_decimateFlag: 0\n' % fbChan)
-            f.write('CH%d_mixFlag: %d\n' % (fbChan, 1))  # 0 disables mix
-            f.write('CH%d_mixInversionFlag: 0\n' % fbChan)
-            f.write('CH%d_mixLevel: %f\n' % (fbChan, mix[col, row]))
-    f.close()
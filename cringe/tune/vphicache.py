@@ -0,0 +1,57 @@
+"""conditioned vphis and their stats from past tunes, one file per tune stage and column
+
+an entry is keyed by a fingerprint of the crate configuration (MuxMaster.tuneConfiguration, eg the bias DACs,
+sequence length, NSAMP and SETT), the stage and that column's inputs to the stage (triangle params and the
+values the rows were set to). any change gives a new fingerprint, so the entry is not used and is replaced
+the next time that column is measured. entries older than max_age_s are not used either.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from cringe import log
+from cringe.shared import get_savepath, jsonable
+
+
+class VphiCache:
+    def __init__(self, directory=None, max_age_s=600):
+        self.directory = get_savepath("vphi_cache") if directory is None else directory
+        self.max_age_s = max_age_s
+        os.makedirs(self.directory, exist_ok=True)
+
+    def fingerprint(self, config, stage, col, inputs=None):
+        description = json.dumps({"config": config, "stage": stage, "col": col, "inputs": inputs},
+                                 sort_keys=True, default=jsonable)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def path(self, stage, col):
+        return os.path.join(self.directory, f"{stage.replace(' ', '_')}_col{col}.npz")
+
+    def load(self, stage, col, fingerprint):
+        """(triangle, sigsup, stats) for one column, sigsup is (row, step) and stats values are (row,),
+        None unless there is an entry with this fingerprint younger than max_age_s"""
+        path = self.path(stage, col)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as f:
+            if str(f["fingerprint"]) != fingerprint:
+                log.debug(f"vphi cache: {stage} col {col} configuration changed")
+                return None
+            age_s = time.time()-float(f["time"])
+            if age_s > self.max_age_s:
+                log.debug(f"vphi cache: {stage} col {col} is {age_s:.0f} s old")
+                return None
+            stats = {k[len("stat_"):]: f[k] for k in f.files if k.startswith("stat_")}
+            return f["triangle"], f["sigsup"], stats
+
+    def save(self, stage, col, fingerprint, triangle, sigsup, stats):
+        arrays = {"stat_"+k: v for k, v in stats.items()}
+        np.savez(self.path(stage, col), fingerprint=fingerprint, time=time.time(), triangle=triangle,
+                 sigsup=sigsup, **arrays)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.directory, name))
@@ -57,31 +57,200 @@ def vPhiStatsSingle(triangle, signal, fracFromBottom=0.5):
 
 
 def vPhiStats(triangle, signals, fracFromBottom=0.5):
-    stats = {}
+    """vPhiStatsSingle for every (col, row) of signals at once, returns a dict of (col, row) arrays.
+    channels with fewer than 2 rising or 2 falling crossings are logged and left as zeros"""
     statnames = ["periodInds", "periodXUnits", "positiveCrossingSlope", "negativeCrossingSlope",
                  "positiveCrossingFirstX", "negativeCrossingFirstX", "firstMinimumInd",
                  "firstMinimumX", "firstMinimumY", "modDepth", "midPoint", "crossingPoint",
                  "firstMaximumInd", "firstMaximumX", "firstMaximumY"]
     log.debug("vphistats:signals.shape",signals.shape)
-    for statname in statnames:
-        stats[statname] = np.zeros((signals.shape[0], signals.shape[1]))
-    for col in range(signals.shape[0]):
-        for row in range(signals.shape[1]):
-            try:
-                stattuple = vPhiStatsSingle(triangle, signals[col,row], fracFromBottom)
-                (periodInds, periodXUnits, positiveCrossingSlope, negativeCrossingSlope,
-    positiveCrossingFirstX, negativeCrossingFirstX, firstMinimumInd,
-    firstMinimumX, firstMinimumY, modDepth, midPoint, crossingPoint,
-    firstMaximumInd, firstMaximumX, firstMaximumY) = stattuple
-                for i, statname in enumerate(statnames):
-                    stats[statname][col, row] = stattuple[i]
-            except AssertionError as ex:
-                log.info("AssertionErrors col %d, row %d"%(col,row))
-                # we really shouldn't be using try for flow control here
+    ncol, nrow, n = signals.shape
+    signal = np.asarray(signals, dtype="float64").reshape(ncol*nrow, n)
+    triangle = np.asarray(triangle)
+    sMax = np.amax(signal, axis=-1)
+    sMin = np.amin(signal, axis=-1)
+    modDepth = sMax - sMin
+    midPoint = (sMax + sMin)/2.0
+    crossingPoint = sMin + fracFromBottom*modDepth
+
+    # find crossings, for a crossing between i and i+1 the interpolation uses the step into
+    # pastCrossingIndex, which is i+1 going down and i going up, as in vPhiStatsSingle
+    above = signal > crossingPoint[:, np.newaxis]
+    i = np.arange(n - 1)
+    pastCrossingIndex = np.where(above[:, :-1], i + 1, i)
+    crossing = (above[:, :-1] != above[:, 1:]) & (pastCrossingIndex > 1) & (pastCrossingIndex < n - 1)
+    triangleStepSize = triangle[1] - triangle[0]
+    ynow = np.take_along_axis(signal, pastCrossingIndex, axis=-1)
+    dy = ynow - np.take_along_axis(signal, pastCrossingIndex - 1, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        interpolatedCrossingInds = pastCrossingIndex - (ynow - crossingPoint[:, np.newaxis])/dy
+        slopes = dy/float(triangleStepSize)
+    pos = crossing & (slopes > 0)
+    neg = crossing & (slopes < 0)
+    npos, nneg = np.sum(pos, axis=-1), np.sum(neg, axis=-1)
+    ok = (npos >= 2) & (nneg >= 2)
+
+    firstpos, lastpos = np.argmax(pos, axis=-1), n - 2 - np.argmax(pos[:, ::-1], axis=-1)
+    firstneg = np.argmax(neg, axis=-1)
+
+    def at(a, inds):
+        return np.take_along_axis(a, inds[:, np.newaxis], axis=-1)[:, 0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        periodInds = (at(interpolatedCrossingInds, lastpos) - at(interpolatedCrossingInds, firstpos))/(npos - 1)
+        positiveCrossingSlope = np.sum(slopes, axis=-1, where=pos)/npos
+        negativeCrossingSlope = np.sum(slopes, axis=-1, where=neg)/nneg
+    positiveCrossingFirstX = triangle[0] + triangleStepSize*at(interpolatedCrossingInds, firstpos)
+    negativeCrossingFirstX = triangle[0] + triangleStepSize*at(interpolatedCrossingInds, firstneg)
+
+    # find bottom
+    # look only in the first period
+    nfirst = np.ceil(np.where(ok, periodInds, n))[:, np.newaxis]
+    inoneperiod = np.arange(n) < nfirst
+    firstMinimumInd = np.argmin(np.where(inoneperiod, signal, np.inf), axis=-1)
+    firstMaximumInd = np.argmax(np.where(inoneperiod, signal, -np.inf), axis=-1)
+
+    values = [periodInds, periodInds*triangleStepSize, positiveCrossingSlope, negativeCrossingSlope,
+              positiveCrossingFirstX, negativeCrossingFirstX, firstMinimumInd,
+              triangle[firstMinimumInd], at(signal, firstMinimumInd), modDepth, midPoint, crossingPoint,
+              firstMaximumInd, triangle[firstMaximumInd], at(signal, firstMaximumInd)]
+    stats = {}
+    for statname, value in zip(statnames, values):
+        stats[statname] = np.where(ok, value, 0).reshape(ncol, nrow).astype("float64")
+    for chan in np.nonzero(~ok)[0]:
+        col, row = divmod(int(chan), nrow)
+        log.info("AssertionErrors col %d, row %d"%(col,row))
 
     return stats
 
 
+def vPhiStatsFFT(triangle, signals, fracFromBottom=0.5, nharmonics=3, niter=2, ngrid=256):
+    """the same stats as vPhiStats from a periodic model fit to every (col, row) at once, no crossing search
+    in the noisy data. the fundamental comes from the peak of a real FFT along the triangle axis, refined in
+    closed form from the neighbouring bins, then a few Gauss-Newton steps fit an offset, nharmonics harmonics
+    and the period to each channel. the stats are read off the model over its first period.
+    also returns "quality", the fraction of the signal variance the model explains (0 when there is no
+    modulation), and "harmonicFraction", the amplitude in the harmonics over that in the fundamental."""
+    ncol, nrow, n = signals.shape
+    assert n >= 8, "need a few points per channel"
+    y = np.asarray(signals, dtype="float64").reshape(ncol*nrow, n)
+    triangle = np.asarray(triangle, dtype="float64")
+    triangleStepSize = triangle[1] - triangle[0]
+    ymean = np.mean(y, axis=-1, keepdims=True)
+    y = y - ymean
+    t = np.arange(n) - (n - 1)/2.0  # index units, centered so the period and phase decouple
+
+    # peak bin of the fundamental then Candan's estimator for the fraction of a bin, skip dc and nyquist
+    spec = np.fft.rfft(y, axis=-1)
+    k = np.argmax(np.abs(spec[:, 1:-1]), axis=-1) + 1
+    xm, x0, xp = [np.take_along_axis(spec, (k + d)[:, np.newaxis], axis=-1)[:, 0] for d in (-1, 0, 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = np.tan(np.pi/n)/(np.pi/n)*np.real((xm - xp)/(2*x0 - xm - xp))
+    omega = 2*np.pi*(k + np.nan_to_num(np.clip(delta, -0.5, 0.5)))/n
+
+    h = np.arange(1, nharmonics + 1)
+
+    def harmonics(omega, t):
+        """1 then cos and sin of h*omega*t for each harmonic h, (chan, len(t), 1+2*nharmonics), by angle
+        addition from the fundamental"""
+        out = np.empty((len(omega), len(t), 1 + 2*nharmonics))
+        out[..., 0] = 1
+        c, s = out[..., 1:nharmonics + 1], out[..., nharmonics + 1:]
+        c1, s1 = np.cos(omega[:, np.newaxis]*t), np.sin(omega[:, np.newaxis]*t)
+        c[..., 0], s[..., 0] = c1, s1
+        for i in range(1, nharmonics):
+            c[..., i] = c[..., i - 1]*c1 - s[..., i - 1]*s1
+            s[..., i] = s[..., i - 1]*c1 + c[..., i - 1]*s1
+        return out
+
+    def fit(omega):
+        a = harmonics(omega, t)
+        p = _solve_normal(a, y)
+        resid = y - (a @ p[..., np.newaxis])[..., 0]
+        return p, resid, a
+
+    for _ in range(niter):
+        p, resid, a = fit(omega)
+        # the change in the model with omega, at fixed coefficients
+        c, s = a[..., 1:nharmonics + 1], a[..., nharmonics + 1:]
+        dmodel = t*((c*p[:, np.newaxis, nharmonics + 1:] - s*p[:, np.newaxis, 1:nharmonics + 1]) @ h)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.sum(dmodel*resid, axis=-1)/np.sum(dmodel*dmodel, axis=-1)
+        # never move by more than a bin, the fft already got it that close
+        omega = omega + np.clip(np.nan_to_num(step), -np.pi/n, np.pi/n)
+    p, resid, a = fit(omega)
+    cos_coef, sin_coef = p[:, 1:nharmonics + 1], p[:, nharmonics + 1:]
+    power = np.sum(y*y, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        quality = np.where(power > 0, 1 - np.sum(resid*resid, axis=-1)/power, 0)
+        amps = np.hypot(cos_coef, sin_coef)
+        harmonicFraction = np.sqrt(np.sum(amps[:, 1:]**2, axis=-1))/amps[:, 0]
+
+    # the model over its first period, starting at the first sample
+    periodInds = 2*np.pi/omega
+    # the grid includes the wrap point
+    g = harmonics(np.array([2*np.pi]), np.arange(ngrid + 1)/ngrid)[0]
+    c0, s0 = np.split(harmonics(omega, t[:1])[:, 0, 1:], 2, axis=-1)
+    # rotate the coefficients to the first sample so the grid is the same phases for every channel
+    coef_at0 = np.hstack([p[:, :1], cos_coef*c0 + sin_coef*s0, sin_coef*c0 - cos_coef*s0])
+    model = coef_at0 @ g.T + ymean
+    iMin, iMax = np.argmin(model[:, :-1], axis=-1), np.argmax(model[:, :-1], axis=-1)
+    sMin = np.take_along_axis(model, iMin[:, np.newaxis], axis=-1)[:, 0]
+    sMax = np.take_along_axis(model, iMax[:, np.newaxis], axis=-1)[:, 0]
+    modDepth = sMax - sMin
+    midPoint = (sMax + sMin)/2.0
+    crossingPoint = sMin + fracFromBottom*modDepth
+
+    def first_crossing(rising):
+        above = model > crossingPoint[:, np.newaxis]
+        crossing = (~above[:, :-1] & above[:, 1:]) if rising else (above[:, :-1] & ~above[:, 1:])
+        j = np.argmax(crossing, axis=-1)
+        m0 = np.take_along_axis(model, j[:, np.newaxis], axis=-1)[:, 0]
+        m1 = np.take_along_axis(model, j[:, np.newaxis] + 1, axis=-1)[:, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.nan_to_num((crossingPoint - m0)/(m1 - m0))
+        tc = t[0] + periodInds*(j + frac)/ngrid
+        cphase = omega[:, np.newaxis]*h*tc[:, np.newaxis]
+        slope = np.sum(h*omega[:, np.newaxis]*(-cos_coef*np.sin(cphase) + sin_coef*np.cos(cphase)), axis=-1)
+        return tc - t[0], slope/triangleStepSize, np.any(crossing, axis=-1)
+
+    posInds, positiveCrossingSlope, hasPos = first_crossing(True)
+    negInds, negativeCrossingSlope, hasNeg = first_crossing(False)
+    quality = np.where(hasPos & hasNeg & (modDepth > 0), quality, 0)
+    firstMinimumInds = periodInds*iMin/ngrid
+    firstMaximumInds = periodInds*iMax/ngrid
+
+    stats = {
+        "periodInds": periodInds,
+        "periodXUnits": periodInds*triangleStepSize,
+        "positiveCrossingSlope": positiveCrossingSlope,
+        "negativeCrossingSlope": negativeCrossingSlope,
+        "positiveCrossingFirstX": triangle[0] + triangleStepSize*posInds,
+        "negativeCrossingFirstX": triangle[0] + triangleStepSize*negInds,
+        "firstMinimumInd": np.round(firstMinimumInds),
+        "firstMinimumX": triangle[0] + triangleStepSize*firstMinimumInds,
+        "firstMinimumY": sMin,
+        "modDepth": modDepth,
+        "midPoint": midPoint,
+        "crossingPoint": crossingPoint,
+        "firstMaximumInd": np.round(firstMaximumInds),
+        "firstMaximumX": triangle[0] + triangleStepSize*firstMaximumInds,
+        "firstMaximumY": sMax,
+        "quality": quality,
+        "harmonicFraction": np.nan_to_num(harmonicFraction),
+    }
+    return {statname: value.reshape(ncol, nrow) for statname, value in stats.items()}
+
+
+def _solve_normal(a, y):
+    """least squares coefficients for each channel, a is (chan, n, m) and y is (chan, n)"""
+    ata = np.swapaxes(a, -1, -2) @ a
+    aty = (np.swapaxes(a, -1, -2) @ y[..., np.newaxis])[..., 0]
+    # a flat channel makes the harmonics degenerate, a tiny ridge keeps the solve finite
+    ata += 1e-9*np.trace(ata, axis1=-2, axis2=-1)[:, np.newaxis, np.newaxis]*np.eye(a.shape[-1])
+    return np.linalg.solve(ata, aty[..., np.newaxis])[..., 0]
+
+
 def testVPhiStats():
     triangle = np.arange(0, 2500, 10)
     signal = np.zeros((2, 2, len(triangle)), dtype="int64")
@@ -1,8 +1,20 @@
-from .iv_data import IVCurveColumnData, IVTempSweepData, IVCircuit, IVColdloadSweepData, g_fit
+from .iv_data import (
+    IVCurveColumnData,
+    IVTempSweepData,
+    IVCircuit,
+    IVColdloadSweepData,
+    IVSweepCheckpoint,
+    BiasStepData,
+    g_fit,
+    bin_vs_temp,
+)
 from .iv_utils import (
     IVPointTaker,
     IVCurveTaker,
     IVTempSweeper,
+    IVTempRampSweeper,
     IVColdloadSweeper,
     sparse_then_fine_dacs,
+    AdaptiveDacPlanner,
+    BiasStepTaker,
 )
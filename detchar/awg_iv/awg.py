@@ -87,13 +87,6 @@ def make_ramp_dwell_ramp_profile(n_ramp, n_dwell, blip_delta):
     profile = np.hstack([start_dwell, _ramp, dwell, _ramp[::-1], start_dwell])
     return profile
 
-def add_flux_jumps(fb, phi0_fb, fb_step_threshold):
-    """return an array like fb, but with flux jumps resolved and one value removed from the end
-    method: find indicies with np.diff(fb) greater ro less than fb_step_threshold
-    and add phi0 units with the correct sign"""
-    out = fb[1:]+np.cumsum(np.diff(fb)<-fb_step_threshold)*phi0_fb
-    out -= np.cumsum(np.diff(fb)>fb_step_threshold)*phi0_fb
-    return out
 
 last_flux_jump_threshold_dac_units = None
 def set_arl_params(flux_jump_threshold_dac_units):
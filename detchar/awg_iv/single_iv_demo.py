@@ -8,6 +8,7 @@ from cringe.cringe_control import CringeControl
 import time
 import mass
 from mass.mathstat.fitting import fit_kink_model
+from detchar.flux_jump import unwrap_flux_jumps
 plt.ion()
 plt.close("all")
 
@@ -79,13 +80,6 @@ def make_ramp_dwell_ramp_profile(n_ramp, n_dwell, blip_delta):
     profile = np.hstack([start_dwell, _ramp, dwell, _ramp[::-1], start_dwell])
     return profile
 
-def add_flux_jumps(fb, phi0_fb, fb_step_threshold):
-    """return an array like fb, but with flux jumps resolved and one value removed from the end
-    method: find indicies with np.diff(fb) greater ro less than fb_step_threshold
-    and add phi0 units with the correct sign"""
-    out = fb[1:]+np.cumsum(np.diff(fb)<-fb_step_threshold)*phi0_fb
-    out -= np.cumsum(np.diff(fb)>fb_step_threshold)*phi0_fb
-    return out
 
 ch2_setup()
 ch2_setvolt(0.0)
@@ -116,7 +110,7 @@ row=1
 fb = data[col, row, :, 1]
 err = data[col, row, :, 0]
 fb_offset = fba_offsets[col,row]
-fb_fixed = add_flux_jumps(fb, phi0_fb = 1754, fb_step_threshold=1300)
+fb_fixed = unwrap_flux_jumps(fb, phi0_fb = 1754, fb_step_threshold=1300)
 
 t_ms = c.samplePeriod*np.arange(len(fb))*1000
 t_ms_first_trigger_after_first_sample = (time_nano_after_trigger-time_nano_first_sample)*1e-6
@@ -125,7 +119,7 @@ t_ms_first_trigger_after_first_sample = (time_nano_after_trigger-time_nano_first
 plt.figure(figsize=(12,8))
 ax1=plt.subplot(211)
 plt.plot(t_ms,fb, label="raw")
-plt.plot(t_ms[:-1],fb_fixed, label="fixed")
+plt.plot(t_ms,fb_fixed, label="fixed")
 plt.axhline(fb_offset, color="cyan")
 plt.axhline(fb_offset+flux_jump_threshold_dac_units, color="cyan")
 plt.axhline(fb_offset-flux_jump_threshold_dac_units, color="cyan")
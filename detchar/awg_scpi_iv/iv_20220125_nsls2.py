@@ -5,6 +5,7 @@ from dataclasses import dataclass
 from typing import Any
 import time
 import pickle
+from detchar.flux_jump import unwrap_flux_jumps
 
 plt.ion()
 plt.close("all")
@@ -55,7 +56,7 @@ def getIVs():
         fb = data[col, row, :, 1]
         err = data[col, row, :, 0]
         # fb_offset = fba_offsets[col,row]
-        fb_fixed = awg.add_flux_jumps(fb, phi0_fb = phi0_fb, 
+        fb_fixed = unwrap_flux_jumps(fb, phi0_fb = phi0_fb, 
         fb_step_threshold=int(phi0_fb*0.95))
 
         t_ms = awg.c.samplePeriod*np.arange(len(fb))*1000
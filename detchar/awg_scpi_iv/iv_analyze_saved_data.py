@@ -1,10 +1,10 @@
 import pickle
 from dataclasses import dataclass
 from typing import Any
-import mass
-from mass.mathstat.fitting import fit_kink_model
 import numpy as np
 import pylab as plt
+from detchar.flux_jump import unwrap_flux_jumps
+from detchar.kink_fit import find_kinks
 plt.ion()
 plt.close("all")
 
@@ -39,7 +39,7 @@ class RawAWGRowIVData:
         return np.sign(self.vbias[len(self.vbias)//2])
     
     def get_fb_ic_fixed(self):
-        fb_fixed = add_flux_jumps(self.fb, phi0_fb = self.phi0_fb, 
+        fb_fixed = unwrap_flux_jumps(self.fb, phi0_fb = self.phi0_fb, 
                                   fb_step_threshold=self.phi0_fb*0.8)
         ic_fix_ind = np.where(np.abs(self.err)>500)[0][0]
         fb_ic_fixed = fb_fixed[:]-fb_fixed[0]
@@ -52,33 +52,18 @@ class RawAWGRowIVData:
 data = pickle.load(open("last_ivs_vs_field.pkl","rb"))
 
 
-def add_flux_jumps(fb, phi0_fb, fb_step_threshold):
-    """return an array like fb, but with flux jumps resolved and one value removed from the end
-    method: find indicies with np.diff(fb) greater ro less than fb_step_threshold
-    and add phi0 units with the correct sign"""
-    out = fb[1:]+np.cumsum(np.diff(fb)<-fb_step_threshold)*phi0_fb
-    out -= np.cumsum(np.diff(fb)>fb_step_threshold)*phi0_fb
-    return out
-
-def find_kink_approx(fb, delta_threshold = 1000, pointstep = 10):
-    for i in range(10, len(fb)):
-        a = fb[i]-fb[i-pointstep]
-        b = fb[pointstep] - fb[i]
-        if np.abs(b)-np.abs(a) > delta_threshold:
-            break
-    return i
 
 def find_kink(fb_ic_fixed, polarity):
-    kink_ind_approx = find_kink_approx(fb_ic_fixed)
-    a = kink_ind_approx-300
-    b = kink_ind_approx+300
-    model, (kbest,a,b,kink_c), X2 = fit_kink_model(np.arange(a,b),
-                                fb_ic_fixed[a:b])
-    kink_ind = int(kbest)
+    kink_ind = int(find_kinks(fb_ic_fixed)[0])
     kink_ind += 2500 # hard coded correction... BAD
     # assert np.sign(b) == -np.sign(polarity), "kink model found wrong polarity"
     return kink_ind
 
+def find_kinks_all_rows(ivs):
+    """kink index of every RawAWGRowIVData in ivs, eg data.ivs_pos[ind_fc], all rows in one fit"""
+    fb_ic_fixed = np.array([iv.get_fb_ic_fixed()[0] for iv in ivs])
+    return find_kinks(fb_ic_fixed)+2500 # same correction as find_kink
+
 def count_zeros(x):
     for i in range(len(x)):
         if x[i] != 0:
@@ -16,13 +16,6 @@ from instruments import BlueBox
 import detchar
 plt.ion()
 
-def add_flux_jumps(fb, phi0_fb=1670, fb_step_threshold=1000):
-    """return an array like fb, but with flux jumps resolved and one value removed from the end
-    method: find indicies with np.diff(fb) greater ro less than fb_step_threshold
-    and add phi0 units with the correct sign"""
-    out = fb[:-1]+np.cumsum(np.diff(fb)<-fb_step_threshold)*phi0_fb
-    out -= np.cumsum(np.diff(fb)>fb_step_threshold)*phi0_fb
-    return out
 
 # hardware ineraction
 ec = EasyClient()
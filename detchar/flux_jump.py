@@ -0,0 +1,188 @@
+""" undo the flux jumps the autorelock (ARL) puts in feedback timestreams
+
+the ARL resets the feedback by one phi0 whenever it runs out of range, so a trace that keeps moving in one
+direction is wrapped into a band about one phi0 wide. a step between adjacent frames bigger than
+fb_step_threshold is taken to be a reset, and phi0_fb is added or subtracted from every later frame.
+
+find_arl_resets and ArlResetDetector find the frames where the ARL reset, from the feedback leaving the band
+db_offset +/- flux_jump_threshold_dac_units, as in detchar/db_timestream/demo_lookback.py.
+
+works on arrays of any shape with frames along the last axis, eg (col, row, frame) from getNewData.
+phi0_fb, fb_step_threshold and the ARL settings may be scalars or one value per channel, eg shape (col, row).
+"""
+import numpy as np
+
+
+def unwrap_flux_jumps(fb, phi0_fb, fb_step_threshold=None):
+    """return fb as float64 with flux jumps resolved along the last axis, the same shape as fb
+    fb_step_threshold defaults to 0.8*phi0_fb"""
+    return FluxJumpUnwrapper(phi0_fb, fb_step_threshold).unwrap(fb)
+
+
+class FluxJumpUnwrapper:
+    """unwrap a stream of chunks, each (..., nframes), as if they were one long array.
+    the last frame and the jump count of each channel carry over from one chunk to the next
+
+    unwrapper = FluxJumpUnwrapper(phi0_fb=1670)
+    for data in chunks:
+        fb = unwrapper.unwrap(data[:, :, :, 1])
+    """
+
+    def __init__(self, phi0_fb, fb_step_threshold=None):
+        self.phi0_fb = np.asarray(phi0_fb, dtype="float64")
+        if fb_step_threshold is None:
+            fb_step_threshold = 0.8 * self.phi0_fb
+        self.fb_step_threshold = np.asarray(fb_step_threshold, dtype="float64")
+        self.reset()
+
+    def reset(self):
+        self._last_fb = None
+        self.njumps = None  # net jumps so far for each channel, positive means phi0 was added
+
+    def unwrap(self, fb):
+        fb = np.asarray(fb, dtype="float64")
+        channel_shape = fb.shape[:-1]
+        phi0_fb = np.broadcast_to(self.phi0_fb, channel_shape)[..., np.newaxis]
+        threshold = np.broadcast_to(self.fb_step_threshold, channel_shape)[..., np.newaxis]
+        if self._last_fb is None:
+            self._last_fb = fb[..., 0]
+            self.njumps = np.zeros(channel_shape, dtype="int64")
+        assert self._last_fb.shape == channel_shape, "every chunk must have the same channels"
+        d = np.diff(fb, axis=-1, prepend=self._last_fb[..., np.newaxis])
+        steps = (d < -threshold).astype("int64") - (d > threshold)
+        njumps = self.njumps[..., np.newaxis] + np.cumsum(steps, axis=-1)
+        if fb.shape[-1] > 0:
+            self._last_fb = fb[..., -1]
+            self.njumps = njumps[..., -1]
+        return fb + njumps * phi0_fb
+
+
+def find_arl_resets(fb, flux_jump_threshold_dac_units, db_offset, lookback_samples=None, lookback_threshold=None,
+                    as_mask=False):
+    """find where the ARL reset up (fb below the band) or down (fb above it) in each channel of fb.
+    return ups, downs, each the frame indices of every channel as a ragged list nested like the channel axes
+    (a single array for a 1d fb), or with as_mask boolean masks shaped like fb.
+    with lookback_samples, the first reset of each direction in each channel is dropped if fb moved by
+    lookback_threshold or more over the lookback_samples frames before it, that is an interference blip from
+    changing the detector bias, not a phi0 slip. see ArlResetDetector for streaming data"""
+    detector = ArlResetDetector(flux_jump_threshold_dac_units, db_offset, lookback_samples, lookback_threshold)
+    return detector.find(fb, as_mask)
+
+
+class ArlResetDetector:
+    """find ARL resets in a stream of chunks, each (..., nframes), as if they were one long array.
+    the last lookback_samples frames of each channel, and whether its first reset in each direction has been
+    checked, carry over between chunks. n_ups and n_downs count the resets of each channel so far.
+    call reset() after changing the detector bias.
+
+    before the first frame the lookback uses the first frame. the loop version in demo_lookback.py indexes
+    fb[i-lookback_samples] which wraps to the end of the trace there, otherwise they agree
+    """
+
+    # frames per block of channels, so the comparison masks stay in cache
+    block_frames = 2 ** 16
+
+    def __init__(self, flux_jump_threshold_dac_units, db_offset, lookback_samples=None, lookback_threshold=None):
+        self.flux_jump_threshold_dac_units = np.asarray(flux_jump_threshold_dac_units, dtype="float64")
+        self.db_offset = np.asarray(db_offset, dtype="float64")
+        assert (lookback_samples is None) == (lookback_threshold is None)
+        self.lookback_samples = lookback_samples
+        self.lookback_threshold = lookback_threshold
+        self.reset()
+
+    def reset(self):
+        self._channel_shape = None
+        self._history = None  # (nchan, lookback_samples)
+        self._first_checked = None  # (2, nchan) for ups and downs
+        self._counts = None  # (2, nchan) for ups and downs
+
+    @property
+    def n_ups(self):
+        return None if self._counts is None else self._counts[0].reshape(self._channel_shape)
+
+    @property
+    def n_downs(self):
+        return None if self._counts is None else self._counts[1].reshape(self._channel_shape)
+
+    def find(self, fb, as_mask=False):
+        """return ups, downs for this chunk, indices relative to its first frame, see find_arl_resets"""
+        fb = np.asarray(fb)
+        if self._channel_shape is None:
+            self._channel_shape = fb.shape[:-1]
+            nchan = int(np.prod(self._channel_shape))
+            self._counts = np.zeros((2, nchan), dtype="int64")
+            self._first_checked = np.zeros((2, nchan), dtype="bool")
+        assert fb.shape[:-1] == self._channel_shape, "every chunk must have the same channels"
+        fb2 = fb.reshape(-1, fb.shape[-1])
+        nchan, nframes = fb2.shape
+        band = np.broadcast_to(self.flux_jump_threshold_dac_units, self._channel_shape).reshape(-1, 1)
+        db_offset = np.broadcast_to(self.db_offset, self._channel_shape).reshape(-1, 1)
+        lo, hi = db_offset - band, db_offset + band
+        if self.lookback_samples is not None and self._history is None and nframes > 0:
+            self._history = np.repeat(fb2[:, :1], self.lookback_samples, axis=-1)
+        nblock = max(1, self.block_frames // max(nframes, 1))
+        scratch = np.empty((min(nblock, nchan), nframes), dtype="bool")
+        found = [[], []]  # flat indices into fb2 for ups and downs
+        for a in range(0, nchan, nblock):
+            b = slice(a, a + nblock)
+            mask = scratch[: len(fb2[b])]
+            for k, compare, limit in [(0, np.less, lo), (1, np.greater, hi)]:
+                compare(fb2[b], limit[b], out=mask)
+                # resets are rare, so work from their indices rather than more passes over the mask
+                inds = np.flatnonzero(mask)
+                if len(inds) == 0:
+                    continue
+                if self.lookback_samples is not None:
+                    inds = self._drop_first_blips(fb2[b], inds, a, k)
+                found[k].append(inds + a * nframes)
+        if self.lookback_samples is not None and nframes > 0:
+            self._update_history(fb2)
+        out = []
+        for k in range(2):
+            inds = np.concatenate(found[k]) if len(found[k]) > 0 else np.zeros(0, dtype="int64")
+            chans, frames = np.divmod(inds, nframes) if nframes > 0 else (inds, inds)
+            counts = np.bincount(chans, minlength=nchan)
+            self._counts[k] += counts
+            if as_mask:
+                mask = np.zeros(fb.shape, dtype="bool")
+                mask.reshape(-1)[inds] = True
+                out.append(mask)
+            else:
+                out.append(self._ragged(frames, counts))
+        return tuple(out)
+
+    def _ragged(self, frames, counts):
+        per_chan = np.split(frames, np.cumsum(counts)[:-1])
+        if self._channel_shape == ():
+            return per_chan[0]
+        nested = np.empty(len(per_chan), dtype="object")
+        nested[:] = per_chan
+        return nested.reshape(self._channel_shape).tolist()
+
+    def _drop_first_blips(self, fb2, inds, chan0, k):
+        """fb2 is a block of channels starting at chan0 and inds are the sorted flat indices of its resets,
+        return inds without the blips"""
+        n = self.lookback_samples
+        chans, frames = np.divmod(inds, fb2.shape[-1])
+        is_first = np.ones(len(chans), dtype="bool")
+        is_first[1:] = chans[1:] != chans[:-1]
+        is_first &= ~self._first_checked[k, chan0 + chans]
+        first_chans, first = chans[is_first], frames[is_first]
+        # the frame lookback_samples before, from the previous chunks if it is before this one
+        before = np.where(
+            first >= n,
+            fb2[first_chans, np.maximum(first - n, 0)],
+            self._history[chan0 + first_chans, np.minimum(first, n - 1)],
+        )
+        blip = np.abs(fb2[first_chans, first] - before) >= self.lookback_threshold
+        self._first_checked[k, chan0 + first_chans] = True
+        keep = np.ones(len(chans), dtype="bool")
+        keep[np.nonzero(is_first)[0][blip]] = False
+        return inds[keep]
+
+    def _update_history(self, fb2):
+        n = self.lookback_samples
+        if fb2.shape[-1] >= n:
+            self._history = fb2[:, -n:].copy()
+        else:
+            self._history = np.concatenate([self._history[:, fb2.shape[-1]:], fb2], axis=-1)
@@ -30,8 +30,8 @@ def get_ics(_tri, _fb, plot=False, i=1):
     fb = make_vector_start_at_ind(_fb, ind)
 
     # add back in phi0s for flux jumps we can resolve
-    fb2 = fb2 = add_flux_jumps(fb, phi0_fb, fb_step_threshold=1000)
-    tri2 = tri[:-1]
+    fb2 = unwrap_flux_jumps(fb, phi0_fb, fb_step_threshold=1000)
+    tri2 = tri
 
     # sample the last few points before the next step of the triangle
     tri_sampled = avg_n_points_every_m_points_starting_at_o(tri2, 4, dwell, dwell-2-4)
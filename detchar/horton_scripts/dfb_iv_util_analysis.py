@@ -3,6 +3,7 @@ import numpy as np
 from cringe.tune.analysis import conditionvphi
 import h5py
 from numpy.polynomial.polynomial import Polynomial
+from detchar.flux_jump import unwrap_flux_jumps
 
 
 
@@ -13,13 +14,6 @@ def make_vector_start_at_ind(v, ind):
     out[len(v)-ind:] = v[:ind]
     return out
 
-def add_flux_jumps(fb, phi0_fb, fb_step_threshold):
-    """return an array like fb, but with flux jumps resolved and one value removed from the end
-    method: find indicies with np.diff(fb) greater ro less than fb_step_threshold
-    and add phi0 units with the correct sign"""
-    out = fb[:-1]+np.cumsum(np.diff(fb)<-fb_step_threshold)*phi0_fb
-    out -= np.cumsum(np.diff(fb)>fb_step_threshold)*phi0_fb
-    return out
 
 def avg_n_points_every_m_points_starting_at_o(v, n, m, o):
     assert o+n < m
@@ -0,0 +1,184 @@
+""" batch analysis of saved IVTempSweepData and IVColdloadSweepData files
+
+fans the files out over a process pool and writes one csv with a line per (file, coldload temp, row) holding
+rpar, rn, psat at each requested fraction of rn (at the lowest bath temp) and a g_fit (k, n, tc, G) for each fraction.
+results are cached per file, keyed by a hash of the file contents and the analysis settings, so re-running over
+a season of data only analyzes new or changed files.
+
+command line:
+iv_batch "data/*_temp_sweep_ivs.json" --circuit circuit.json --rfracs 0.3 0.5 0.8 -o summary.csv
+where circuit.json is an IVCircuit saved with to_json
+"""
+import argparse
+import concurrent.futures
+import csv
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+from detchar.iv_data import IVCircuit, IVTempSweepData, IVColdloadSweepData, g_fit, iv_loads
+
+
+def analyze_temp_sweep(sdata, circuit, rfracs, sc_below_vbias_arb, n_normal_pts=3):
+    """return a list of dicts, one per row of sdata, see module docstring for the keys"""
+    rpar_ohm_by_row = sdata.fit_for_rpar(circuit, sc_below_vbias_arb, temp_index=0)
+    i, v = sdata.iv_temp_val_row(circuit, rpar_ohm_by_row)
+    # the sign of the feedback depends on wiring, so work with magnitudes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.abs(v / i)
+    p = np.abs(i * v)
+    # the first points are the highest bias, normal at the lowest temp
+    rn_ohm_by_row = np.median(r[0, :n_normal_pts, :], axis=0)
+    curves = sdata.data[0]
+    out = []
+    for row in range(sdata.get_nrows()):
+        d = {
+            "bayname": curves.bayname,
+            "db_cardname": curves.db_cardname,
+            "column_number": curves.column_number,
+            "row": row,
+            "rpar_ohm": rpar_ohm_by_row[row],
+            "rn_ohm": rn_ohm_by_row[row],
+        }
+        for rfrac in rfracs:
+            p_by_temp = _power_at_r(r[:, :, row], p[:, :, row], rfrac * rn_ohm_by_row[row])
+            d[f"psat_w_at_{rfrac}"] = p_by_temp[0]
+            d.update({f"{key}_at_{rfrac}": val for key, val in _g_fit_or_nan(sdata.set_temps_k, p_by_temp).items()})
+        out.append(d)
+    return out
+
+
+def _power_at_r(r_temp_pt, p_temp_pt, r_ohm):
+    """power at resistance r_ohm for each temp, nan where r_ohm isn't within the curve"""
+    p_out = np.zeros(r_temp_pt.shape[0]) * np.nan
+    for temp_index in range(r_temp_pt.shape[0]):
+        r, p = r_temp_pt[temp_index, ::-1], p_temp_pt[temp_index, ::-1]
+        good = np.isfinite(r) & np.isfinite(p)
+        if np.sum(good) < 2 or not (np.min(r[good]) <= r_ohm <= np.max(r[good])):
+            continue
+        p_out[temp_index] = np.interp(r_ohm, r[good], p[good])
+    return p_out
+
+
+def _g_fit_or_nan(set_temps_k, p_w):
+    keys = ["k", "n", "tc_k", "g_w_per_k"]
+    if np.sum(np.isfinite(p_w)) < 4:
+        return {key: np.nan for key in keys}
+    try:
+        _result, k, tc_k, n, g_w_per_k = g_fit(set_temps_k, p_w)
+    except Exception:
+        return {key: np.nan for key in keys}
+    return {"k": k, "n": n, "tc_k": tc_k, "g_w_per_k": g_w_per_k}
+
+
+def analyze_file(filename, circuit, rfracs, sc_below_vbias_arb):
+    """analyze an IVTempSweepData or IVColdloadSweepData file, return a list of dicts"""
+    with open(filename, "r") as f:
+        data = iv_loads(f.read())
+    if isinstance(data, IVColdloadSweepData):
+        sweeps = list(zip(data.set_cl_temps_k, data.data))
+    else:
+        assert isinstance(data, IVTempSweepData), f"{filename} isn't a temp sweep or coldload sweep"
+        sweeps = [(None, data)]
+    out = []
+    for set_cl_temp_k, sdata in sweeps:
+        for row_dict in analyze_temp_sweep(sdata, circuit, rfracs, sc_below_vbias_arb):
+            out.append(dict(filename=filename, coldload_temp_k=set_cl_temp_k, **row_dict))
+    return out
+
+
+def file_hash(filename, settings):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            h.update(block)
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _analyze_file_cached(filename, circuit_dict, rfracs, sc_below_vbias_arb, cache_dir):
+    settings = {"circuit": circuit_dict, "rfracs": rfracs, "sc_below_vbias_arb": sc_below_vbias_arb}
+    cache_filename = None
+    if cache_dir is not None:
+        cache_filename = os.path.join(cache_dir, file_hash(filename, settings) + ".json")
+        if os.path.isfile(cache_filename):
+            with open(cache_filename, "r") as f:
+                rows = json.load(f)
+            for row_dict in rows:
+                row_dict["filename"] = filename  # the same contents may have moved
+            return rows, True
+    rows = analyze_file(filename, IVCircuit.from_dict(circuit_dict), rfracs, sc_below_vbias_arb)
+    rows = [{key: _to_builtin(val) for key, val in row_dict.items()} for row_dict in rows]
+    if cache_filename is not None:
+        with open(cache_filename, "w") as f:
+            json.dump(rows, f)
+    return rows, False
+
+
+def _to_builtin(val):
+    if isinstance(val, np.generic):
+        return val.item()
+    return val
+
+
+def analyze_files(filenames, circuit, rfracs=(0.3, 0.5, 0.8), sc_below_vbias_arb=500, cache_dir=None,
+                  max_workers=None):
+    """analyze each file on a process pool, return a list of dicts (one per file, coldload temp and row)
+    files that fail are reported and skipped"""
+    rfracs = [float(rfrac) for rfrac in rfracs]
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    circuit_dict = circuit.to_dict()
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_analyze_file_cached, filename, circuit_dict, rfracs, sc_below_vbias_arb, cache_dir): filename
+            for filename in filenames
+        }
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            filename = futures[future]
+            try:
+                results[filename], was_cached = future.result()
+                print(f"{filename}: {'cached' if was_cached else 'analyzed'}")
+            except Exception as ex:
+                print(f"{filename}: FAILED {ex!r}")
+    for filename in filenames:  # keep input order regardless of completion order
+        rows.extend(results.get(filename, []))
+    return rows
+
+
+def write_summary(rows, filename):
+    keys = []
+    for row_dict in rows:
+        keys.extend(key for key in row_dict.keys() if key not in keys)
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    p = argparse.ArgumentParser(description="batch analysis of saved IV temp sweep and coldload sweep files")
+    p.add_argument("patterns", nargs="+", help="glob patterns for IV files, quote them to let python expand them")
+    p.add_argument("--circuit", required=True, help="json file with an IVCircuit")
+    p.add_argument("--rfracs", type=float, nargs="+", default=[0.3, 0.5, 0.8],
+                   help="fractions of rn at which to find psat and fit G")
+    p.add_argument("--sc_below_vbias_arb", type=float, default=500,
+                   help="dac value below which the detectors are superconducting, for the rpar fit")
+    p.add_argument("-o", "--output", default="iv_batch_summary.csv")
+    p.add_argument("--cache_dir", default=".iv_batch_cache", help="per file result cache, 'none' to disable")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    args = p.parse_args()
+    filenames = sorted(set(f for pattern in args.patterns for f in glob.glob(pattern)))
+    with open(args.circuit, "r") as f:
+        circuit = IVCircuit.from_json(f.read())
+    cache_dir = None if args.cache_dir.lower() == "none" else args.cache_dir
+    rows = analyze_files(filenames, circuit, args.rfracs, args.sc_below_vbias_arb, cache_dir, args.jobs)
+    write_summary(rows, args.output)
+    print(f"wrote {len(rows)} rows from {len(filenames)} files to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,30 @@
 from dataclasses import dataclass
 import dataclasses
 from dataclasses_json import dataclass_json
-from typing import Any, List
+from typing import Any, List, Optional
 import numpy as np
 import pylab as plt
 import collections
 import os
+import json
+import base64
 from numpy.polynomial.polynomial import Polynomial
 import lmfit
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _iv_codec(cls):
+    """point from_json and from_dict at the codec at the bottom of this file, so they read base64 arrays too"""
+    cls.from_json = classmethod(lambda cls, s, **kw: iv_loads(s, cls))
+    cls.from_dict = classmethod(lambda cls, d, **kw: _decode_obj(d, cls))
+    return cls
+
+
+@_iv_codec
 @dataclass_json
 @dataclass
 class IVCurveColumnData:
@@ -42,16 +58,16 @@ class IVCurveColumnData:
         plt.figure()
         x, y = self.xy_arrays
 
-    def to_file(self, filename, overwrite=False):
+    def to_file(self, filename, overwrite=False, array_format="base64"):
         if not overwrite:
             assert not os.path.isfile(filename)
         with open(filename, "w") as f:
-            f.write(self.to_json())
+            f.write(iv_dumps(self, array_format))
 
     @classmethod
     def from_file(cls, filename):
         with open(filename, "r") as f:
-            return cls.from_json(f.read())
+            return iv_loads(f.read(), cls)
 
     def fb_values_array(self):
         return np.vstack(self.fb_values)
@@ -79,18 +95,8 @@ class IVCurveColumnData:
 
     def xyarrays_zero_subtracted_and_sc_branch_fixed(self):
         x, y = self.xyarrays_zero_subtracted_with_post_iv_zero_fb_value()
-        out = np.zeros_like(y)
-        for row in range(self.get_nrows()):
-            z = y[:, row]
-            # assume we started a high db, and moved down, the sc branch should be the last few points
-            zz = np.diff(z)/np.diff(x)
-            zzz = (zz/zz[-1])-1 # slope relative to potential sc zone, where sc zone = 0
-            # and deviations are in units of the sc zone slope
-            inds = np.where(np.abs(zzz)>2)[0]
-            if len(inds) > 1:
-                ind = inds[-1]
-                z[ind:]-=z[-1]
-            out[:, row] = z
+        # assume we started a high db, and moved down, the sc branch should be the last few points
+        out = fix_sc_branch_array(x, y)
         # can't actually do this here, because I don't know where the origin is!!
         return x, out
 
@@ -107,26 +113,16 @@ class IVCurveColumnData:
 
     def fit_for_rpar(self, circuit, sc_below_vbias_arb):
         """
-        loop over rows and fit for r_par (aka parasitic resistance)
-        return a list of fitted values
-        if a fit fails return np.nan
+        fit for r_par (aka parasitic resistance) for all rows at once
+        return an array of fitted values, one per row
+        if a fit fails return np.nan for that row
 
         circuit: an IVCircuit object, all values except r_par must be accurate
         sc_below_vbias_arb: a value for detector bias in arb units below which the device is superconducting
         """
-        nrows = self.get_nrows()
         vbias_arbs, fb_arbs = self.xy_arrays()
-        rpar_ohm_by_row = np.zeros(nrows)        
-        for row in range(nrows):
-            fb_for_this_row = fb_arbs[:, row]
-            try:
-                _ites, _vtes, rpar_ohm = circuit.iv_raw_to_physical_fit_rpar(vbias_arbs, 
-                        fb_for_this_row, sc_below_vbias_arb)
-            except np.linalg.LinAlgError:
-                rpar_ohm = np.nan
-            rpar_ohm_by_row[row] = rpar_ohm
-        return rpar_ohm_by_row
-        
+        return circuit.fit_rpar_array(vbias_arbs, fb_arbs, sc_below_vbias_arb)
+
 
 def fix_sc_branch(x, y):
     """
@@ -145,15 +141,38 @@ def fix_sc_branch(x, y):
         yout[ind:] -= yout[-1]
     return yout
 
-def fix_sc_branch_array(x, y):
+def fix_sc_branch_array(x, y, return_diagnostics=False):
     """
     locate the superconducting branch based on the fact that it's slope is very different from all other slopes
     force it to end at the origin
     do it for an array of y[i,j] values where i indexes detector bias and j indexes row or temperature
+    (any number of trailing axes is allowed), all columns are handled at once with masked operations
+    y is not modified
+
+    return_diagnostics: if True return (yout, diagnostics) where diagnostics is a dict of arrays with the shape of y[0]
+        "sc_start_ind" - first index of the fixed sc branch, -1 where no sc branch was found
+        "offset" - the value subtracted from the sc branch, 0 where no sc branch was found
+        "fixed" - True where the sc branch was fixed
     """
-    yout = np.zeros_like(y)
-    for i in range(y.shape[1]):
-        yout[:, i] = fix_sc_branch(x, y[:,i])
+    x = np.asarray(x)
+    y = np.asarray(y)
+    dx = np.diff(x).reshape((-1,)+(1,)*(y.ndim-1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dfb_dbias = np.diff(y, axis=0)/dx
+        z = (dfb_dbias/dfb_dbias[-1])-1  # slope relative to potential sc zone, where sc zone = 0
+    # and deviations are in units of the sc zone slope
+    is_deviant = np.abs(z) > 2
+    fixed = np.sum(is_deviant, axis=0) > 1
+    # index of the last deviant slope along axis 0, found by searching the reversed array
+    last_deviant = is_deviant.shape[0]-1-np.argmax(is_deviant[::-1], axis=0)
+    sc_start_ind = np.where(fixed, last_deviant, -1)
+    offset = np.where(fixed, y[-1], 0)
+    inds = np.arange(y.shape[0]).reshape((-1,)+(1,)*(y.ndim-1))
+    in_sc_branch = np.logical_and(fixed, inds >= sc_start_ind)
+    yout = y - in_sc_branch*offset
+    if return_diagnostics:
+        diagnostics = {"sc_start_ind": sc_start_ind, "offset": offset, "fixed": fixed}
+        return yout, diagnostics
     return yout
 
 def fit_normal_zero_subtract(x, y, normal_above_x):
@@ -163,22 +182,23 @@ def fit_normal_zero_subtract(x, y, normal_above_x):
     return y - normal_y_intersect
 
 
+@_iv_codec
 @dataclass_json
 @dataclass
 class IVTempSweepData:
     set_temps_k: List[float]
     data: List[IVCurveColumnData]
 
-    def to_file(self, filename, overwrite=False):
+    def to_file(self, filename, overwrite=False, array_format="base64"):
         if not overwrite:
             assert not os.path.isfile(filename)
         with open(filename, "w") as f:
-            f.write(self.to_json())
+            f.write(iv_dumps(self, array_format))
 
     @classmethod
     def from_file(cls, filename):
         with open(filename, "r") as f:
-            return cls.from_json(f.read())
+            return iv_loads(f.read(), cls)
 
     def xyarrays_zero_subtracted_temp_fb_row(self, fix_sc=True):
         last_curves = self.data[-1]
@@ -189,11 +209,10 @@ class IVTempSweepData:
                 y -= ylast[-1, :] 
                 # assume the last (highest temp) iv curve kept lock 
                 # and it's last point has zero detector bias, so it can define current zero
-                if fix_sc:
-                    y_sc_fixed = fix_sc_branch_array(x, y)
-                    out[temp_index, :, :] = y_sc_fixed[:, :]
-                else:
-                    out[temp_index, :, :] = y[:, :]
+                out[temp_index, :, :] = y[:, :]
+        if fix_sc:
+            # all temps share the same dac values, so fix the sc branch of every (temp, row) in one call
+            out = np.moveaxis(fix_sc_branch_array(xlast, np.moveaxis(out, 1, 0)), 0, 1)
         return xlast, out
 
     def xyarrays_zero_subtracted_all_temps_for_one_row(self, row):
@@ -233,6 +252,28 @@ class IVTempSweepData:
         plt.legend()          
 
 
+    def measured_temps_k(self):
+        """mean temperature during each curve, from the temp_trace_k that IVTempRampSweeper puts in extra_info,
+        otherwise the mean of pre_temp_k and post_temp_k"""
+        temps_k = []
+        for curves in self.data:
+            if "temp_trace_k" in curves.extra_info and len(curves.extra_info["temp_trace_k"]) > 0:
+                temps_k.append(np.mean(curves.extra_info["temp_trace_k"]))
+            else:
+                temps_k.append(0.5 * (curves.pre_temp_k + curves.post_temp_k))
+        return np.array(temps_k)
+
+    def psat_vs_temp(self, r_ohm, row, circuit, rpar_ohm_by_row=None, sc_below_vbias_arb=None, bin_edges_k=None):
+        """power at r_ohm against measured temperature, sorted by temperature.
+        with bin_edges_k return the bin centers, mean power, std and count in each bin (see bin_vs_temp),
+        useful for ramped sweeps with many curves at scattered temperatures"""
+        temps_k = self.measured_temps_k()
+        p_w = self.get_power_at_r(r_ohm, row, circuit, rpar_ohm_by_row, sc_below_vbias_arb)
+        if bin_edges_k is not None:
+            return bin_vs_temp(temps_k, p_w, bin_edges_k)
+        inds = np.argsort(temps_k)
+        return temps_k[inds], p_w[inds]
+
     def plot_row_old(self, row, zero="origin"):
         "kept around for testing zero subtraction, but basically don't use it"
         plt.figure()
@@ -279,14 +320,9 @@ class IVTempSweepData:
             rpar_ohm_by_row = self.fit_for_rpar(circuit, sc_below_vbias_arb, 0)
             #assume lowest temp was first
         x, y_temp_fb_row = self.xyarrays_zero_subtracted_temp_fb_row()
-        i_temp_fb_row = np.zeros_like(y_temp_fb_row)        
-        v_temp_fb_row = np.zeros_like(y_temp_fb_row)          
-        for temp_index in range(len(self.data)):
-            for row in range(self.get_nrows()):
-                i, v = circuit.iv_raw_to_physical(x, 
-                y_temp_fb_row[temp_index, :, row], rpar_ohm=rpar_ohm_by_row[row])
-                i_temp_fb_row[temp_index, :, row] = i
-                v_temp_fb_row[temp_index, :, row] = v
+        # broadcast over (temp, pt, row) rather than looping
+        i_temp_fb_row, v_temp_fb_row = circuit.iv_raw_to_physical(np.asarray(x)[np.newaxis, :, np.newaxis],
+            y_temp_fb_row, rpar_ohm=np.asarray(rpar_ohm_by_row)[np.newaxis, np.newaxis, :])
         return i_temp_fb_row, v_temp_fb_row
 
     def plot_row_iv(self, row, circuit, rpar_ohm_by_row=None, sc_below_vbias_arb=None, 
@@ -357,6 +393,7 @@ class IVTempSweepData:
 
 
 
+@_iv_codec
 @dataclass_json
 @dataclass
 class IVColdloadSweepData:  # set_cl_temps_k, pre_cl_temps_k, post_cl_temps_k, data
@@ -364,16 +401,16 @@ class IVColdloadSweepData:  # set_cl_temps_k, pre_cl_temps_k, post_cl_temps_k, d
     data: List[IVTempSweepData]
     extra_info: dict
 
-    def to_file(self, filename, overwrite=False):
+    def to_file(self, filename, overwrite=False, array_format="base64"):
         if not overwrite:
             assert not os.path.isfile(filename)
         with open(filename, "w") as f:
-            f.write(self.to_json())
+            f.write(iv_dumps(self, array_format))
 
     @classmethod
     def from_file(cls, filename):
         with open(filename, "r") as f:
-            return cls.from_json(f.read())
+            return iv_loads(f.read(), cls)
 
     def plot_row(self, row):
         # n=len(set_cl_temps_k)
@@ -399,6 +436,139 @@ class IVColdloadSweepData:  # set_cl_temps_k, pre_cl_temps_k, post_cl_temps_k, d
         plt.legend()
 
 
+@_iv_codec
+@dataclass_json
+@dataclass
+class IVSweepCheckpoint:
+    """progress of an IVTempSweeper or IVColdloadSweeper run, written after every curve so a run that
+    dies can be resumed with resume_from=filename. set_cl_temps_k is empty for a temp sweep.
+    curves holds one list per completed (coldload temp, bath temp) pair, with one IVCurveColumnData per column"""
+    set_cl_temps_k: List[float]
+    set_temps_k: List[float]
+    dac_values: List[int]
+    completed: List[Any] = dataclasses.field(default_factory=list)  # [set_cl_temp_k or None, set_temp_k] pairs
+    curves: List[List[IVCurveColumnData]] = dataclasses.field(default_factory=list, repr=False)
+    pre_cl_temps_k: List[Any] = dataclasses.field(default_factory=list)
+    post_cl_temps_k: List[Any] = dataclasses.field(default_factory=list)
+    last_setpoint_k: Optional[float] = None
+    last_cl_setpoint_k: Optional[float] = None
+    data_filename: Optional[str] = None
+    filename: Optional[str] = None  # where the checkpoint is written, None to only keep it in memory
+
+    def to_file(self, filename, overwrite=False, array_format="base64"):
+        if not overwrite:
+            assert not os.path.isfile(filename)
+        with open(filename, "w") as f:
+            f.write(iv_dumps(self, array_format))
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, "r") as f:
+            checkpoint = iv_loads(f.read(), cls)
+        checkpoint.filename = filename
+        return checkpoint
+
+    def save(self):
+        if self.filename is not None:
+            # write then rename, so dying mid write can't corrupt the last good checkpoint
+            self.to_file(self.filename + ".tmp", overwrite=True)
+            os.replace(self.filename + ".tmp", self.filename)
+
+    def _index(self, set_cl_temp_k, set_temp_k):
+        key = [_float_or_none(set_cl_temp_k), float(set_temp_k)]
+        for i, pair in enumerate(self.completed):
+            if list(pair) == key:
+                return i
+        return None
+
+    def is_done(self, set_cl_temp_k, set_temp_k):
+        return self._index(set_cl_temp_k, set_temp_k) is not None
+
+    def get_curves(self, set_cl_temp_k, set_temp_k):
+        return self.curves[self._index(set_cl_temp_k, set_temp_k)]
+
+    def add_curves(self, set_cl_temp_k, set_temp_k, curves):
+        """record the curves (one per column) for a completed pair and save"""
+        assert not self.is_done(set_cl_temp_k, set_temp_k)
+        self.completed.append([_float_or_none(set_cl_temp_k), float(set_temp_k)])
+        self.curves.append(curves)
+        self.save()
+
+    def n_remaining(self):
+        return max(len(self.set_cl_temps_k), 1) * len(self.set_temps_k) - len(self.completed)
+
+
+def _float_or_none(x):
+    if x is None:
+        return None
+    return float(x)
+
+
+@_iv_codec
+@dataclass_json
+@dataclass
+class BiasStepData:
+    """response of every row of one column to a small square wave on the detector bias around dac_value,
+    from BiasStepTaker. step_response is the average response to a +1 dac step, zero just before the step,
+    dfb_ddac_fast is its value on the first frame after the step, dfb_ddac_slow its settled value, and
+    tau_s the effective time constant between them"""
+    dac_value: int
+    step_dac: int
+    half_period_s: float
+    sample_period_s: float
+    temp_k: float
+    time_epoch_s: float
+    bayname: str
+    db_cardname: str
+    column_number: int
+    fb_mean: Any  # (nrow,)
+    step_response: Any = dataclasses.field(repr=False)  # (nrow, nframes)
+    dfb_ddac_fast: Any
+    dfb_ddac_slow: Any
+    tau_s: Any
+    extra_info: dict
+
+    def to_file(self, filename, overwrite=False, array_format="base64"):
+        if not overwrite:
+            assert not os.path.isfile(filename)
+        with open(filename, "w") as f:
+            f.write(iv_dumps(self, array_format))
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, "r") as f:
+            return iv_loads(f.read(), cls)
+
+    def plot(self):
+        t_ms = np.arange(np.shape(self.step_response)[1]) * self.sample_period_s * 1e3
+        plt.figure()
+        plt.plot(t_ms, np.transpose(self.step_response))
+        plt.xlabel("time after step (ms)")
+        plt.ylabel("dfb/ddac")
+        plt.title(f"bay {self.bayname}, col {self.column_number}, dac_value {self.dac_value}, temp_mk {self.temp_k*1000}")
+
+    def small_signal(self, circuit, rn_ohm=None, zero_bias_fb=None):
+        """return a dict of per row arrays: didv_fast and didv_slow (1/ohm), r0_ohm, loopgain and tau_s, plus
+        rfrac if rn_ohm is given and s_i_a_per_w (dc current responsivity) if zero_bias_fb is given.
+        uses the simple model with beta=0 and a stiff voltage bias, where the fast response is 1/r0 and the
+        settled response is (1-L)/(r0*(1+L)), so these are for tracking changes more than absolute values"""
+        # iv_raw_to_physical is linear with no offset, so it maps a per dac change to a physical change
+        di_fast, dv_fast = circuit.iv_raw_to_physical(1.0, np.asarray(self.dfb_ddac_fast))
+        di_slow, dv_slow = circuit.iv_raw_to_physical(1.0, np.asarray(self.dfb_ddac_slow))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = {"didv_fast": di_fast / dv_fast, "didv_slow": di_slow / dv_slow, "tau_s": np.asarray(self.tau_s)}
+            out["r0_ohm"] = 1 / out["didv_fast"]
+            ratio = out["didv_slow"] / out["didv_fast"]
+            out["loopgain"] = (1 - ratio) / (1 + ratio)
+            if rn_ohm is not None:
+                out["rfrac"] = out["r0_ohm"] / rn_ohm
+            if zero_bias_fb is not None:
+                i0, _ = circuit.iv_raw_to_physical(0, np.asarray(self.fb_mean) - np.asarray(zero_bias_fb))
+                v0 = np.abs(i0 * out["r0_ohm"])
+                out["s_i_a_per_w"] = -1 / v0 * out["loopgain"] / (1 + out["loopgain"])
+        return out
+
+
 @dataclass_json
 @dataclass
 class IVCircuit:
@@ -425,6 +595,24 @@ class IVCircuit:
         rpar_ohm = pfit_sc.deriv(m=1)(0)
         return ites0, vtes0 - ites0 * rpar_ohm, rpar_ohm
 
+    def fit_rpar_array(self, vbias_arbs, vfb_arbs, sc_below_vbias_arbs):
+        """fit for rpar_ohm for every column of vfb_arbs[i,j] at once, i indexes detector bias and j indexes row
+        uses the closed form least squares slope of vtes vs ites on the superconducting points,
+        the same fit as iv_raw_to_physical_fit_rpar does one row at a time
+        return an array of rpar_ohm with np.nan for rows where the fit is not possible"""
+        vbias_arbs = np.asarray(vbias_arbs)
+        vfb_arbs = np.asarray(vfb_arbs, dtype="float64")
+        sc_inds = np.where(vbias_arbs < sc_below_vbias_arbs)[0]
+        ites0, vtes0 = self.iv_raw_to_physical(vbias_arbs[sc_inds, np.newaxis], vfb_arbs[sc_inds, :], rpar_ohm=0)
+        dites = ites0 - np.mean(ites0, axis=0)
+        dvtes = vtes0 - np.mean(vtes0, axis=0)
+        var = np.sum(dites**2, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rpar_ohm = np.sum(dites*dvtes, axis=0)/var
+        rpar_ohm[~np.isfinite(rpar_ohm)] = np.nan
+        rpar_ohm[var == 0] = np.nan
+        return rpar_ohm
+
     def iv_raw_to_physical(self, vbias_arbs, vfb_arbs, rpar_ohm=None):
         """rpar_ohm is None by default, when None it uses the circuit value. otherwise it uses the passed value"""
         if rpar_ohm is None:
@@ -437,6 +625,30 @@ class IVCircuit:
         vtes = (ibias - ites) * self.rsh_ohm - ites * rpar_ohm
         return ites, vtes
 
+def bin_vs_temp(temps_k, values, bin_edges_k):
+    """bin values (ntemps, ...) by temps_k, ignoring nans, return bin centers, mean, std and count per bin
+    with the bin as the first axis, empty bins are nan. like np.histogram the last bin includes its right edge"""
+    temps_k = np.asarray(temps_k)
+    values = np.asarray(values, dtype="float64")
+    bin_edges_k = np.asarray(bin_edges_k)
+    nbins = len(bin_edges_k) - 1
+    inds = np.digitize(temps_k, bin_edges_k) - 1
+    inds[temps_k == bin_edges_k[-1]] = nbins - 1
+    in_range = (inds >= 0) & (inds < nbins)
+    inds, values = inds[in_range], values[in_range]
+    good = np.isfinite(values)
+    count = np.zeros((nbins,) + values.shape[1:])
+    total = np.zeros_like(count)
+    total_sq = np.zeros_like(count)
+    np.add.at(count, inds, good)
+    np.add.at(total, inds, np.where(good, values, 0))
+    np.add.at(total_sq, inds, np.where(good, values, 0) ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean ** 2, 0))
+    return 0.5 * (bin_edges_k[1:] + bin_edges_k[:-1]), mean, std, count
+
+
 def g_fit(tb_k, p_w, k_guess_w_per_t_to_n=1e-9, tc_guess_k=0.01, n_guess=3, prune_nan=True, plot=False):
     if prune_nan:
         inds = ~np.isnan(p_w)
@@ -465,4 +677,131 @@ def g_fit(tb_k, p_w, k_guess_w_per_t_to_n=1e-9, tc_guess_k=0.01, n_guess=3, prun
         plt.ylabel("power (W)")
         plt.legend()
 
-    return result, k, tc_k, n, G_W_per_K
\ No newline at end of file
+    return result, k, tc_k, n, G_W_per_K
+
+
+# a hand written codec for the IV data types, used by to_file and from_file. dataclasses_json (to_json, from_json)
+# reflects on every object and converts every array to and from lists, which is slow for big sweeps.
+# here fb_values is stored as one 2d array and arrays are base64 blobs of their raw bytes, eg
+# {"__ndarray__": "AAAA...", "dtype": "<f8", "shape": [200, 16]}
+# plain list files (everything written by to_json) still load, and decode straight to numpy arrays.
+# from_json and from_dict of these types go through the codec too (see _iv_codec), so they read both formats.
+# with array_format="list" arrays are written as json lists, readable by any json tool.
+
+# fields holding other IV data types, and how deep they are nested in lists
+_NESTED_FIELDS = {
+    "IVTempSweepData": {"data": ("IVCurveColumnData", 1)},
+    "IVColdloadSweepData": {"data": ("IVTempSweepData", 1)},
+    "IVSweepCheckpoint": {"curves": ("IVCurveColumnData", 2)},
+}
+
+
+def _encode_array(a, array_format):
+    a = np.ascontiguousarray(a)
+    if array_format == "list" or a.dtype == object:
+        return a.tolist()
+    assert array_format == "base64", f"array_format={array_format} is invalid"
+    dtype = a.dtype.newbyteorder("<") if a.dtype.byteorder == ">" else a.dtype
+    return {
+        "__ndarray__": base64.b64encode(a.astype(dtype, copy=False).tobytes()).decode("ascii"),
+        "dtype": dtype.str,
+        "shape": list(a.shape),
+    }
+
+
+def _decode_array(x):
+    if isinstance(x, dict) and "__ndarray__" in x:
+        # frombuffer views the decoded bytes read only, copy so loaded data can be edited like list files
+        return np.frombuffer(base64.b64decode(x["__ndarray__"]), dtype=x["dtype"]).reshape(x["shape"]).copy()
+    return np.array(x)
+
+
+def _encode_obj(obj, array_format):
+    d = {}
+    nested = _NESTED_FIELDS.get(type(obj).__name__, {})
+    for field in dataclasses.fields(obj):
+        val = getattr(obj, field.name)
+        if field.name in nested:
+            val = _encode_nested(val, nested[field.name][1], array_format)
+        elif field.name in ["fb_values", "zero_bias_fb"] and val is not None and len(val) > 0:
+            val = _encode_array(np.array(val), array_format)  # fb_values becomes (npts, nrow)
+        elif isinstance(val, np.ndarray):
+            val = _encode_array(val, array_format)
+        elif isinstance(val, np.generic):
+            val = val.item()
+        d[field.name] = val
+    return d
+
+
+def _encode_nested(val, depth, array_format):
+    if depth == 0:
+        return _encode_obj(val, array_format)
+    return [_encode_nested(v, depth - 1, array_format) for v in val]
+
+
+def _decode_obj(d, cls):
+    nested = _NESTED_FIELDS.get(cls.__name__, {})
+    kwargs = {}
+    for field in dataclasses.fields(cls):
+        if field.name not in d:
+            if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING:
+                kwargs[field.name] = None  # older files lack some fields, eg zero_bias_fb
+            continue
+        val = d[field.name]
+        if field.name in nested:
+            nested_cls_name, depth = nested[field.name]
+            val = _decode_nested(val, globals()[nested_cls_name], depth)
+        elif field.name == "fb_values" and val is not None:
+            val = list(_decode_array(val))  # a list of per point arrays, as from IVCurveTaker
+        elif field.name == "zero_bias_fb" and val is not None:
+            val = _decode_array(val)
+        elif isinstance(val, dict) and "__ndarray__" in val:
+            val = _decode_array(val)
+        kwargs[field.name] = val
+    return cls(**kwargs)
+
+
+def _decode_nested(val, cls, depth):
+    if depth == 0:
+        return _decode_obj(val, cls)
+    return [_decode_nested(v, cls, depth - 1) for v in val]
+
+
+def _json_default(x):
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    if isinstance(x, np.generic):
+        return x.item()
+    raise TypeError(f"can't encode {type(x)}")
+
+
+def _guess_cls(d):
+    if "step_response" in d:
+        return BiasStepData
+    if "completed" in d:
+        return IVSweepCheckpoint
+    if "set_cl_temps_k" in d:
+        return IVColdloadSweepData
+    if "set_temps_k" in d:
+        return IVTempSweepData
+    return IVCurveColumnData
+
+
+def iv_dumps(obj, array_format="base64"):
+    """encode an IVCurveColumnData, IVTempSweepData, IVColdloadSweepData, IVSweepCheckpoint or BiasStepData as a json string
+    array_format: "base64" for compact binary blobs, or "list" for plain json lists"""
+    d = _encode_obj(obj, array_format)
+    if orjson is not None:
+        return orjson.dumps(d, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(d, default=_json_default)
+
+
+def iv_loads(s, cls=None):
+    """decode a json string from iv_dumps or to_json into cls, if cls is None it is guessed from the keys"""
+    if orjson is not None:
+        d = orjson.loads(s)
+    else:
+        d = json.loads(s)
+    if cls is None:
+        cls = _guess_cls(d)
+    return _decode_obj(d, cls)
@@ -11,12 +11,18 @@ import numpy as np
 import pylab as plt
 import progress.bar
 import os
+import concurrent.futures
+import threading
 from detchar.iv_data import (
     IVCurveColumnData,
     IVTempSweepData,
     IVColdloadSweepData,
     IVCircuit,
+    IVSweepCheckpoint,
+    BiasStepData,
 )
+from detchar.temp_settle import TempSettleDetector
+from detchar.flux_jump import unwrap_flux_jumps
 from instruments import BlueBox
 
 
@@ -37,6 +43,17 @@ class AdrGuiControlDummy():
         return 1e6
 
 class IVPointTaker:
+    """Take IV points on one column, or on several columns at once.
+
+    column_number may be a single column or a list of columns. With a list, db_cardname, bayname
+    and voltage_source may each be a single value shared by all columns or a list with one entry per column,
+    all columns are stepped together and read from the same getNewData call, and get_iv_pt
+    returns an array of shape (ncols, nrow) instead of (nrow,).
+
+    voltage_source: None for the tower, "bluebox", or a function that takes a dac value
+    relock_npts: frames captured after a relock, only the relocked rows are taken from that capture so it
+    can be much shorter than a full point. the frames spent on each relock are kept in relock_extra_frames
+    """
     def __init__(
         self,
         db_cardname,
@@ -47,6 +64,7 @@ class IVPointTaker:
         cringe_control=None,
         voltage_source=None,
         column_number=0,
+        relock_npts=500,
     ):
         self.ec = self._handle_easy_client_arg(easy_client)
         self.cc = self._handle_cringe_control_arg(cringe_control)
@@ -55,20 +73,48 @@ class IVPointTaker:
         self.relock_lo_threshold = relock_threshold_lo_hi[0]
         self.relock_hi_threshold = relock_threshold_lo_hi[1]
         assert self.relock_hi_threshold - self.relock_lo_threshold > 2000
+        self.multi_column = not np.isscalar(column_number)
+        self.cols = [int(col) for col in np.atleast_1d(column_number)]
+        self.db_cardnames = self._per_column_arg(db_cardname, "db_cardname")
+        self.baynames = self._per_column_arg(bayname, "bayname")
+        voltage_sources = self._per_column_arg(voltage_source, "voltage_source")
+        # single column attributes, kept so existing scripts continue to work
         self.db_cardname = db_cardname
         self.bayname = bayname
-        self.col = column_number
-        self._relock_offset = np.zeros(self.ec.nrow)
-        self.set_volt = self._handle_voltage_source_arg(voltage_source)
+        self.col = self.cols[0]
+        self._relock_offset = np.zeros((len(self.cols), self.ec.nrow))
+        self._last_write_time_s = 0
+        self.relock_npts = relock_npts
+        self.relock_extra_frames = []
+        self._set_volt_funcs = [self._handle_voltage_source_arg(voltage_source, i)
+                                for i, voltage_source in enumerate(voltage_sources)]
+        if self.multi_column:
+            self.set_volt = self.set_volt_all_columns
+        else:
+            self.set_volt = self._set_volt_funcs[0]
+
+    def _per_column_arg(self, arg, name):
+        if not self.multi_column or isinstance(arg, str) or arg is None or callable(arg):
+            return [arg]*len(self.cols)
+        assert len(arg) == len(self.cols), f"{name} must have one entry per column, or be a single value"
+        return list(arg)
 
-    def _handle_voltage_source_arg(self, voltage_source):
-        # set "set_volt" to either tower or bluebox
+    def _handle_voltage_source_arg(self, voltage_source, col_index=0):
+        # set "set_volt" to either tower or bluebox, or a user provided function
         if voltage_source == None:
-            set_volt = self.set_tower  # 0-2.5V in 2**16 steps
+            if not self.multi_column:
+                return self.set_tower  # 0-2.5V in 2**16 steps
+            db_cardname, bayname = self.db_cardnames[col_index], self.baynames[col_index]
+            def set_volt(dacvalue):
+                self.cc.set_tower_channel(db_cardname, bayname, int(dacvalue))
+            return set_volt
         elif voltage_source == "bluebox":
-            self.bb = BlueBox(port="tower", version="mrk2")
-            set_volt = self.set_bluebox  # 0 to 6.5535V in 2**16 steps
-        return set_volt
+            if not hasattr(self, "bb"):
+                self.bb = BlueBox(port="tower", version="mrk2")
+            return self.set_bluebox  # 0 to 6.5535V in 2**16 steps
+        elif callable(voltage_source):
+            return voltage_source
+        raise ValueError(f"voltage_source={voltage_source} is invalid, use None, 'bluebox' or a function")
 
     def _handle_easy_client_arg(self, easy_client):
         if easy_client is not None:
@@ -82,36 +128,134 @@ class IVPointTaker:
             return cringe_control
         return CringeControl()
 
+    def _single_or_multi(self, fb_col_row):
+        # fb_col_row has shape (ncols, nrow), return (nrow,) for a single column point taker
+        if self.multi_column:
+            return fb_col_row
+        return fb_col_row[0]
+
+    def _get_fb_raw_all_columns(self):
+        return self.reduce(self.ec.getNewData(delaySeconds=self.delay_s))
+
     def get_fb_raw(self):
-        data = self.ec.getNewData(delaySeconds=self.delay_s)
-        avg_col = data[self.col, :, :, 1].mean(axis=-1)
-        return np.array(avg_col,dtype="float64") # we can't json serialize np.float32, which is the element type of avg_col
+        return self._single_or_multi(self._get_fb_raw_all_columns())
 
-    def get_iv_pt(self, dacvalue):
+    def set_volt_timed(self, dacvalue):
+        """set the detector bias and record when the write finished, so settling can be measured from it"""
         self.set_volt(dacvalue)
-        avg_col = self.get_fb_raw()
-        rows_relocked_hi = []
-        rows_relocked_lo = []
-        for row, fb in enumerate(avg_col):
-            if fb < self.relock_lo_threshold:
-                self.cc.relock_fba(self.col, row)
-                rows_relocked_lo.append(row)
-            if fb > self.relock_hi_threshold:
-                self.cc.relock_fba(self.col, row)
-                rows_relocked_hi.append(row)
-        avg_col_out = avg_col[:]
-        if len(rows_relocked_lo) + len(rows_relocked_hi) > 0:
-            # at least one relock occured
-            print(
-                f"\nrelocked rows: too low {rows_relocked_lo}, too high {rows_relocked_hi}"
-            )
-            data_after = self.ec.getNewData(delaySeconds=self.delay_s)
-            avg_col_after = data_after[self.col, :, :, 1].mean(axis=-1)
-            for row in rows_relocked_lo + rows_relocked_hi:
-                self._relock_offset[row] += avg_col_after[row] - avg_col[row]
-                avg_col_out[row] = avg_col_after[row]
-        return avg_col_out - self._relock_offset
+        self._last_write_time_s = time.time()
+
+    def capture_settled(self):
+        """wait until delay_s has passed since the last set_volt_timed, then return new raw data"""
+        wait_s = self._last_write_time_s + self.delay_s - time.time()
+        if wait_s > 0:
+            time.sleep(wait_s)
+        return self.ec.getNewData(delaySeconds=0)
+
+    def reduce(self, data):
+        """average the feedback of our columns, return shape (ncols, nrow)"""
+        avg_cols = data[self.cols, :, :, 1].mean(axis=-1)
+        return np.array(avg_cols, dtype="float64") # we can't json serialize np.float32, which is the element type of avg_col
+
+    def reduce_and_find_unlocked(self, data, replace=None):
+        """return the averaged feedback and a mask of rows outside the relock thresholds, both shape (ncols, nrow)
+        replace: optional (mask, avg_cols) from reacquire_rows, used for the masked rows instead of data
+        this doesn't talk to any hardware, so it is safe to call from a worker thread"""
+        avg_cols = self.reduce(data)
+        if replace is not None:
+            avg_cols = np.where(replace[0], replace[1], avg_cols)
+        unlocked = np.logical_or(avg_cols < self.relock_lo_threshold, avg_cols > self.relock_hi_threshold)
+        return avg_cols, unlocked
+
+    def relock(self, avg_cols, unlocked):
+        """relock every row in the unlocked mask, with one request to cringe"""
+        col_rows = {col: [int(row) for row in np.nonzero(unlocked[i])[0]] for i, col in enumerate(self.cols)}
+        reply = self.cc.relock_fba_rows(col_rows)
+        if not reply.startswith("ok"):
+            # older cringe without relock_fba_rows
+            for col, rows in col_rows.items():
+                for row in rows:
+                    self.cc.relock_fba(col, row)
+        for i, col in enumerate(self.cols):
+            rows_relocked_lo = []
+            rows_relocked_hi = []
+            for row in col_rows[col]:
+                if avg_cols[i, row] < self.relock_lo_threshold:
+                    rows_relocked_lo.append(row)
+                else:
+                    rows_relocked_hi.append(row)
+            if len(rows_relocked_lo) + len(rows_relocked_hi) > 0:
+                print(
+                    f"\nrelocked col {col} rows: too low {rows_relocked_lo}, too high {rows_relocked_hi}"
+                )
 
+    def reacquire_rows(self, rows):
+        """after a relock, capture relock_npts frames and return the averaged feedback of the rows in the mask rows,
+        shape (ncols, nrow) with nan elsewhere"""
+        data = self.ec.getNewData(delaySeconds=self.delay_s, minimumNumPoints=self.relock_npts, exactNumPoints=True)
+        self.relock_extra_frames.append(data.shape[2])
+        col_inds, row_inds = np.nonzero(rows)
+        avg_cols = np.full(rows.shape, np.nan)
+        avg_cols[col_inds, row_inds] = data[np.array(self.cols)[col_inds], row_inds, :, 1].mean(axis=-1)
+        return avg_cols
+
+    def update_relock_offset(self, avg_cols_before, avg_cols_after, unlocked):
+        """track the feedback jump of relocked rows, before and after must be measured at the same detector bias"""
+        self._relock_offset[unlocked] += avg_cols_after[unlocked] - avg_cols_before[unlocked]
+
+    def get_iv_pt(self, dacvalue):
+        """set the detector bias to dacvalue (a per column sequence is allowed for multi column),
+        return the averaged feedback, relocking any rows that went out of range on any column"""
+        self.set_volt_timed(dacvalue)
+        avg_cols, unlocked = self.reduce_and_find_unlocked(self.capture_settled())
+        if np.any(unlocked):
+            # at least one relock occured, a short acquisition covers the relocked rows, the rest keep their values
+            self.relock(avg_cols, unlocked)
+            avg_cols_after = self.reacquire_rows(unlocked)
+            self.update_relock_offset(avg_cols, avg_cols_after, unlocked)
+            avg_cols = np.where(unlocked, avg_cols_after, avg_cols)
+        return self._single_or_multi(avg_cols - self._relock_offset)
+
+    def stream_dac_schedule(self, dac_values, dwell_s, lead_s=0.2, max_shift_s=0.05, max_jitter_s=0, phi0_fb=None):
+        """write dac_values[1:] one every dwell_s, starting lead_s in, while one continuous acquisition streams.
+        dac_values[0] should already be set.
+        the frame of each write is predicted from the recorded write times, then all are shifted together by up
+        to max_shift_s to line up with the steps seen in the data, then each is moved by up to max_jitter_s.
+        return fb (ncols, nrow, nframes) with flux jumps unwrapped if phi0_fb is given, the frame of each write,
+        the common shift in frames, and the write times relative to the capture request"""
+        assert lead_s > max_shift_s, "the quiet lead is what makes the alignment unambiguous"
+        sample_period_s = 1.0 / self.ec.sample_rate
+        n_frames = int(np.ceil((2 * lead_s + len(dac_values) * dwell_s) / sample_period_s))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            t_capture = time.time()
+            future = executor.submit(self.ec.getNewData, delaySeconds=0, minimumNumPoints=n_frames, exactNumPoints=True)
+            write_times, write_done_times = [], []
+            for k, dac_value in enumerate(dac_values[1:]):
+                t_write = t_capture + lead_s + k * dwell_s
+                if k > 0:
+                    # after a late write, catch up on the schedule without squeezing any step too short
+                    t_write = max(t_write, write_done_times[-1] + 0.75 * dwell_s)
+                time.sleep(max(0, t_write - time.time()))
+                write_times.append(time.time())
+                self.set_volt(dac_value)
+                write_done_times.append(time.time())
+            data = future.result()
+        fb = data[self.cols, :, :, 1].astype("float64")
+        if phi0_fb is not None:
+            fb = unwrap_flux_jumps(fb, phi0_fb)
+        edges = np.round((np.array(write_times) - t_capture) / sample_period_s).astype(int)
+        # the write lands somewhere between the two times, a preempted or slow set_volt can take a few ms
+        late = np.ceil((np.array(write_done_times) - np.array(write_times)) / sample_period_s).astype(int)
+        shift, edges = _align_ramp_edges(
+            fb, edges, int(round(max_shift_s / sample_period_s)), int(round(max_jitter_s / sample_period_s)), late
+        )
+        return fb, edges, int(shift), [t - t_capture for t in write_times]
+
+    def set_volt_all_columns(self, dacvalue):
+        """set every column's detector bias, dacvalue is either one value for all columns or one per column"""
+        dacvalues = np.broadcast_to(dacvalue, (len(self.cols),))
+        for set_volt, v in zip(self._set_volt_funcs, dacvalues):
+            set_volt(v)
 
     def set_tower(self, dacvalue):
         self.cc.set_tower_channel(self.db_cardname, self.bayname, int(dacvalue))
@@ -120,22 +264,25 @@ class IVPointTaker:
         self.bb.setVoltDACUnits(int(dacvalue))
 
     def prep_fb_settings(self, ARLoff=True, I=None, fba_offset=8000):
-        if ARLoff:
-            print("setting ARL (autorelock) off")
-            self.cc.set_arl_off(self.col)
-        if I is not None:
-            print(f"setting I to {I}")
-            self.cc.set_fb_i(self.col, I)
-        if fba_offset is not None:
-            print(f"setting fba offset to {fba_offset}")
-            self.cc.set_fba_offset(self.col, fba_offset)
+        for col in self.cols:
+            if ARLoff:
+                print(f"setting ARL (autorelock) off for col {col}")
+                self.cc.set_arl_off(col)
+            if I is not None:
+                print(f"setting I to {I} for col {col}")
+                self.cc.set_fb_i(col, I)
+            if fba_offset is not None:
+                print(f"setting fba offset to {fba_offset} for col {col}")
+                self.cc.set_fba_offset(col, fba_offset)
 
     def relock_all_locked_rows(self):
         print("relock all locked rows")
-        self.cc.relock_all_locked_fba(self.col)
+        for col in self.cols:
+            self.cc.relock_all_locked_fba(col)
 
     def reset_for_new_curve(self):
-        self._relock_offset = np.zeros(self.ec.nrow)
+        self._relock_offset = np.zeros((len(self.cols), self.ec.nrow))
+        self.relock_extra_frames = []
 
 
 class IVCurveTaker:
@@ -147,12 +294,18 @@ class IVCurveTaker:
         shock_normal_dac_value=2 ** 16 - 1,
         zero_bias_and_relock_and_record_fb_at_end=True,
         adr_gui_control=None,
+        temp_settle_window_s=30,
+        temp_sample_period_s=1.0,
+        temp_settle_max_slope_k_per_s=2e-6,
     ):
         self.pt = point_taker
         self.adr_gui_control = self._handle_adr_gui_control_arg(adr_gui_control)
         self._last_setpoint_k = -1e9
         self.temp_settle_time_out_s = temp_settle_time_out_s
         self.temp_settle_tolerance_k = temp_settle_tolerance_k
+        self.temp_settle_window_s = temp_settle_window_s
+        self.temp_sample_period_s = temp_sample_period_s
+        self.temp_settle_max_slope_k_per_s = temp_settle_max_slope_k_per_s
         self.shock_normal_dac_value = shock_normal_dac_value
         self.zero_bias_and_relock_and_record_fb_at_end = zero_bias_and_relock_and_record_fb_at_end
         self._was_prepped = False
@@ -235,34 +388,71 @@ class IVCurveTaker:
                     self.adr_gui_control.get_temp_k(),
                 )
 
-    def wait_for_temp_stable(self, setpoint_k, tolerance_k, time_out_s, sleep_size_s=5):
-        """ determine if the servo has reached the desired temperature """
+    def wait_for_temp_stable(self, setpoint_k, tolerance_k, time_out_s, sleep_size_s=None):
+        """ determine if the servo has reached the desired temperature, see TempSettleDetector """
+        if sleep_size_s is None:
+            sleep_size_s = self.temp_sample_period_s
         assert sleep_size_s > 0.001
-        latest_temp_k = self.adr_gui_control.get_temp_k()
-        tstart = time.time()
-        while abs(latest_temp_k - setpoint_k) > tolerance_k:
-            time.sleep(sleep_size_s)
-            latest_temp_k = self.adr_gui_control.get_temp_k()
-            print(f"Current Temp: {latest_temp_k*1e3:.02f} mK")
-            elapsed = time.time() - tstart
-            if elapsed > time_out_s:
-                print(
-                    f"wait_for_temp_stable TIMED OUT after {time_out_s} s, setpoint_k={setpoint_k}, with tolerance_k={tolerance_k}"
-                )
-                return False
-        print(
-            f"wait_for_temp_stable REACHED TEMP after {time_out_s} s, setpoint_k={setpoint_k}, with tolerance_k={tolerance_k}"
+        detector = TempSettleDetector(
+            self.adr_gui_control.get_temp_k,
+            tolerance_k=tolerance_k,
+            max_slope_k_per_s=self.temp_settle_max_slope_k_per_s,
+            window_s=self.temp_settle_window_s,
+            sample_period_s=sleep_size_s,
         )
-        return True
+        is_stable = detector.wait(setpoint_k, time_out_s)
+        if is_stable:
+            print(f"wait_for_temp_stable REACHED TEMP setpoint_k={setpoint_k}, with tolerance_k={tolerance_k}")
+        else:
+            print(
+                f"wait_for_temp_stable TIMED OUT after {time_out_s} s, setpoint_k={setpoint_k}, with tolerance_k={tolerance_k}"
+            )
+        return is_stable
+
+    def is_temp_stable(self, setpoint_k, tol, time_out_s):
+        return self.wait_for_temp_stable(setpoint_k, tol, time_out_s)
 
-    def get_curve(self, dac_values, extra_info={}, ignore_prep_requirement=False):
+    def get_curve(self, dac_values, extra_info={}, ignore_prep_requirement=False, pipelined=False):
+        """take an IV curve at each value in dac_values, return an IVCurveColumnData
+        if the point taker has multiple columns they are all measured in the same pass,
+        and a list with one IVCurveColumnData per column is returned
+
+        pipelined: if True the next dac value is written as soon as the data for the current point is captured,
+        and averaging and lock checks run on a worker thread while the next point settles, see _get_points_pipelined
+
+        dac_values may also be an AdaptiveDacPlanner, then the points are chosen while the curve is acquired"""
         assert (
             ignore_prep_requirement or self._was_prepped
         ), "call prep_fb_settings before get_curve, or pass ignore_prep_requirement=True"
+        planner = None
+        if isinstance(dac_values, AdaptiveDacPlanner):
+            assert not pipelined, "an adaptive dac planner needs each point before choosing the next, so it can't be pipelined"
+            planner = dac_values
+            dac_values = [planner.dac_start]
         dac_values = self._handle_dac_values_int(dac_values)
-        pre_temp_k = self.adr_gui_control.get_temp_k()
-        pre_time = time.time()
-        pre_hout = self.adr_gui_control.get_hout()
+        pre = self._start_curve(dac_values[0])
+        if planner is not None:
+            bar = progress.bar.Bar("getting IV points (adaptive)", max=planner.max_points)
+            dac_values, fb_values = self._get_points_adaptive(planner, bar)
+        elif pipelined:
+            bar = progress.bar.Bar("getting IV points", max=len(dac_values))
+            fb_values = self._get_points_pipelined(dac_values, bar)
+        else:
+            bar = progress.bar.Bar("getting IV points", max=len(dac_values))
+            fb_values = []
+            for dac_value in dac_values:
+                fb_values.append(self.pt.get_iv_pt(dac_value))
+                bar.next()
+        bar.finish()
+        return self._finish_curve(pre, dac_values, fb_values, extra_info)
+
+    def _start_curve(self, first_dac_value):
+        """record the pre curve state, shock normal, then go to the first dac value and relock"""
+        pre = {
+            "pre_temp_k": self.adr_gui_control.get_temp_k(),
+            "pre_time_epoch_s": time.time(),
+            "pre_hout": self.adr_gui_control.get_hout(),
+        }
         # temp_rms and slope will not be very useful if you just changed temp, so get them at end only
         self.pt.reset_for_new_curve()
         self.pt.set_volt(self.shock_normal_dac_value)
@@ -270,20 +460,20 @@ class IVCurveTaker:
             0.05
         )  # inserted because immediately commanding the lower dac value didn't take.
         # was stuck at shock_normal_dac_value and this affected the first few points
-        self.pt.set_volt(dac_values[0])  # go to the first dac value and relock all
+        self.pt.set_volt(first_dac_value)  # go to the first dac value and relock all
         time.sleep(0.05)
         self.pt.relock_all_locked_rows()
-        fb_values = []
-        bar = progress.bar.Bar("getting IV points", max=len(dac_values))
-        for dac_value in dac_values:
-            fb_values.append(self.pt.get_iv_pt(dac_value))
-            bar.next()
-        bar.finish()
+        return pre
+
+    def _finish_curve(self, pre, dac_values, fb_values, extra_info):
+        """record the post curve state and zero bias fb, return an IVCurveColumnData or a list of them"""
         post_temp_k = self.adr_gui_control.get_temp_k()
         post_time = time.time()
         post_hout = self.adr_gui_control.get_hout()
         post_temp_rms_uk = self.adr_gui_control.get_temp_rms_uk()
         post_slope_hout_per_hour = self.adr_gui_control.get_slope_hout_per_hour()
+        if len(self.pt.relock_extra_frames) > 0:
+            extra_info = dict(extra_info, relock_extra_frames=list(self.pt.relock_extra_frames))
         if self.zero_bias_and_relock_and_record_fb_at_end:
             print(f"zero detector bias, relock, and record fb")
             self.pt.set_volt(0)
@@ -293,24 +483,112 @@ class IVCurveTaker:
         else:
             zero_bias_fb = None
 
-        return IVCurveColumnData(
-            nominal_temp_k=self._last_setpoint_k,
-            pre_temp_k=pre_temp_k,
-            post_temp_k=post_temp_k,
-            pre_time_epoch_s=pre_time,
-            post_time_epoch_s=post_time,
-            pre_hout=pre_hout,
-            post_hout=post_hout,
-            post_slope_hout_per_hour=post_slope_hout_per_hour,
-            dac_values=dac_values,
-            bayname=self.pt.bayname,
-            db_cardname=self.pt.db_cardname,
-            column_number=self.pt.col,
-            extra_info=extra_info,
-            fb_values=fb_values,
-            pre_shock_dac_value=self.shock_normal_dac_value,
-            zero_bias_fb=zero_bias_fb
+        def make_curve(i, fb_values, zero_bias_fb):
+            return IVCurveColumnData(
+                nominal_temp_k=self._last_setpoint_k,
+                post_temp_k=post_temp_k,
+                post_time_epoch_s=post_time,
+                post_hout=post_hout,
+                post_slope_hout_per_hour=post_slope_hout_per_hour,
+                dac_values=dac_values,
+                bayname=self.pt.baynames[i],
+                db_cardname=self.pt.db_cardnames[i],
+                column_number=self.pt.cols[i],
+                extra_info=extra_info,
+                fb_values=fb_values,
+                pre_shock_dac_value=self.shock_normal_dac_value,
+                zero_bias_fb=zero_bias_fb,
+                **pre
+            )
+
+        if not self.pt.multi_column:
+            return make_curve(0, fb_values, zero_bias_fb)
+        curves = []
+        for i in range(len(self.pt.cols)):
+            curves.append(make_curve(i, [fb[i] for fb in fb_values],
+                                     None if zero_bias_fb is None else zero_bias_fb[i]))
+        return curves
+
+    def _get_points_pipelined(self, dac_values, bar):
+        """return the same fb values as calling get_iv_pt for each dac value, but overlap the averaging and
+        lock checks of point k with the settling and acquisition of point k+1
+
+        a relock found at point k is done at the bias of point k+1, so we never step back up the IV.
+        the speculative capture at k+1 is the pre-relock measurement for the relock offset, and only the
+        relocked rows of point k+1 are reacquired. the value reported for point k is its pre-relock value,
+        as in get_iv_pt"""
+        fb_values = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            self.pt.set_volt_timed(dac_values[0])
+            data = self.pt.capture_settled()
+            replace = None
+            for k in range(len(dac_values)):
+                future = executor.submit(self.pt.reduce_and_find_unlocked, data, replace)
+                has_next = k+1 < len(dac_values)
+                if has_next:
+                    self.pt.set_volt_timed(dac_values[k+1])
+                    next_data = self.pt.capture_settled()
+                avg_cols, unlocked = future.result()
+                fb_values.append(self.pt._single_or_multi(avg_cols - self.pt._relock_offset))
+                replace = None
+                if np.any(unlocked):
+                    if has_next:
+                        avg_cols_before = self.pt.reduce(next_data)
+                    else:
+                        avg_cols_before = avg_cols
+                    self.pt.relock(avg_cols, unlocked)
+                    avg_cols_after = self.pt.reacquire_rows(unlocked)
+                    self.pt.update_relock_offset(avg_cols_before, avg_cols_after, unlocked)
+                    replace = (unlocked, avg_cols_after)
+                bar.next()
+                if has_next:
+                    data = next_data
+        return fb_values
+
+    def _get_points_adaptive(self, planner, bar):
+        dac_values = []
+        fb_values = []
+        dac_value = planner.next_dac(dac_values, fb_values)
+        while dac_value is not None:
+            fb_values.append(self.pt.get_iv_pt(dac_value))
+            dac_values.append(dac_value)
+            bar.next()
+            dac_value = planner.next_dac(dac_values, fb_values)
+        return dac_values, fb_values
+
+    def get_curve_ramp(self, dac_values, dwell_s=0.01, settle_fraction=0.3, lead_s=0.2, max_shift_s=0.05,
+                       phi0_fb=None, extra_info={}, ignore_prep_requirement=False):
+        """take an IV curve by stepping through dac_values on a fixed schedule, one step every dwell_s,
+        while a single continuous acquisition streams. each bias step is cut out of the timestream and
+        averaged, so there is no settle delay or getNewData per point, a 500 point IV takes seconds.
+        returns the same as get_curve.
+
+        steps are found in the timestream by IVPointTaker.stream_dac_schedule, each step may be moved by up to
+        settle_fraction of a dwell to absorb write jitter, and the first settle_fraction of each step is skipped.
+        rows can't be relocked during the ramp, so pass phi0_fb (scalar or per (col, row)) to unwrap flux jumps
+        from autorelock, with a threshold of 0.8 phi0"""
+        assert (
+            ignore_prep_requirement or self._was_prepped
+        ), "call prep_fb_settings before get_curve_ramp, or pass ignore_prep_requirement=True"
+        assert settle_fraction <= 0.5
+        dac_values = self._handle_dac_values_int(dac_values)
+        pre = self._start_curve(dac_values[0])
+        sample_period_s = 1.0 / self.pt.ec.sample_rate
+        dwell_frames = dwell_s / sample_period_s
+        assert 0.75 * dwell_frames * (1 - settle_fraction) >= 4, "dwell_s is too short to average anything at this sample rate"
+        fb, edges, shift, write_times_s = self.pt.stream_dac_schedule(
+            dac_values, dwell_s, lead_s, max_shift_s, settle_fraction * dwell_s, phi0_fb
         )
+        # step 0 was written before the capture started, give it one dwell like the others
+        edges = np.hstack([edges[0] - int(round(dwell_frames)), edges, edges[-1] + int(round(dwell_frames))])
+        starts = edges[:-1] + np.ceil(settle_fraction * np.diff(edges)).astype(int)
+        # drop a couple frames at the end of each step, the edges are only good to about a frame
+        stops = edges[1:] - 2
+        assert starts[0] >= 0 and stops[-1] <= fb.shape[-1], "ramp didn't fit in the capture, increase lead_s"
+        fb_means = _segment_means(fb, starts, stops)  # (ncols, nrow, npts)
+        fb_values = [self.pt._single_or_multi(fb_means[:, :, k]) for k in range(len(dac_values))]
+        extra_info = dict(extra_info, ramp_dwell_s=dwell_s, ramp_shift_frames=shift, ramp_write_times_s=write_times_s)
+        return self._finish_curve(pre, dac_values, fb_values, extra_info)
 
     def _handle_dac_values_int(self, dac_values):
         """ensure values passed to set_volt are integers, and recorded as such """
@@ -326,6 +604,60 @@ class IVCurveTaker:
         return self.pt.prep_fb_settings(ARLoff, I, fba_offset)
 
 
+class BiasStepTaker:
+    """measure the small signal response of every row to a square wave on the detector bias, much faster than
+    an IV for tracking where detectors sit in their transition, see BiasStepData.small_signal"""
+
+    def __init__(self, point_taker, adr_gui_control=None):
+        self.pt = point_taker
+        self.adr_gui_control = adr_gui_control
+
+    def get_bias_steps(self, dac_value, step_dac=200, n_periods=10, half_period_s=0.02, lead_s=0.2,
+                       max_shift_s=0.05, phi0_fb=None, extra_info={}):
+        """apply a square wave of peak to peak step_dac around dac_value for n_periods, in one streaming
+        acquisition, and return a BiasStepData (or one per column for a multi column point taker).
+        the detector should already be biased near dac_value, eg at the end of a get_curve or set_volt"""
+        dac_value = int(round(dac_value))
+        step_dac = int(round(step_dac))
+        lo, hi = dac_value - step_dac // 2, dac_value - step_dac // 2 + step_dac
+        schedule = [hi, lo] * n_periods + [hi]
+        self.pt.set_volt(schedule[0])
+        time.sleep(0.05)
+        temp_k = self.adr_gui_control.get_temp_k() if self.adr_gui_control is not None else np.nan
+        time_epoch_s = time.time()
+        sample_period_s = 1.0 / self.pt.ec.sample_rate
+        fb, edges, shift, write_times_s = self.pt.stream_dac_schedule(
+            schedule, half_period_s, lead_s, max_shift_s, 0.2 * half_period_s, phi0_fb
+        )
+        self.pt.set_volt(dac_value)
+        step_response, fb_mean = _average_step_response(fb, edges, np.diff(schedule))
+        fast, slow, tau_s = _fit_step_response(step_response, sample_period_s)
+        extra_info = dict(extra_info, bias_step_shift_frames=shift, bias_step_write_times_s=write_times_s)
+
+        def make_data(i):
+            return BiasStepData(
+                dac_value=dac_value,
+                step_dac=step_dac,
+                half_period_s=half_period_s,
+                sample_period_s=sample_period_s,
+                temp_k=temp_k,
+                time_epoch_s=time_epoch_s,
+                bayname=self.pt.baynames[i],
+                db_cardname=self.pt.db_cardnames[i],
+                column_number=self.pt.cols[i],
+                fb_mean=fb_mean[i],
+                step_response=step_response[i],
+                dfb_ddac_fast=fast[i],
+                dfb_ddac_slow=slow[i],
+                tau_s=tau_s[i],
+                extra_info=extra_info,
+            )
+
+        if not self.pt.multi_column:
+            return make_data(0)
+        return [make_data(i) for i in range(len(self.pt.cols))]
+
+
 class IVTempSweeper:
     def __init__(
         self,
@@ -351,22 +683,166 @@ class IVTempSweeper:
             )
             self.curve_taker.set_temp_and_settle(set_temp_k)
 
-    def get_sweep(self, dac_values, set_temps_k, extra_info={}):
-        datas = []
+    def get_sweep(self, dac_values, set_temps_k, extra_info={}, checkpoint_filename=None, resume_from=None,
+                  overwrite_checkpoint=False):
+        """return an IVTempSweepData, or a list with one IVTempSweepData per column for a multi column point taker
+
+        checkpoint_filename: write an IVSweepCheckpoint there after every curve, it must not exist unless
+        overwrite_checkpoint is True
+        resume_from: filename of the checkpoint of a run that died, temps already measured are skipped
+        and the checkpoint keeps being written to the same file"""
+        checkpoint = _handle_checkpoint_args(checkpoint_filename, resume_from, [], set_temps_k, dac_values,
+                                             overwrite_checkpoint)
+        if resume_from is not None:
+            self.verify_temps_for_resume(checkpoint)
+        self._get_sweep_checkpointed(dac_values, set_temps_k, extra_info, checkpoint)
+        return self._temp_sweep_data(checkpoint, set_temps_k)
+
+    def _get_sweep_checkpointed(self, dac_values, set_temps_k, extra_info, checkpoint, set_cl_temp_k=None):
         for set_temp_k in set_temps_k:
+            if checkpoint.is_done(set_cl_temp_k, set_temp_k):
+                print(f"skipping {set_temp_k} K, already in checkpoint")
+                continue
+            checkpoint.last_setpoint_k = float(set_temp_k)
             self.initialize_bath_temp(set_temp_k)
             data = self.curve_taker.get_curve(dac_values, extra_info)
-            datas.append(data)
-        return IVTempSweepData(set_temps_k, datas)
+            if not self.curve_taker.pt.multi_column:
+                data = [data]
+            checkpoint.add_curves(set_cl_temp_k, set_temp_k, data)
+
+    def _temp_sweep_data(self, checkpoint, set_temps_k, set_cl_temp_k=None):
+        datas = [checkpoint.get_curves(set_cl_temp_k, set_temp_k) for set_temp_k in set_temps_k]
+        if self.curve_taker.pt.multi_column:
+            return [IVTempSweepData(set_temps_k, [data[i] for data in datas])
+                    for i in range(len(self.curve_taker.pt.cols))]
+        return IVTempSweepData(set_temps_k, [data[0] for data in datas])
+
+    def verify_temps_for_resume(self, checkpoint):
+        """print where the bath is compared to the checkpoint, the bath is always set and settled again before
+        the next curve, so this is informational"""
+        temp_k = self.curve_taker.adr_gui_control.get_temp_k()
+        print(
+            f"resuming with {checkpoint.n_remaining()} curves to go, last bath setpoint {checkpoint.last_setpoint_k} K, "
+            f"bath now at {temp_k} K"
+        )
+
+
+class IVTempRampSweeper:
+    """take IVs back to back while the ADR setpoint ramps slowly, instead of settling at each temperature like
+    IVTempSweeper, so the sweep time is set by the ramp rate"""
+
+    def __init__(self, curve_taker, setpoint_update_s=1.0):
+        self.curve_taker = curve_taker
+        self.setpoint_update_s = setpoint_update_s
+        self.trace = []  # (time_s, setpoint_k, temp_k) for every setpoint update
+
+    def get_sweep(self, dac_values, start_temp_k, stop_temp_k, ramp_rate_k_per_s, ramp_iv=True, extra_info={},
+                  **curve_kwargs):
+        """settle at start_temp_k, then ramp the setpoint to stop_temp_k at ramp_rate_k_per_s while taking IVs
+        back to back, with get_curve_ramp if ramp_iv else get_curve, curve_kwargs are passed on.
+        the setpoint is updated and the temperature read every setpoint_update_s on a separate thread, each
+        curve gets the readings taken during it in extra_info (temp_trace_time_s, temp_trace_k,
+        temp_trace_setpoint_k) and the mean reading as nominal_temp_k. the last curve starts after the ramp ends.
+        return an IVTempSweepData with set_temps_k the mean readings (or one per column), see
+        IVTempSweepData.psat_vs_temp"""
+        assert ramp_rate_k_per_s > 0
+        self.curve_taker.set_temp_and_settle(start_temp_k)
+        adr_gui_control = self.curve_taker.adr_gui_control
+        # the curve taker reads temperatures too, and a zmq REQ socket can't be shared between threads unlocked
+        self.curve_taker.adr_gui_control = _LockedAdrGuiControl(adr_gui_control)
+        self.trace = []
+        stop_event = threading.Event()
+        ramp_done_event = threading.Event()
+        ramp_thread = threading.Thread(
+            target=self._ramp,
+            args=(start_temp_k, stop_temp_k, ramp_rate_k_per_s, stop_event, ramp_done_event),
+            daemon=True,
+        )
+        take_curve = self.curve_taker.get_curve_ramp if ramp_iv else self.curve_taker.get_curve
+        datas = []
+        try:
+            ramp_thread.start()
+            while True:
+                ramp_was_done = ramp_done_event.is_set()
+                t_start = time.time()
+                data = take_curve(dac_values, extra_info=dict(extra_info), **curve_kwargs)
+                t_end = time.time()
+                if not self.curve_taker.pt.multi_column:
+                    data = [data]
+                self._tag_curves(data, t_start, t_end)
+                datas.append(data)
+                print(f"ramped IV {len(datas)} at {data[0].nominal_temp_k*1e3:.3f} mK")
+                if ramp_was_done:
+                    break
+        finally:
+            stop_event.set()
+            ramp_thread.join()
+            self.curve_taker.adr_gui_control = adr_gui_control
+        temps_k = [data[0].nominal_temp_k for data in datas]
+        if self.curve_taker.pt.multi_column:
+            return [IVTempSweepData(temps_k, [data[i] for data in datas]) for i in range(len(self.curve_taker.pt.cols))]
+        return IVTempSweepData(temps_k, [data[0] for data in datas])
+
+    def _ramp(self, start_temp_k, stop_temp_k, ramp_rate_k_per_s, stop_event, ramp_done_event):
+        adr_gui_control = self.curve_taker.adr_gui_control
+        span_k = abs(stop_temp_k - start_temp_k)
+        direction = np.sign(stop_temp_k - start_temp_k)
+        t0 = time.time()
+        while not stop_event.is_set():
+            t = time.time()
+            ramp_done = ramp_rate_k_per_s * (t - t0) >= span_k
+            if ramp_done:
+                setpoint_k = stop_temp_k
+            else:
+                setpoint_k = start_temp_k + direction * ramp_rate_k_per_s * (t - t0)
+            adr_gui_control.set_temp_k(float(setpoint_k))
+            self.trace.append((t, setpoint_k, adr_gui_control.get_temp_k()))
+            if ramp_done:
+                ramp_done_event.set()
+            stop_event.wait(self.setpoint_update_s)
+
+    def _tag_curves(self, curves, t_start, t_end):
+        trace = [x for x in self.trace if t_start <= x[0] <= t_end]
+        if len(trace) == 0:
+            # the curve was quicker than a setpoint update, use the reading nearest its middle
+            trace = [min(self.trace, key=lambda x: abs(x[0] - 0.5 * (t_start + t_end)))]
+        times_s, setpoints_k, temps_k = zip(*trace)
+        for curve in curves:
+            curve.extra_info = dict(
+                curve.extra_info,
+                temp_trace_time_s=[t - t_start for t in times_s],
+                temp_trace_setpoint_k=list(setpoints_k),
+                temp_trace_k=list(temps_k),
+            )
+            curve.nominal_temp_k = float(np.mean(temps_k))
+
+
+class _LockedAdrGuiControl:
+    """pass calls through to an AdrGuiControl one at a time, so it can be used from more than one thread"""
+
+    def __init__(self, adr_gui_control):
+        self._adr_gui_control = adr_gui_control
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._adr_gui_control, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
 
 
 class IVColdloadSweeper:
-    def __init__(self, ivsweeper, loop_channel=1):
+    def __init__(self, ivsweeper, loop_channel=1, t_channel="a"):
         self.ivsweeper = ivsweeper  # instance of IVTempSweeper
         from instruments import Cryocon22
 
         self.ccon = Cryocon22()
         self.loop_channel = loop_channel
+        self.t_channel = t_channel
 
     def initialize_bath_temp(self, set_temp_k):
         if self.to_normal_method == None:
@@ -386,8 +862,15 @@ class IVColdloadSweeper:
         setpoint_timeout_m=5,
         post_setpoint_waittime_m=20,
         verbose=True,
+        settle_detect=True,
+        settle_window_m=2,
+        max_slope_k_per_m=0.0005,
     ):
-        """ servo coldload to temperature T and wait for temperature to stabilize """
+        """ servo coldload to temperature T and wait for temperature to stabilize
+
+        with settle_detect the coldload thermometer is sampled until it is statistically settled at the setpoint,
+        see TempSettleDetector, waiting at most setpoint_timeout_m+post_setpoint_waittime_m minutes.
+        otherwise wait up to setpoint_timeout_m to reach the setpoint, then a fixed post_setpoint_waittime_m"""
         assert (
             set_coldload_temp_k < 50.0
         ), "Coldload temperature setpoint may not exceed 50K"
@@ -397,6 +880,18 @@ class IVColdloadSweeper:
             temp=set_coldload_temp_k, loop_channel=self.loop_channel
         )
 
+        if settle_detect:
+            detector = TempSettleDetector(
+                lambda: self.ccon.getTemperature(self.t_channel),
+                tolerance_k=tolerance_k,
+                max_slope_k_per_s=max_slope_k_per_m / 60,
+                window_s=60 * settle_window_m,
+                sample_period_s=5,
+            )
+            return detector.wait(
+                set_coldload_temp_k, 60 * (setpoint_timeout_m + post_setpoint_waittime_m), verbose=verbose
+            )
+
         # wait for thermometer on coldload to reach set_coldload_temp_k --------------------------------------------
         is_stable = self.ccon.isTemperatureStable(self.loop_channel, tolerance_k)
         stable_num = 0
@@ -415,12 +910,13 @@ class IVColdloadSweeper:
             time.sleep(60 * post_setpoint_waittime_m / 100)
             bar.next()
         bar.finish()
+        return is_stable
 
     def _prepareColdload(self, set_cl_temp_k):
         self.ccon.controlLoopSetup(
             loop_channel=self.loop_channel,
             control_temp=set_cl_temp_k,
-            t_channel="a",
+            t_channel=self.t_channel,
             PID=[1, 5, 0],
             heater_range="low",
         )  # setup BB control
@@ -436,19 +932,40 @@ class IVColdloadSweeper:
         cl_temp_tolerance_k=0.001,
         cl_settemp_timeout_m=5,
         cl_post_setpoint_waittime_m=20,
+        cl_settle_detect=True,
         skip_first_settle=True,
         cool_upon_finish=True,
         extra_info={},
         write_while_acquire=False,
         filename=None,
+        checkpoint_filename=None,
+        resume_from=None,
+        overwrite_checkpoint=False,
     ):
-
-        self._prepareColdload(set_cl_temps_k[0])  # control enabled after this point
-        datas = []
-        pre_cl_temps_k = []
-        post_cl_temps_k = []
-        for ii, set_cl_temp_k in enumerate(set_cl_temps_k):
-            if ii == 0 and skip_first_settle:
+        """checkpoint_filename: write an IVSweepCheckpoint there after every curve, it must not exist unless
+        overwrite_checkpoint is True
+        resume_from: filename of the checkpoint of a run that died. completed (coldload temp, bath temp) pairs are
+        skipped, the coldload is settled again before continuing, and data is written to the same files"""
+        assert not self.ivsweeper.curve_taker.pt.multi_column, "IVColdloadSweeper supports only a single column"
+        checkpoint = _handle_checkpoint_args(checkpoint_filename, resume_from, set_cl_temps_k, set_temps_k, dac_values,
+                                             overwrite_checkpoint)
+        if len(checkpoint.pre_cl_temps_k) == 0:
+            checkpoint.pre_cl_temps_k = [None] * len(set_cl_temps_k)
+            checkpoint.post_cl_temps_k = [None] * len(set_cl_temps_k)
+        if filename is None:
+            filename = checkpoint.data_filename
+        checkpoint.data_filename = filename
+        todo = [
+            ii for ii, set_cl_temp_k in enumerate(set_cl_temps_k)
+            if not all(checkpoint.is_done(set_cl_temp_k, set_temp_k) for set_temp_k in set_temps_k)
+        ]
+        if resume_from is not None:
+            self.verify_temps_for_resume(checkpoint)
+        if len(todo) > 0:
+            self._prepareColdload(set_cl_temps_k[todo[0]])  # control enabled after this point
+        for ii in todo:
+            set_cl_temp_k = set_cl_temps_k[ii]
+            if ii == 0 and skip_first_settle and resume_from is None:
                 pass
             else:
                 self.set_coldload_temp_and_settle(
@@ -457,32 +974,77 @@ class IVColdloadSweeper:
                     setpoint_timeout_m=cl_settemp_timeout_m,
                     post_setpoint_waittime_m=cl_post_setpoint_waittime_m,
                     verbose=True,
+                    settle_detect=cl_settle_detect,
                 )
-            pre_cl_temp_k = self.ccon.getTemperature()
-            data = self.ivsweeper.get_sweep(
+            checkpoint.last_cl_setpoint_k = float(set_cl_temp_k)
+            if checkpoint.pre_cl_temps_k[ii] is None:
+                checkpoint.pre_cl_temps_k[ii] = self.ccon.getTemperature()
+            self.ivsweeper._get_sweep_checkpointed(
                 dac_values,
                 set_temps_k,
-                extra_info={
+                {
                     "coldload_temp_setpoint": set_cl_temp_k,
-                    "pre_coldload_temp": pre_cl_temp_k,
+                    "pre_coldload_temp": checkpoint.pre_cl_temps_k[ii],
                 },
+                checkpoint,
+                set_cl_temp_k,
             )
-            post_cl_temp_k = self.ccon.getTemperature()
-            datas.append(data)
-            pre_cl_temps_k.append(pre_cl_temp_k)
-            post_cl_temps_k.append(post_cl_temp_k)
-            extra_info["pre_cl_temps_k"] = pre_cl_temps_k
-            extra_info["post_cl_temps_k"] = post_cl_temps_k
+            checkpoint.post_cl_temps_k[ii] = self.ccon.getTemperature()
+            checkpoint.save()
             if write_while_acquire:
                 temp_filename = _handle_file_extension(filename)
-                temp_df = IVColdloadSweepData(set_cl_temps_k, datas, extra_info)
-                temp_df.to_file(temp_filename, overwrite=True)
+                self._coldload_sweep_data(checkpoint, set_temps_k, extra_info, ii + 1).to_file(
+                    temp_filename, overwrite=True
+                )
 
         if cool_upon_finish:
             print("Setting coldload to base temperature")
             self.ccon.setControlTemperature(3.0)
             self.ccon.setControlState("off")
-        return IVColdloadSweepData(set_cl_temps_k, datas, extra_info)
+        return self._coldload_sweep_data(checkpoint, set_temps_k, extra_info, len(set_cl_temps_k))
+
+    def _coldload_sweep_data(self, checkpoint, set_temps_k, extra_info, n_cl_temps):
+        """IVColdloadSweepData with the first n_cl_temps coldload temps from the checkpoint"""
+        datas = [
+            self.ivsweeper._temp_sweep_data(checkpoint, set_temps_k, set_cl_temp_k)
+            for set_cl_temp_k in checkpoint.set_cl_temps_k[:n_cl_temps]
+        ]
+        extra_info["pre_cl_temps_k"] = checkpoint.pre_cl_temps_k[:n_cl_temps]
+        extra_info["post_cl_temps_k"] = checkpoint.post_cl_temps_k[:n_cl_temps]
+        return IVColdloadSweepData(checkpoint.set_cl_temps_k, datas, extra_info)
+
+    def verify_temps_for_resume(self, checkpoint):
+        """print where the coldload and bath are compared to the checkpoint, both are set and settled again
+        before the next curve"""
+        print(
+            f"resuming with {checkpoint.n_remaining()} curves to go, last coldload setpoint {checkpoint.last_cl_setpoint_k} K, "
+            f"coldload now at {self.ccon.getTemperature(self.t_channel)} K"
+        )
+        self.ivsweeper.verify_temps_for_resume(checkpoint)
+
+
+def _handle_checkpoint_args(checkpoint_filename, resume_from, set_cl_temps_k, set_temps_k, dac_values,
+                            overwrite_checkpoint=False):
+    """return a new IVSweepCheckpoint, or the one loaded from resume_from after checking it is for the same sweep"""
+    if resume_from is None:
+        if checkpoint_filename is not None and not overwrite_checkpoint:
+            assert not os.path.isfile(checkpoint_filename), (
+                f"{checkpoint_filename} exists, pass resume_from= to continue that sweep or overwrite_checkpoint=True")
+        checkpoint = IVSweepCheckpoint(
+            set_cl_temps_k=[float(t) for t in set_cl_temps_k],
+            set_temps_k=[float(t) for t in set_temps_k],
+            dac_values=[int(round(d)) for d in dac_values],
+            filename=checkpoint_filename,
+        )
+        checkpoint.save()
+        return checkpoint
+    checkpoint = IVSweepCheckpoint.from_file(resume_from)
+    assert checkpoint.set_cl_temps_k == [float(t) for t in set_cl_temps_k], "checkpoint is for other coldload temps"
+    assert checkpoint.set_temps_k == [float(t) for t in set_temps_k], "checkpoint is for other bath temps"
+    assert checkpoint.dac_values == [int(round(d)) for d in dac_values], "checkpoint is for other dac values"
+    if checkpoint_filename is not None:
+        checkpoint.filename = checkpoint_filename
+    return checkpoint
 
 
 def _handle_file_extension(filename, suffix=".json"):
@@ -501,5 +1063,149 @@ def _handle_file_extension(filename, suffix=".json"):
     return new_filename
 
 
+def _align_ramp_edges(fb, edges, max_shift, max_jitter, late=None):
+    """line up the predicted step edges with the frame to frame changes in fb, summed over all channels after
+    normalizing each by its typical change. first find the common shift in [-max_shift, max_shift], then move each
+    edge by up to max_jitter to the largest change near it, or up to max_jitter+late later where late is how many
+    frames the write may have been late. edges with no clear change stay put.
+    return the common shift and the refined edges"""
+    late = np.zeros(len(edges), dtype=int) if late is None else np.asarray(late, dtype=int)
+    activity = np.abs(np.diff(fb, axis=-1))
+    noise = np.median(activity, axis=-1, keepdims=True)
+    noise[noise == 0] = 1
+    activity = np.sum(activity / noise, axis=tuple(range(activity.ndim - 1)))
+    # a step written at frame e shows up in diff index e-1, pad so windows never run off the end
+    pad = max_shift + max_jitter + int(np.max(late, initial=0)) + 1
+    activity = np.hstack([np.zeros(pad), activity, np.zeros(pad)])
+    edges = edges - 1 + pad
+    shifts = np.arange(-max_shift, max_shift + 1)
+    # each predicted edge is rounded to a frame on its own and may be one off, so score the common shift on
+    # activity summed over a few frames. otherwise a periodic schedule can lock on one whole step away
+    smoothed = np.convolve(activity, np.ones(3), mode="same")
+    score = smoothed[edges[np.newaxis, :] + shifts[:, np.newaxis]].sum(axis=1)
+    shift = shifts[np.argmax(score)]
+    jitters = np.arange(-max_jitter, max_jitter + int(np.max(late, initial=0)) + 1)
+    windows = activity[(edges + shift)[:, np.newaxis] + jitters[np.newaxis, :]]
+    # never move an edge halfway to its neighbour, a late write can go up to the next predicted edge
+    gaps = np.diff(edges)
+    reach = np.minimum(np.hstack([gaps, max_jitter]), np.hstack([max_jitter, gaps])) // 2 - 1
+    reach_late = np.minimum(np.minimum(reach, max_jitter) + late, np.hstack([gaps - 2, max_jitter + late[-1:]]))
+    reach_late = np.maximum(reach, reach_late)
+    windows[(jitters[np.newaxis, :] < -reach[:, np.newaxis]) | (jitters[np.newaxis, :] > reach_late[:, np.newaxis])] = 0
+    best = np.argmax(windows, axis=1)
+    clear = windows[np.arange(len(edges)), best] > 2 * np.median(windows, axis=1)
+    refined = edges + shift + np.where(clear, jitters[best], 0)
+    return shift, refined + 1 - pad
+
+
+def _segment_means(fb, starts, stops):
+    """mean of fb[..., start:stop] for each start, stop pair, the segment index becomes the last axis"""
+    cs = np.concatenate([np.zeros(fb.shape[:-1] + (1,)), np.cumsum(fb, axis=-1)], axis=-1)
+    return (cs[..., stops] - cs[..., starts]) / (stops - starts)
+
+
+def _average_step_response(fb, edges, dac_steps):
+    """average the response of fb (..., nframes) to the dac steps written at frames edges, scaled to a +1 dac step
+    and zeroed on the end of the half period before each step. return the response (..., n) where n fits
+    between the closest edges, and the mean of fb over all the steps"""
+    n = int(np.min(np.diff(edges))) - 2
+    n_pre = max(n // 5, 1)
+    pre_inds = edges[:, np.newaxis] + np.arange(-n_pre - 2, -2)[np.newaxis, :]
+    inds = edges[:, np.newaxis] + np.arange(n)[np.newaxis, :]
+    assert pre_inds.min() >= 0 and inds.max() < fb.shape[-1], "bias steps didn't fit in the capture"
+    pre_level = fb[..., pre_inds].mean(axis=-1)  # (..., nsteps)
+    responses = (fb[..., inds] - pre_level[..., np.newaxis]) / np.asarray(dac_steps)[:, np.newaxis]
+    fb_mean = fb[..., edges[0]:edges[-1]].mean(axis=-1)
+    return responses.mean(axis=-2), fb_mean
+
+
+def _fit_step_response(step_response, sample_period_s):
+    """return the fast (first frame after the step), slow (settled, mean of the last fifth) and tau_s for
+    each trace along the last axis. tau_s is the area between the response and its settled value over the
+    fast minus slow difference, which is exact for a single exponential and needs no iterative fit"""
+    n = step_response.shape[-1]
+    slow = step_response[..., -max(n // 5, 1):].mean(axis=-1)
+    # frame 0 may straddle the step, so the first full frame after it is frame 1
+    fast = step_response[..., 1]
+    y = step_response[..., 1:] - slow[..., np.newaxis]
+    area = (np.sum(y, axis=-1) - 0.5 * y[..., 0]) * sample_period_s
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tau_s = area / (fast - slow)
+    return fast, slow, tau_s
+
+
 def sparse_then_fine_dacs(a, b, c, n_ab, n_bc):
     return np.hstack([np.linspace(a, b, n_ab), np.linspace(b, c, n_bc + 1)[1:]])
+
+
+class AdaptiveDacPlanner:
+    """Choose the dac values of an IV curve while it is acquired, pass one to IVCurveTaker.get_curve in place of dac_values.
+
+    Points always go from dac_start down to dac_stop, because the transition is hysteretic we can't go back to refine,
+    so refinement decisions are made from the points taken so far. The first n_normal_fit points are assumed normal, and
+    a line fit to them gives the normal branch slope and the feedback value at zero current for every row.
+    From those each new point gets a resistance fraction proxy rfrac = (normal branch current)/(measured current),
+    which is 1 on the normal branch, falls through the transition and is near 0 on the superconducting branch.
+    A row is in its transition when rfrac_lo < rfrac < rfrac_hi, or when the running dI/dV (local dfb/ddac) differs
+    from the normal slope by more than slope_tol fractionally while rfrac > rfrac_lo.
+    When any row is in its transition we take fine_step, otherwise coarse_step. Rows whose feedback changes by less
+    than min_normal_fb_change over the normal fit points are ignored.
+    max_points caps the total, the step grows when needed so the curve always reaches dac_stop within budget.
+    """
+
+    def __init__(self, dac_start, dac_stop=0, coarse_step=1000, fine_step=100, max_points=200,
+                 n_normal_fit=4, rfrac_lo=0.02, rfrac_hi=0.98, slope_tol=0.1, min_normal_fb_change=20):
+        assert dac_start > dac_stop
+        assert coarse_step >= fine_step > 0
+        assert max_points >= n_normal_fit+2
+        self.dac_start = int(dac_start)
+        self.dac_stop = int(dac_stop)
+        self.coarse_step = coarse_step
+        self.fine_step = fine_step
+        self.max_points = max_points
+        self.n_normal_fit = n_normal_fit
+        self.rfrac_lo = rfrac_lo
+        self.rfrac_hi = rfrac_hi
+        self.slope_tol = slope_tol
+        self.min_normal_fb_change = min_normal_fb_change
+
+    def next_dac(self, dac_values, fb_values):
+        """return the next dac value given the points so far, or None when the curve is done
+        fb_values is a list of per point arrays (nrow,) or (ncols, nrow)"""
+        if len(dac_values) == 0:
+            return self.dac_start
+        dac_now = dac_values[-1]
+        remaining = dac_now - self.dac_stop
+        points_left = self.max_points - len(dac_values)
+        if remaining <= 0 or points_left <= 0:
+            return None
+        if points_left == 1:
+            return self.dac_stop
+        step = self.fine_step if self.in_transition(dac_values, fb_values) else self.coarse_step
+        # reserve the last point for dac_stop
+        step = max(step, int(np.ceil(remaining/(points_left-1))))
+        return int(max(dac_now-step, self.dac_stop))
+
+    def rfrac_and_slope_ratio(self, dac_values, fb_values):
+        """return the resistance fraction proxy at the last point and the last dI/dV over the normal slope,
+        flattened over rows (and columns), np.nan where the normal fit isn't usable"""
+        x = np.asarray(dac_values, dtype="float64")
+        y = np.vstack([np.ravel(fb) for fb in fb_values])
+        slope_n, intercept_n = np.polyfit(x[:self.n_normal_fit], y[:self.n_normal_fit], 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # rows that are dead or unlocked barely change over the normal fit points, ignore them
+            usable = np.abs(slope_n*(x[0]-x[self.n_normal_fit-1])) > self.min_normal_fb_change
+            rfrac = slope_n*x[-1]/(y[-1]-intercept_n)
+            slope_ratio = ((y[-1]-y[-2])/(x[-1]-x[-2]))/slope_n
+        rfrac[~usable] = np.nan
+        slope_ratio[~usable] = np.nan
+        return rfrac, slope_ratio
+
+    def in_transition(self, dac_values, fb_values):
+        if len(dac_values) < self.n_normal_fit or dac_values[-1] <= 0:
+            return False
+        rfrac, slope_ratio = self.rfrac_and_slope_ratio(dac_values, fb_values)
+        with np.errstate(invalid="ignore"):
+            in_rfrac_range = np.logical_and(rfrac > self.rfrac_lo, rfrac < self.rfrac_hi)
+            curving = np.logical_and(np.abs(slope_ratio-1) > self.slope_tol, rfrac > self.rfrac_lo)
+        return bool(np.any(np.logical_or(in_rfrac_range, curving)))
@@ -0,0 +1,75 @@
+""" find the kink in many traces at once, eg the start of the AWG ramp in each row of an AWG IV
+
+the model is mass.mathstat.fitting.fit_kink_model's, y = a + b*(x-k) for x < k and a + c*(x-k) for x >= k.
+for a kink at a given k the model is linear in a, b and c, and the least squares sums for every k at the data
+points follow from cumulative sums of x, x**2, y and x*y, so all candidate kinks of a row cost O(n) and all rows
+are done together. the best k at a data point is usually all we need, otherwise it is a close seed for
+fit_kink_model on a few points around it.
+"""
+import numpy as np
+
+
+def fit_kinks(y, x=None):
+    """fit the kink model to each trace along the last axis of y, trying the kink at every interior x.
+    return k, a, b, c and chi2, each with the shape of y without its last axis, and the index of k in x"""
+    y = np.asarray(y, dtype="float64")
+    n = y.shape[-1]
+    assert n >= 3, "need at least 3 points to fit a kink"
+    if x is None:
+        x = np.arange(n, dtype="float64")
+    x = np.asarray(x, dtype="float64")
+    # center to keep the sums of squares well conditioned
+    x0, y0 = x.mean(), y.mean(axis=-1, keepdims=True)
+    x, y = x - x0, y - y0
+
+    def prefix(v):
+        return np.concatenate([np.zeros(v.shape[:-1] + (1,)), np.cumsum(v, axis=-1)], axis=-1)
+
+    # sums over the points left of each candidate kink j (indices < j) for j = 1 .. n-2
+    j = np.arange(1, n - 1)
+    k = x[j]
+    n_l = j.astype("float64")
+    sx_l, sxx_l = prefix(x)[j], prefix(x * x)[j]
+    sy_all, sxy_all = prefix(y), prefix(x * y)
+    sy_l, sxy_l = sy_all[..., j], sxy_all[..., j]
+    n_r, sx_r, sxx_r = n - n_l, x.sum() - sx_l, np.sum(x * x) - sxx_l
+    sy_r, sxy_r = sy_all[..., -1:] - sy_l, sxy_all[..., -1:] - sxy_l
+    # u = min(x-k, 0) and v = max(x-k, 0) never overlap, so sum(u*v) is 0
+    su, suu = sx_l - n_l * k, sxx_l - 2 * k * sx_l + n_l * k * k
+    sv, svv = sx_r - n_r * k, sxx_r - 2 * k * sx_r + n_r * k * k
+    suy, svy = sxy_l - k * sy_l, sxy_r - k * sy_r
+    sy = sy_all[..., -1:]
+    m = np.zeros(j.shape + (3, 3))
+    m[:, 0, 0], m[:, 0, 1], m[:, 0, 2] = n, su, sv
+    m[:, 1, 0], m[:, 1, 1] = su, suu
+    m[:, 2, 0], m[:, 2, 2] = sv, svv
+    rhs = np.stack(np.broadcast_arrays(sy, suy, svy), axis=-1)  # (..., n-2, 3)
+    params = np.linalg.solve(m, rhs[..., np.newaxis])[..., 0]
+    chi2 = np.sum(y * y, axis=-1, keepdims=True) - np.sum(params * rhs, axis=-1)
+    best = np.argmin(chi2, axis=-1)
+    p = np.take_along_axis(params, best[..., np.newaxis, np.newaxis], axis=-2)[..., 0, :]
+    chi2_best = np.maximum(np.take_along_axis(chi2, best[..., np.newaxis], axis=-1)[..., 0], 0)
+    k_best = k[best] + x0
+    return k_best, p[..., 0] + y0[..., 0], p[..., 1], p[..., 2], chi2_best, j[best]
+
+
+def approx_kink_indices(fb, delta_threshold=1000, pointstep=10):
+    """the first index where each trace of fb has moved delta_threshold further from fb[..., pointstep] than
+    it moved over the last pointstep frames, the last index if it never does.
+    the same as find_kink_approx in the awg_iv scripts, for every trace at once"""
+    fb = np.asarray(fb, dtype="float64")
+    i = np.arange(10, fb.shape[-1])
+    moved = np.abs(fb[..., pointstep : pointstep + 1] - fb[..., i]) - np.abs(fb[..., i] - fb[..., i - pointstep])
+    departed = moved > delta_threshold
+    return np.where(departed.any(axis=-1), i[np.argmax(departed, axis=-1)], fb.shape[-1] - 1)
+
+
+def find_kinks(fb, half_window=300, delta_threshold=1000, pointstep=10):
+    """kink index of each trace (rows, frames) of fb, from fit_kinks on half_window frames either side of
+    approx_kink_indices, like find_kink in the awg_iv scripts does with fit_kink_model one row at a time"""
+    fb = np.atleast_2d(np.asarray(fb, dtype="float64"))
+    approx = approx_kink_indices(fb, delta_threshold, pointstep)
+    start = np.clip(approx - half_window, 0, max(fb.shape[-1] - 2 * half_window, 0))
+    inds = start[:, np.newaxis] + np.arange(min(2 * half_window, fb.shape[-1]))
+    _k, _a, _b, _c, _chi2, j = fit_kinks(np.take_along_axis(fb, inds, axis=-1))
+    return start + j
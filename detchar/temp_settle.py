@@ -0,0 +1,137 @@
+""" decide when a thermometer has settled from a window of recent readings, instead of waiting a fixed time """
+import time
+import statistics
+import numpy as np
+
+
+class TempSettleDetector:
+    """Sample a thermometer every sample_period_s and declare it settled from the last window_s of readings.
+
+    A line is fit to the readings in the window. The temperature is settled when, at the given confidence,
+    the slope is smaller than max_slope_k_per_s and (if a setpoint is given) the fitted temperature at the
+    latest reading is within tolerance_k of the setpoint. The confidence bounds come from the standard errors
+    of the fit, so a noisy thermometer needs to be quieter or flatter before it counts as settled.
+
+    read_temp_k: callable returning the temperature in K, eg adr_gui_control.get_temp_k or
+    lambda: ccon.getTemperature("a")
+    clock and sleep default to time.time and time.sleep, they can be replaced for tests
+    """
+
+    def __init__(
+        self,
+        read_temp_k,
+        tolerance_k=0.0002,
+        max_slope_k_per_s=2e-6,
+        window_s=30,
+        sample_period_s=1.0,
+        confidence=0.95,
+        min_samples=5,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        assert 0 < confidence < 1
+        self.read_temp_k = read_temp_k
+        self.tolerance_k = tolerance_k
+        self.max_slope_k_per_s = max_slope_k_per_s
+        self.window_s = window_s
+        self.sample_period_s = sample_period_s
+        self.confidence = confidence
+        self.min_samples = max(min_samples, 3)
+        self.clock = clock
+        self.sleep = sleep
+        # two sided z value for the confidence, eg 1.96 for 0.95
+        self._z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.reset()
+
+    def reset(self):
+        self.times_s = []
+        self.temps_k = []
+
+    def sample(self):
+        t = self.clock()
+        temp_k = self.read_temp_k()
+        self.times_s.append(t)
+        self.temps_k.append(temp_k)
+        # keep just enough history to fill the window
+        while len(self.times_s) > self.min_samples and t - self.times_s[1] >= self.window_s:
+            self.times_s.pop(0)
+            self.temps_k.pop(0)
+        return temp_k
+
+    def window_stats(self):
+        """return a dict with the fit over the current window: temp_k (at the latest reading), temp_err_k,
+        slope_k_per_s, slope_err_k_per_s and n, or None if the window isn't full yet"""
+        n = len(self.times_s)
+        if n < self.min_samples or self.times_s[-1] - self.times_s[0] < self.window_s * (1 - 1e-9):
+            return None
+        t = np.array(self.times_s) - self.times_s[-1]
+        y = np.array(self.temps_k)
+        tbar = t.mean()
+        sxx = np.sum((t - tbar) ** 2)
+        slope = np.sum((t - tbar) * (y - y.mean())) / sxx
+        intercept = y.mean() - slope * tbar  # fitted temperature at the latest reading
+        resid = y - (intercept + slope * t)
+        s = np.sqrt(np.sum(resid ** 2) / (n - 2))
+        return {
+            "temp_k": intercept,
+            "temp_err_k": s * np.sqrt(1 / n + tbar ** 2 / sxx),
+            "slope_k_per_s": slope,
+            "slope_err_k_per_s": s / np.sqrt(sxx),
+            "n": n,
+        }
+
+    def is_settled(self, setpoint_k=None):
+        stats = self.window_stats()
+        if stats is None:
+            return False
+        slope_ok = abs(stats["slope_k_per_s"]) + self._z * stats["slope_err_k_per_s"] < self.max_slope_k_per_s
+        if setpoint_k is None:
+            return bool(slope_ok)
+        temp_ok = abs(stats["temp_k"] - setpoint_k) + self._z * stats["temp_err_k"] < self.tolerance_k
+        return bool(slope_ok and temp_ok)
+
+    def wait(self, setpoint_k=None, time_out_s=600, verbose=True):
+        """sample until settled or time_out_s passes, return True if settled"""
+        self.reset()
+        tstart = self.clock()
+        while True:
+            tsample = self.clock()
+            temp_k = self.sample()
+            elapsed_s = tsample - tstart
+            if self.is_settled(setpoint_k):
+                if verbose:
+                    print(f"temperature settled at {temp_k*1e3:.03f} mK after {elapsed_s:.0f} s")
+                return True
+            if elapsed_s > time_out_s:
+                if verbose:
+                    print(f"temperature NOT settled after {time_out_s} s, last reading {temp_k*1e3:.03f} mK, setpoint_k={setpoint_k}")
+                return False
+            if verbose and len(self.times_s) % 10 == 0:
+                print(f"Current Temp: {temp_k*1e3:.03f} mK")
+            self.sleep(max(0, tsample + self.sample_period_s - self.clock()))
+
+
+class FakeThermometer:
+    """first order approach to a setpoint with gaussian noise, keeps its own clock so tests don't have to wait
+    use clock and sleep as the clock and sleep of a TempSettleDetector"""
+
+    def __init__(self, temp_k, tau_s=60, noise_k=0, seed=0):
+        self.temp_k = temp_k
+        self.setpoint_k = temp_k
+        self.tau_s = tau_s
+        self.noise_k = noise_k
+        self.t = 0.0
+        self.rng = np.random.default_rng(seed)
+
+    def set_temp_k(self, setpoint_k):
+        self.setpoint_k = setpoint_k
+
+    def clock(self):
+        return self.t
+
+    def sleep(self, dt_s):
+        self.temp_k = self.setpoint_k + (self.temp_k - self.setpoint_k) * np.exp(-dt_s / self.tau_s)
+        self.t += dt_s
+
+    def get_temp_k(self):
+        return self.temp_k + self.noise_k * self.rng.standard_normal()
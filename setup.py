@@ -18,7 +18,8 @@ setup(
                             "cringe=cringe.cringe:main",
                             "tower_power_gui=instruments.tower_power_supply_gui:main",
                             "cringe_control=cringe.cringe_control:cringe_control_commandline_main",
-                            "ls218_logger=instruments:_ls218_logger_entry_point"],
+                            "ls218_logger=instruments:_ls218_logger_entry_point",
+                            "iv_batch=detchar.iv_batch:main"],
     },
     scripts=["doc/tdm_term"],
 )
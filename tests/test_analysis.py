@@ -69,4 +69,93 @@ def test_vphi_analysis_steps():
     (periodInds, periodXUnits, positiveCrossingSlope, negativeCrossingSlope, positiveCrossingFirstX, negativeCrossingFirstX,
     firstMinimumInd, firstMinimumX, firstMinimumY, modDepth, midPoint, crossingPoint, firstMaximumInd, firstMaximumX, firstMaximumY) = fbastats
     assert np.abs(periodXUnits-1022.2)<0.01
-    assert np.abs(modDepth-2)<0.01
\ No newline at end of file
+    assert np.abs(modDepth-2)<0.01
+
+def test_conditionvphis_matches_conditionvphi():
+    tridwell, tristeps, tristepsize = 2, 9, 30
+    lindwell, period, linsteps, linstepsize = analysis.lineartriangleparams(tridwell, tristeps, tristepsize)
+    ncol, nrow, nframes = 3, 4, 2**14
+    tri = gen_triangle_output(nframes+2*period, tridwell, tristeps, tristepsize)
+    rng = np.random.default_rng(0)
+    # each channel starts somewhere else in the triangle, on a dwell boundary
+    starts = rng.integers(0, period//lindwell, size=(ncol, nrow))*lindwell
+    fba = np.array([[tri[s:s+nframes] for s in starts[col]] for col in range(ncol)])
+    err = np.sin((fba-1000)*2*np.pi/1022.2)+rng.normal(0, 0.05, size=fba.shape)
+
+    fbatriangle, fbasigsup, fbasigsdown = analysis.conditionvphis(fba, err, tridwell, tristeps, tristepsize)
+    for col in range(ncol):
+        for row in range(nrow):
+            triout, sigup, sigdown = analysis.conditionvphi(fba[col, row], err[col, row], tridwell, tristeps,
+                                                            tristepsize)
+            assert np.array_equal(triout, fbatriangle)
+            assert np.allclose(sigup, fbasigsup[col, row])
+            assert np.allclose(sigdown, fbasigsdown[col, row])
+
+    # a channel with a broken triangle fails the whole crate, unless we ask for the quality mask
+    fba[1, 2, 8000:9000] += 5
+    try:
+        analysis.conditionvphis(fba, err, tridwell, tristeps, tristepsize)
+        assert False
+    except Exception as ex:
+        assert "(1, 2)" in str(ex)
+    _, sigsup, _, good = analysis.conditionvphis(fba, err, tridwell, tristeps, tristepsize, return_quality=True)
+    assert good.shape == (ncol, nrow)
+    assert np.sum(~good) == 1 and not good[1, 2]
+    assert np.allclose(sigsup[good], fbasigsup[good])
+
+
+def test_vphistats_matches_single():
+    rng = np.random.default_rng(2)
+    triangle = np.arange(10, 10+511*30, 30)
+    ncol, nrow = 4, 8
+    period = rng.uniform(900, 3000, size=(ncol, nrow, 1))
+    phase = rng.uniform(0, 2*np.pi, size=(ncol, nrow, 1))
+    amp = rng.uniform(100, 5000, size=(ncol, nrow, 1))
+    signals = np.round(amp*np.sin(triangle*2*np.pi/period+phase)+rng.normal(0, 20, size=(ncol, nrow, len(triangle))))
+    signals[0, 3] = 7  # flat, no crossings at all
+    signals = signals.astype("int64")
+    stats = vphistats.vPhiStats(triangle, signals, fracFromBottom=0.15)
+    statnames = list(stats.keys())
+    for col in range(ncol):
+        for row in range(nrow):
+            try:
+                expected = vphistats.vPhiStatsSingle(triangle, signals[col, row], fracFromBottom=0.15)
+            except AssertionError:
+                expected = np.zeros(len(statnames))
+            got = [stats[statname][col, row] for statname in statnames]
+            assert np.allclose(got, expected), (col, row)
+    assert np.all(stats["modDepth"][0, 3] == 0)
+
+
+def test_vphistats_fft():
+    rng = np.random.default_rng(3)
+    triangle = np.arange(10, 10+511*30, 30)
+    ncol, nrow = 4, 8
+    period = rng.uniform(2500, 6000, size=(ncol, nrow, 1))
+    phase = rng.uniform(0, 2*np.pi, size=(ncol, nrow, 1))
+    amp = rng.uniform(200, 4000, size=(ncol, nrow, 1))
+
+    def vphi(x):
+        arg = x*2*np.pi/period+phase
+        return amp*(np.sin(arg)+0.2*np.sin(2*arg+1))
+
+    signals = vphi(triangle)+rng.normal(0, 30, size=(ncol, nrow, len(triangle)))
+    signals[0, 3] = rng.normal(0, 30, size=len(triangle))  # no modulation
+    stats = vphistats.vPhiStatsFFT(triangle, signals, fracFromBottom=0.15)
+    good = np.ones((ncol, nrow), dtype="bool")
+    good[0, 3] = False
+    assert np.all(stats["quality"][good] > 0.9)
+    assert stats["quality"][0, 3] < 0.3
+    assert np.allclose(stats["periodXUnits"][good], period[good][:, 0], rtol=0.005)
+    # the true curve over one period, finely sampled
+    fine = triangle[0]+np.linspace(0, 1, 10001)*period
+    truth = vphi(fine)
+    assert np.allclose(stats["modDepth"][good], np.ptp(truth, axis=-1)[good], rtol=0.02)
+    assert np.allclose(stats["harmonicFraction"][good], 0.2, atol=0.02)
+    # the model really does cross crossingPoint at positiveCrossingFirstX, rising
+    x = stats["positiveCrossingFirstX"][..., np.newaxis]+np.array([-1, 1])*0.01*period
+    y = vphi(x)
+    assert np.all(y[good][:, 0] < stats["crossingPoint"][good]+0.05*stats["modDepth"][good])
+    assert np.all(y[good][:, 1] > stats["crossingPoint"][good]-0.05*stats["modDepth"][good])
+    assert np.all(stats["positiveCrossingSlope"][good] > 0)
+    assert np.all(stats["negativeCrossingSlope"][good] < 0)
@@ -0,0 +1,207 @@
+from cringe.tune.autotune import AutoTuneEngine, TuneSettings, STAGES, parse_channels
+from cringe.shared import profiling
+import cringe.shared
+import json
+from test_analysis import gen_triangle_output
+import numpy as np
+import pytest
+
+
+class FakeMuxMaster:
+    """records what the tune sends, knows the triangle params for FakeEasyClient"""
+
+    def __init__(self, ncol, nrow):
+        self.dfbraps = [None]*ncol
+        self.seqln, self.NSAMP, self.lsync = nrow, 4, 32
+        self.flux_jump_threshold = 100
+        self.triangleparams = None
+        self.rows = {}
+        self.towerDacs = {"sq1bias": 1000}
+
+    def tuneConfiguration(self):
+        return {"seqln": self.seqln, "NSAMP": self.NSAMP, "towerDacs": dict(self.towerDacs)}
+
+    def settriangleparams(self, dwell=0, steps=10, stepsize=8, timebase=1):
+        self.triangleparams = (dwell, steps, stepsize)
+
+    def setdfball(self, **kwargs):
+        for col in range(len(self.dfbraps)):
+            self.setdfballrow(col, **kwargs)
+
+    def setdfballrow(self, col=0, **kwargs):
+        for row in range(self.seqln):
+            self.setdfbrow(col, row, **kwargs)
+
+    def setdfbrow(self, col=0, row=0, **kwargs):
+        self.rows[col, row] = kwargs
+        profiling.count("register writes", 11)
+
+    def setFluxJumpThreshold(self, flux_jump_threshold):
+        self.flux_jump_threshold = int(flux_jump_threshold)
+
+
+class FakeEasyClient:
+    """every channel sees a sine of the triangle, with its own period, amplitude and phase"""
+
+    def __init__(self, mm, ncol=2, nrow=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.mm, self.ncol, self.nrow = mm, ncol, nrow
+        self.lsync, self.num_of_samples = mm.lsync, mm.NSAMP
+        self.period = rng.uniform(2000, 4000, size=(ncol, nrow, 1))
+        self.amp = rng.uniform(500, 2000, size=(ncol, nrow, 1))
+        self.phase = rng.uniform(0, 2*np.pi, size=(ncol, nrow, 1))
+        self.mix = None
+        self.broken = []  # (col, row) of channels whose triangle has a glitch
+        self.rng = rng
+        self.noise = np.zeros((ncol, nrow, 1))  # rms of white noise on the signal
+
+    def getNewData(self, delaySeconds=0.001, minimumNumPoints=4000, sendMode=0):
+        triangle = gen_triangle_output(minimumNumPoints, *self.mm.triangleparams)
+        signal = self.amp*np.sin(2*np.pi*triangle/self.period+self.phase)
+        signal = signal+self.noise*self.rng.standard_normal(signal.shape)
+        data = np.zeros((self.ncol, self.nrow, minimumNumPoints, 2), dtype="int64")
+        data[..., 0], data[..., 1] = np.round(signal), triangle
+        for col, row in self.broken:
+            data[col, row, 8000:9000, 1] += 5
+        if sendMode == 2:
+            data = data[..., ::-1]
+        return data
+
+    def setMixToZero(self):
+        self.mix = 0
+
+    def setMix(self, mix):
+        self.mix = mix
+
+
+@pytest.fixture
+def fakes(tmp_path, monkeypatch):
+    """(FakeMuxMaster, FakeEasyClient) for 2 columns of 3 rows, with files going to tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(cringe.shared, "SAVEDIR", str(tmp_path))
+    (tmp_path / ".cringe").mkdir()
+    mm = FakeMuxMaster(ncol=2, nrow=3)
+    return mm, FakeEasyClient(mm)
+
+
+def test_full_tune_headless(tmp_path, fakes):
+    mm, ec = fakes
+    stages = []
+    engine = AutoTuneEngine(mm, ec, TuneSettings(PercentFromBottom=30),
+                            progress=lambda stage, elapsed_s, result: stages.append(stage))
+    result = engine.fullTune()
+    assert stages == STAGES
+    assert list(result.timings.keys()) == STAGES
+    assert np.all(result.chanisgood)
+    assert np.allclose(result.fbastats["periodXUnits"], ec.period[..., 0], rtol=0.02)
+    assert result.Mix.shape == (2, 3)
+    assert np.allclose(ec.mix, result.Mix/100.0)
+    assert sorted(mm.rows.keys()) == [(col, row) for col in range(2) for row in range(3)]
+    for col, row in mm.rows:
+        settings = mm.rows[col, row]
+        assert settings["FBA"] == 1 and settings["ARL"] == 1
+        assert settings["d2aA"] > 200 and np.isfinite(settings["d2aB"]) and settings["d2aB"] >= 0
+    assert mm.flux_jump_threshold == int(np.median(result.sq1periods)*0.8)
+    assert (tmp_path / ".cringe" / "mix_fractions.npy").exists()
+
+    with open(tmp_path / "last_tune_profile.json") as f:
+        report = json.load(f)
+    assert report["info"]["settings"]["PercentFromBottom"] == 30
+    tune = report["spans"]
+    assert [stage["name"] for stage in tune["children"]] == STAGES
+    assert tune["counts"]["register writes"] == 11*2*3*5  # every row in each stage that sets rows
+    assert tune["children"][5]["counts"] == {"register writes": 11*2*3}
+    assert tune["counts"]["frames acquired"] == 4*4096*6
+    fba = tune["children"][3]
+    assert [s["name"] for s in fba["children"]] == ["getNewData", "conditionvphis", "vPhiStats"]
+    assert fba["children"][0]["counts"] == {"frames acquired": 4096*6}
+    assert sum(stage["seconds"] for stage in tune["children"]) <= tune["seconds"]
+    assert len(list(tmp_path.glob("tune_profile_*.json"))) == 1
+
+
+def test_full_tune_skips_imperfect_triangles(tmp_path, fakes):
+    mm, ec = fakes
+    ec.broken = [(1, 2)]
+    result = AutoTuneEngine(mm, ec, TuneSettings(PercentFromBottom=30)).fullTune()
+    good = np.ones((2, 3), dtype="bool")
+    good[1, 2] = False
+    assert np.array_equal(result.chanisgood, good)
+    assert result.Mix[1, 2] == 0 and mm.rows[1, 2]["FBA"] == 0
+    assert np.allclose(result.fbastats["periodXUnits"][good], ec.period[good, 0], rtol=0.02)
+    assert result.profiler.report()["spans"]["counts"]["imperfect triangles"] == 4
+
+
+def test_full_tune_fft_analyzer_rejects_noisy_vphis(fakes):
+    mm, ec = fakes
+    ec.noise[0, 1] = 1500
+    crossings = AutoTuneEngine(mm, ec, TuneSettings(PercentFromBottom=30)).fullTune()
+    assert np.all(crossings.chanisgood)
+    result = AutoTuneEngine(mm, ec, TuneSettings(PercentFromBottom=30, vphiAnalyzer="fft")).fullTune()
+    assert result.badChannels() == [(0, 1)]
+    assert result.fbbstats["quality"][0, 1] < 0.9 and np.all(np.delete(result.fbastats["quality"], 1) > 0.99)
+    assert np.allclose(np.delete(result.fbastats["periodXUnits"], 1), np.delete(ec.period, 1), rtol=0.02)
+    assert result.Mix[0, 1] == 0 and mm.rows[0, 1]["FBA"] == 0
+
+
+def test_retune_some_channels(fakes):
+    mm, ec = fakes
+    engine = AutoTuneEngine(mm, ec, TuneSettings(PercentFromBottom=30))
+    first = engine.fullTune()
+    # two channels change, eg after a bias change
+    ec.period[0, 2] *= 1.2
+    ec.period[1, 0] *= 0.8
+    mm.rows = {}
+    channels = parse_channels("0:2;1")
+    assert channels == [(0, 2), 1]
+    result = engine.retune(channels, first)
+    selected = np.zeros((2, 3), dtype="bool")
+    selected[0, 2], selected[1] = True, True
+    assert sorted(mm.rows.keys()) == [(0, 2), (1, 0), (1, 1), (1, 2)]
+    assert np.allclose(result.fbastats["periodXUnits"], ec.period[..., 0], rtol=0.02)
+    for name in ["d2aA", "d2aB", "a2d", "I", "Mix"]:
+        assert np.array_equal(getattr(result, name)[~selected], getattr(first, name)[~selected]), name
+    assert not np.allclose(result.d2aA[0, 2], first.d2aA[0, 2])
+    # a full tune with the new periods picks the same values for the retuned channels
+    full = engine.fullTune()
+    for name in ["d2aA", "d2aB", "a2d", "I"]:
+        assert np.allclose(getattr(result, name)[selected], getattr(full, name)[selected]), name
+    assert result.profiler.report()["spans"]["counts"]["register writes"] == 11*4*5
+
+
+def test_full_tune_vphi_cache(tmp_path, fakes):
+    mm, ec = fakes
+    engine = AutoTuneEngine(mm, ec, TuneSettings(PercentFromBottom=30, useVphiCache=True))
+
+    def counts(result):
+        return result.profiler.report()["spans"]["counts"]
+    first = engine.fullTune()
+    assert counts(first)["frames acquired"] == 4*4096*6
+    assert counts(first)["cached columns"] == 0
+    # nothing changed, so every vphi comes from the cache
+    second = engine.fullTune()
+    assert "frames acquired" not in counts(second)
+    assert counts(second)["cached columns"] == 4*2
+    for name in ["d2aA", "d2aB", "a2d", "I", "Mix"]:
+        assert np.array_equal(getattr(second, name), getattr(first, name)), name
+    # a column missing from the cache is measured alone
+    for path in tmp_path.glob("vphi_cache/*_col1.npz"):
+        path.unlink()
+    ec.period[1] *= 1.1
+    third = engine.fullTune()
+    assert counts(third)["cached columns"] == 4
+    assert np.allclose(third.fbastats["periodXUnits"], ec.period[..., 0], rtol=0.02)
+    assert np.array_equal(third.d2aA[0], first.d2aA[0])
+    # col 1 moves the median fbb period and so the arl threshold, col 0's locked vphi is retaken
+    for path in tmp_path.glob("vphi_cache/*_col1.npz"):
+        path.unlink()
+    ec.period[1] *= 0.6
+    fourth = engine.fullTune()
+    assert mm.flux_jump_threshold != third.flux_jump_threshold
+    assert counts(fourth)["cached columns"] == 3
+    assert [s["counts"].get("cached columns") for s in fourth.profiler.report()["spans"]["children"][:4]] == [1, 0, 1, 1]
+    # a tower dac change invalidates every column
+    mm.towerDacs["sq1bias"] = 1200
+    assert counts(engine.fullTune())["cached columns"] == 0
+    engine.cache.max_age_s = 0
+    assert counts(engine.fullTune())["cached columns"] == 0
@@ -0,0 +1,92 @@
+from detchar.flux_jump import unwrap_flux_jumps, FluxJumpUnwrapper, find_arl_resets, ArlResetDetector
+import numpy as np
+
+
+def make_wrapped(ncol=2, nrow=3, nframes=5000, seed=0):
+    """smooth traces that cross many phi0, wrapped into one phi0 around 8000 like the autorelock does"""
+    rng = np.random.default_rng(seed)
+    phi0_fb = rng.uniform(1400, 1800, size=(ncol, nrow))
+    t = np.arange(nframes)
+    amplitude = rng.uniform(1000, 8000, size=(ncol, nrow, 1))
+    fb_true = 8000 + amplitude * np.sin(2 * np.pi * t / nframes + rng.uniform(0, 2 * np.pi, size=(ncol, nrow, 1)))
+    fb_true += rng.normal(0, 5, size=fb_true.shape)
+    phi0 = phi0_fb[..., np.newaxis]
+    fb = (fb_true - 8000 + phi0 / 2) % phi0 + 8000 - phi0 / 2
+    return fb_true, fb, phi0_fb
+
+
+def test_unwrap_whole_array():
+    fb_true, fb, phi0_fb = make_wrapped()
+    assert np.any(np.abs(np.diff(fb, axis=-1)) > 1000)  # there are jumps to undo
+    fb_fixed = unwrap_flux_jumps(fb, phi0_fb)
+    assert fb_fixed.shape == fb.shape
+    # the unwrapped trace matches the original up to a whole number of phi0 in each channel
+    offset = fb_fixed - fb_true
+    assert np.allclose(offset, offset[..., :1], atol=1e-6)
+    assert np.allclose(np.round(offset[..., 0] / phi0_fb) * phi0_fb, offset[..., 0], atol=1e-6)
+
+
+def test_unwrap_in_chunks_matches_whole():
+    fb_true, fb, phi0_fb = make_wrapped()
+    unwrapper = FluxJumpUnwrapper(phi0_fb, fb_step_threshold=0.7 * phi0_fb)
+    chunks = np.split(fb, [1, 700, 701, 2500, 2500, 4321], axis=-1)
+    fb_chunked = np.concatenate([unwrapper.unwrap(chunk) for chunk in chunks], axis=-1)
+    assert np.allclose(fb_chunked, unwrap_flux_jumps(fb, phi0_fb, 0.7 * phi0_fb))
+    assert unwrapper.njumps.shape == phi0_fb.shape
+
+
+def test_unwrap_one_trace():
+    fb = np.array([0, 100, 200, -1300, -1200, 200, 300], dtype=float)
+    assert np.allclose(unwrap_flux_jumps(fb, 1500), [0, 100, 200, 200, 300, 200, 300])
+
+
+def find_arl_resets_lookback_loop(fb, flux_jump_threshold_dac_units, db_offset, lookback_samples, lookback_threshold):
+    """the single trace version from detchar/db_timestream/demo_lookback.py, as a reference"""
+    lo = db_offset-flux_jump_threshold_dac_units
+    hi = db_offset+flux_jump_threshold_dac_units
+    out = []
+    for events in [np.where(fb < lo)[0], np.where(fb > hi)[0]]:
+        if len(events) > 0 and np.abs(fb[events[0]] - fb[events[0]-lookback_samples]) >= lookback_threshold:
+            events = events[1:]
+        out.append(events)
+    return out
+
+
+def make_arl_events(nchan=40, nframes=3000, lookback_samples=20, seed=1):
+    """noise around 8000 with resets outside the band at random frames, some channels start with a blip"""
+    rng = np.random.default_rng(seed)
+    fb = 8000+rng.normal(0, 20, size=(nchan, nframes))
+    for chan in range(nchan):
+        for frame in rng.choice(np.arange(lookback_samples+1, nframes), size=rng.integers(0, 6), replace=False):
+            fb[chan, frame] = 8000+rng.choice([-1, 1])*rng.uniform(1900, 2500)
+        if chan % 3 == 0:
+            # a steep approach to the first event, like the interference when the bias changes
+            first = np.min(np.nonzero(np.abs(fb[chan]-8000) > 1800)[0], initial=nframes)
+            if first < nframes:
+                fb[chan, first-lookback_samples] = 8000-np.sign(fb[chan, first]-8000)*800
+    return fb
+
+
+def test_arl_resets_match_loop():
+    fb = make_arl_events()
+    ups, downs = find_arl_resets(fb, 1800, 8000, lookback_samples=20, lookback_threshold=500)
+    n_dropped = 0
+    for chan in range(fb.shape[0]):
+        ups_loop, downs_loop = find_arl_resets_lookback_loop(fb[chan], 1800, 8000, 20, 500)
+        assert np.array_equal(ups[chan], ups_loop)
+        assert np.array_equal(downs[chan], downs_loop)
+        n_dropped += np.sum(fb[chan] < 8000-1800)+np.sum(fb[chan] > 8000+1800)-len(ups_loop)-len(downs_loop)
+    assert n_dropped > 0  # the blips are there to be dropped
+
+
+def test_arl_resets_in_chunks_match_whole():
+    fb = make_arl_events().reshape(4, 10, -1)
+    ups, downs = find_arl_resets(fb, 1800, 8000, lookback_samples=20, lookback_threshold=500, as_mask=True)
+    ups_ragged, _ = find_arl_resets(fb, 1800, 8000, lookback_samples=20, lookback_threshold=500)
+    assert np.array_equal(ups_ragged[3][2], np.nonzero(ups[3, 2])[0])
+    detector = ArlResetDetector(1800, 8000, lookback_samples=20, lookback_threshold=500)
+    chunks = [detector.find(chunk, as_mask=True) for chunk in np.split(fb, [7, 30, 31, 1500], axis=-1)]
+    assert np.array_equal(np.concatenate([c[0] for c in chunks], axis=-1), ups)
+    assert np.array_equal(np.concatenate([c[1] for c in chunks], axis=-1), downs)
+    assert np.array_equal(detector.n_ups, ups.sum(axis=-1))
+    assert np.array_equal(detector.n_downs, downs.sum(axis=-1))
@@ -0,0 +1,41 @@
+from detchar import IVCircuit
+from detchar.iv_batch import analyze_files, write_summary
+import numpy as np
+import json
+import csv
+import os
+
+datadir = os.path.join(os.path.dirname(__file__), "data")
+circuit = IVCircuit(rfb_ohm=4e3, rbias_ohm=1e3, rsh_ohm=200e-6, rpar_ohm=0, m_ratio=3.46,
+                    vfb_gain=1.0/2**14, vbias_gain=2.5/2**16)
+
+
+def write_sweep_file(filename):
+    with open(os.path.join(datadir, "horton_20200105_SSRL_10_1_chip3_temp_sweep_ivs.json"), "r") as f:
+        d = json.load(f)
+    for curve_dict in d["data"]:
+        # this file predates zero_bias_fb, the last point of each curve is at zero detector bias
+        curve_dict["zero_bias_fb"] = curve_dict["fb_values"][-1]
+    with open(filename, "w") as f:
+        json.dump(d, f)
+
+
+def test_analyze_files_with_cache(tmp_path, capsys):
+    filenames = [str(tmp_path/"a.json"), str(tmp_path/"b.json")]
+    for filename in filenames:
+        write_sweep_file(filename)
+    cache_dir = str(tmp_path/"cache")
+    rows = analyze_files(filenames, circuit, rfracs=[0.5], cache_dir=cache_dir, max_workers=2)
+    nrows = len(json.load(open(filenames[0]))["data"][0]["fb_values"][0])
+    assert len(rows) == 2*nrows
+    assert [row["filename"] for row in rows] == [filenames[0]]*nrows + [filenames[1]]*nrows
+    assert np.sum(np.isfinite([row["rn_ohm"] for row in rows])) > 0
+    assert "psat_w_at_0.5" in rows[0] and "g_w_per_k_at_0.5" in rows[0]
+    capsys.readouterr()
+    rows_again = analyze_files(filenames, circuit, rfracs=[0.5], cache_dir=cache_dir, max_workers=2)
+    assert capsys.readouterr().out.count("cached") == 2
+    assert json.dumps(rows_again) == json.dumps(rows)
+    summary_filename = str(tmp_path/"summary.csv")
+    write_summary(rows, summary_filename)
+    with open(summary_filename, newline="") as f:
+        assert len(list(csv.DictReader(f))) == len(rows)
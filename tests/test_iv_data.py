@@ -0,0 +1,66 @@
+from detchar import IVCircuit, IVTempSweepData
+from detchar.iv_data import fix_sc_branch, fix_sc_branch_array
+import numpy as np
+import json
+import os
+
+datadir = os.path.join(os.path.dirname(__file__), "data")
+with open(os.path.join(datadir, "horton_20200105_SSRL_10_1_chip3_temp_sweep_ivs.json"), "r") as f:
+    d = json.load(f)
+for curve_dict in d["data"]:
+    # this file predates zero_bias_fb, the last point of each curve is at zero detector bias
+    curve_dict["zero_bias_fb"] = curve_dict["fb_values"][-1]
+sdata = IVTempSweepData.from_dict(d)
+circuit = IVCircuit(rfb_ohm=4e3, rbias_ohm=1e3, rsh_ohm=200e-6, rpar_ohm=0, m_ratio=3.46,
+                    vfb_gain=1.0/2**14, vbias_gain=2.5/2**16)
+
+
+def test_fix_sc_branch_array_matches_single():
+    for curves in sdata.data:
+        x, y = curves.xyarrays_zero_subtracted_with_post_iv_zero_fb_value()
+        yout, diagnostics = fix_sc_branch_array(x, y, return_diagnostics=True)
+        for row in range(y.shape[1]):
+            assert np.allclose(yout[:, row], fix_sc_branch(x, y[:, row].copy()))
+        assert diagnostics["fixed"].shape == (y.shape[1],)
+        assert np.all(diagnostics["sc_start_ind"][~diagnostics["fixed"]] == -1)
+
+
+def test_fit_for_rpar_matches_single():
+    curves = sdata.data[0]
+    rpar_ohm_by_row = curves.fit_for_rpar(circuit, sc_below_vbias_arb=500)
+    vbias_arbs, fb_arbs = curves.xy_arrays()
+    for row in range(curves.get_nrows()):
+        if np.all(fb_arbs[:, row] == fb_arbs[0, row]):
+            # unlocked row, the fit is not possible
+            assert np.isnan(rpar_ohm_by_row[row])
+            continue
+        _ites, _vtes, rpar_ohm = circuit.iv_raw_to_physical_fit_rpar(vbias_arbs, fb_arbs[:, row], 500)
+        assert np.isclose(rpar_ohm, rpar_ohm_by_row[row], rtol=1e-6, atol=1e-12)
+
+
+def test_codec_round_trip(tmp_path):
+    for array_format in ["base64", "list"]:
+        filename = str(tmp_path/f"sweep_{array_format}.json")
+        sdata.to_file(filename, array_format=array_format)
+        sdata2 = IVTempSweepData.from_file(filename)
+        assert sdata2.set_temps_k == sdata.set_temps_k
+        for curves, curves2 in zip(sdata.data, sdata2.data):
+            assert curves2.dac_values == curves.dac_values
+            assert curves2.bayname == curves.bayname
+            assert np.array_equal(curves2.fb_values_array(), curves.fb_values_array())
+            assert isinstance(curves2.fb_values[0], np.ndarray)
+            assert curves2.fb_values[0].flags.writeable and curves2.zero_bias_fb.flags.writeable
+        # from_json and the json.load + from_dict pattern above read either format
+        with open(filename, "r") as f:
+            s = f.read()
+        for sdata3 in [IVTempSweepData.from_json(s), IVTempSweepData.from_dict(json.loads(s))]:
+            assert np.array_equal(sdata3.data[0].fb_values_array(), sdata.data[0].fb_values_array())
+
+
+def test_codec_reads_old_files():
+    # written by to_json before the codec existed, and before zero_bias_fb
+    sdata_old = IVTempSweepData.from_file(os.path.join(datadir, "horton_20200105_SSRL_10_1_chip3_temp_sweep_ivs.json"))
+    assert sdata_old.data[0].zero_bias_fb is None
+    for curves, curves_old in zip(sdata.data, sdata_old.data):
+        assert np.array_equal(curves_old.fb_values_array(), curves.fb_values_array())
+        assert curves_old.nominal_temp_k == curves.nominal_temp_k
@@ -0,0 +1,351 @@
+from detchar import (
+    IVPointTaker,
+    IVCurveTaker,
+    IVTempSweeper,
+    IVTempRampSweeper,
+    bin_vs_temp,
+    IVCurveColumnData,
+    IVCircuit,
+    AdaptiveDacPlanner,
+    BiasStepTaker,
+)
+from detchar.iv_utils import AdrGuiControlDummy
+import numpy as np
+import time
+
+
+class FakeEasyClient():
+    """stands in for EasyClient, feedback of each row follows the detector bias of its column"""
+    def __init__(self, ncol=4, nrow=3, npts=100, slope=0.1):
+        self.ncol = ncol
+        self.nrow = nrow
+        self.npts = npts
+        self.slope = slope*np.ones(nrow)
+        self.dac = np.zeros(ncol)
+        self.offset = np.zeros((ncol, nrow))
+        self.ncalls = 0
+
+    def fb(self):
+        return 8000 + self.slope*self.dac[:, np.newaxis] + self.offset
+
+    def getNewData(self, delaySeconds=0.001, minimumNumPoints=4000, exactNumPoints=False, **kwargs):
+        self.ncalls += 1
+        npts = minimumNumPoints if exactNumPoints else self.npts
+        data = np.zeros((self.ncol, self.nrow, npts, 2), dtype="float32")
+        data[:, :, :, 1] = self.fb()[:, :, np.newaxis]
+        return data
+
+
+class FakeCringeControl():
+    def __init__(self, ec):
+        self.ec = ec
+        self.relocks = []
+
+    def relock_fba(self, col, row):
+        self.relocks.append((col, row))
+        # relocking brings the feedback back to the middle of its range
+        self.ec.offset[col, row] = -self.ec.slope[row]*self.ec.dac[col]
+
+    def relock_fba_rows(self, col_rows):
+        for col, rows in col_rows.items():
+            for row in rows:
+                self.relock_fba(col, row)
+        return "ok: "
+
+    def relock_all_locked_fba(self, col):
+        pass
+
+
+def make_point_taker(cols, ec=None):
+    if ec is None:
+        ec = FakeEasyClient()
+    cc = FakeCringeControl(ec)
+
+    def voltage_source(col):
+        def set_volt(dacvalue):
+            ec.dac[col] = dacvalue
+        return set_volt
+    pt = IVPointTaker("DB1", ["AX", "BX"], easy_client=ec, cringe_control=cc, delay_s=0,
+                      voltage_source=[voltage_source(col) for col in cols], column_number=cols)
+    return pt, ec, cc
+
+
+def test_multi_column_curve():
+    pt, ec, cc = make_point_taker([1, 3])
+    curve_taker = IVCurveTaker(pt, adr_gui_control=AdrGuiControlDummy(),
+                               zero_bias_and_relock_and_record_fb_at_end=False)
+    dac_values = [1000, 500, 0]
+    curves = curve_taker.get_curve(dac_values, ignore_prep_requirement=True)
+    assert len(curves) == 2
+    assert ec.ncalls == len(dac_values)  # one acquisition per point covers both columns
+    for curve, col, bayname in zip(curves, [1, 3], ["AX", "BX"]):
+        assert isinstance(curve, IVCurveColumnData)
+        assert curve.column_number == col
+        assert curve.bayname == bayname
+        x, y = curve.xy_arrays()
+        assert np.allclose(y[:, 0], 8000+0.1*np.array(dac_values))
+
+
+def test_multi_column_relock():
+    pt, ec, cc = make_point_taker([0, 2])
+    ec.offset[2, 1] = 7000  # pushes col 2 row 1 above the relock threshold
+    fb = pt.get_iv_pt(100)
+    assert fb.shape == (2, ec.nrow)
+    assert cc.relocks == [(2, 1)]
+    assert ec.ncalls == 2
+    # only the relocked row is reacquired, on a short capture
+    assert pt.relock_extra_frames == [pt.relock_npts]
+    # the relock offset is tracked, so the row stays continuous with its pre-relock value
+    assert np.isclose(fb[1, 1], 8000+0.1*100+7000)
+
+
+def test_pipelined_curve_matches_serial():
+    dac_values = np.arange(20000, -1, -1000)
+    curves = []
+    for pipelined in [False, True]:
+        # row 2 is steep enough to need several relocks during the curve
+        ec = FakeEasyClient(slope=np.array([0.1, -0.2, 0.5]))
+        pt, ec, cc = make_point_taker([0, 2], ec)
+        curve_taker = IVCurveTaker(pt, adr_gui_control=AdrGuiControlDummy(),
+                                   zero_bias_and_relock_and_record_fb_at_end=False)
+        curves.append(curve_taker.get_curve(dac_values, ignore_prep_requirement=True, pipelined=pipelined))
+        assert len(cc.relocks) > 0
+    for serial_curve, pipelined_curve in zip(*curves):
+        _, y_serial = serial_curve.xy_arrays()
+        _, y_pipelined = pipelined_curve.xy_arrays()
+        assert np.allclose(y_serial, y_pipelined)
+        assert np.allclose(y_serial[:, 2]-y_serial[0, 2], 0.5*(dac_values-dac_values[0]))
+
+
+def tes_fb(dac, rn=30.0, psat=2e6, ites_per_fb=1.0):
+    """synthetic TES feedback vs detector bias, constant power in the transition, rsh=1"""
+    ib = np.asarray(dac, dtype="float64")
+    # larger root of psat*(1+r)**2 = ib**2*r gives the stable transition resistance
+    b = ib**2-2*psat
+    disc = np.maximum(b**2-4*psat**2, 0)
+    r = np.where(b**2-4*psat**2 > 0, (b+np.sqrt(disc))/(2*psat), 0)
+    r = np.minimum(r, rn)
+    return 8000+ib/(1+r)/ites_per_fb
+
+
+def test_adaptive_dac_planner_refines_transition():
+    rows = [1.0, 1.2]  # two rows with different gains
+    planner = AdaptiveDacPlanner(20000, 0, coarse_step=1000, fine_step=100, max_points=100)
+    dac_values, fb_values = [], []
+    dac = planner.next_dac(dac_values, fb_values)
+    while dac is not None:
+        dac_values.append(dac)
+        fb_values.append(np.array([tes_fb(dac, ites_per_fb=g) for g in rows]))
+        dac = planner.next_dac(dac_values, fb_values)
+    dac_values = np.array(dac_values)
+    assert dac_values[-1] == 0
+    assert len(dac_values) <= 100
+    assert np.all(np.diff(dac_values) < 0)
+    # the transition of the model spans roughly dac 2900 to 7900, once inside it the fine step is used
+    in_transition = np.logical_and(dac_values > 3000, dac_values < 7800)
+    steps_in_transition = np.logical_and(in_transition[:-1], in_transition[1:])
+    assert np.sum(steps_in_transition) > 10
+    assert np.all(-np.diff(dac_values)[steps_in_transition] <= 100)
+    # far fewer points than a uniform grid at the fine step
+    assert len(dac_values) < 20000//100//2
+
+
+def test_adaptive_dac_planner_in_get_curve():
+    pt, ec, cc = make_point_taker([0, 1])
+    curve_taker = IVCurveTaker(pt, adr_gui_control=AdrGuiControlDummy(),
+                               zero_bias_and_relock_and_record_fb_at_end=False)
+    planner = AdaptiveDacPlanner(10000, 0, coarse_step=1000, fine_step=100, max_points=50)
+    curves = curve_taker.get_curve(planner, ignore_prep_requirement=True)
+    # the fake client is linear, so it never enters a transition and only coarse steps are used
+    assert curves[0].dac_values == list(range(10000, -1, -1000))
+    assert len(curves[0].fb_values) == len(curves[0].dac_values)
+
+
+class FakeStreamingClient(FakeEasyClient):
+    """streams frames at sample_rate, feedback follows the dac history with an autorelock that keeps
+    fb within one phi0 of 8000"""
+    def __init__(self, latency_s=0.013, phi0_fb=1500, sample_rate=20000, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_s = latency_s
+        self.phi0_fb = phi0_fb
+        self.sample_rate = sample_rate
+        self.history = [(0, self.dac.copy())]
+
+    def set_dac(self, col, dacvalue):
+        self.dac[col] = dacvalue
+        self.history.append((time.time(), self.dac.copy()))
+
+    def getNewData(self, delaySeconds=0.001, minimumNumPoints=4000, **kwargs):
+        if minimumNumPoints < 1000:
+            return super().getNewData(delaySeconds, minimumNumPoints, **kwargs)
+        self.ncalls += 1
+        t0 = time.time()+self.latency_s
+        time.sleep(self.latency_s+minimumNumPoints/self.sample_rate)
+        frame_times = t0+np.arange(minimumNumPoints)/self.sample_rate
+        history_times = np.array([t for t, _ in self.history])
+        dacs = np.array([dac for _, dac in self.history])[np.searchsorted(history_times, frame_times)-1]
+        fb = self.fb_from_dacs(dacs.T)
+        fb = (fb-8000+self.phi0_fb/2) % self.phi0_fb + 8000-self.phi0_fb/2
+        data = np.zeros((self.ncol, self.nrow, minimumNumPoints, 2), dtype="float32")
+        data[:, :, :, 1] = fb
+        return data
+
+    def fb_from_dacs(self, dacs):
+        """dacs is (ncol, nframes), return fb (ncol, nrow, nframes)"""
+        return 8000+self.slope[np.newaxis, :, np.newaxis]*dacs[:, np.newaxis, :]
+
+
+def test_ramp_curve():
+    ec = FakeStreamingClient(slope=np.array([0.1, -0.2, 0.5]), npts=10)
+    cc = FakeCringeControl(ec)
+
+    def voltage_source(col):
+        def set_volt(dacvalue):
+            ec.set_dac(col, dacvalue)
+        return set_volt
+    pt = IVPointTaker("DB1", ["AX", "BX"], easy_client=ec, cringe_control=cc, delay_s=0,
+                      voltage_source=[voltage_source(col) for col in [0, 2]], column_number=[0, 2])
+    curve_taker = IVCurveTaker(pt, adr_gui_control=AdrGuiControlDummy(),
+                               zero_bias_and_relock_and_record_fb_at_end=False)
+    dac_values = np.arange(20000, -1, -200)
+    tstart = time.time()
+    curves = curve_taker.get_curve_ramp(dac_values, dwell_s=0.01, phi0_fb=ec.phi0_fb, ignore_prep_requirement=True)
+    assert time.time()-tstart < 5
+    assert abs(curves[0].extra_info["ramp_shift_frames"]) <= 0.02*ec.sample_rate
+    for curve in curves:
+        _, y = curve.xy_arrays()
+        assert y.shape == (len(dac_values), ec.nrow)
+        # row 2 wraps many times, unwrapping restores the straight line
+        assert np.allclose(y-y[0], ec.slope*(dac_values-dac_values[0])[:, np.newaxis], atol=1e-6)
+
+
+def test_temp_sweep_resume(tmp_path):
+    checkpoint_filename = str(tmp_path/"checkpoint.json")
+    set_temps_k = [0.1, 0.12, 0.14, 0.16]
+    dac_values = [1000, 500, 0]
+
+    def make_sweeper(fail_at_temp_k=None):
+        pt, ec, cc = make_point_taker([1, 3])
+        curve_taker = IVCurveTaker(pt, adr_gui_control=AdrGuiControlDummy(),
+                                   zero_bias_and_relock_and_record_fb_at_end=False)
+        curve_taker._was_prepped = True
+        temps_set = []
+
+        def set_temp_and_settle(setpoint_k):
+            if setpoint_k == fail_at_temp_k:
+                raise Exception("serial timeout")
+            temps_set.append(setpoint_k)
+            curve_taker._last_setpoint_k = setpoint_k
+        curve_taker.set_temp_and_settle = set_temp_and_settle
+        return IVTempSweeper(curve_taker), temps_set
+
+    sweeper, temps_set = make_sweeper(fail_at_temp_k=0.14)
+    try:
+        sweeper.get_sweep(dac_values, set_temps_k, checkpoint_filename=checkpoint_filename)
+        assert False, "sweep should have died"
+    except Exception as ex:
+        assert str(ex) == "serial timeout"
+    assert temps_set == [0.1, 0.12]
+
+    # rerunning without resume_from must not overwrite the checkpoint
+    sweeper, temps_set = make_sweeper()
+    try:
+        sweeper.get_sweep(dac_values, set_temps_k, checkpoint_filename=checkpoint_filename)
+        assert False, "sweep should have refused to start"
+    except AssertionError as ex:
+        assert "resume_from" in str(ex)
+    assert temps_set == []
+
+    sweeps = sweeper.get_sweep(dac_values, set_temps_k, resume_from=checkpoint_filename)
+    assert temps_set == [0.14, 0.16]
+    assert len(sweeps) == 2
+    for sweep, col in zip(sweeps, [1, 3]):
+        assert sweep.set_temps_k == set_temps_k
+        assert [curve.nominal_temp_k for curve in sweep.data] == set_temps_k
+        assert all(curve.column_number == col for curve in sweep.data)
+
+
+class FakeTESStreamingClient(FakeStreamingClient):
+    """each row jumps by fast*ddac when the bias steps, then relaxes to slope*ddac with time constant tau_s"""
+    def __init__(self, fast, tau_s, **kwargs):
+        super().__init__(**kwargs)
+        self.fast = np.array(fast)
+        self.tau_s = tau_s
+
+    def fb_from_dacs(self, dacs):
+        lowpass = np.zeros_like(dacs)
+        lowpass[:, 0] = dacs[:, 0]
+        a = 1-np.exp(-1/(self.sample_rate*self.tau_s))
+        for k in range(1, dacs.shape[1]):
+            lowpass[:, k] = lowpass[:, k-1]+(dacs[:, k-1]-lowpass[:, k-1])*a
+        fb = super().fb_from_dacs(dacs)
+        return fb+(self.fast-self.slope)[np.newaxis, :, np.newaxis]*(dacs-lowpass)[:, np.newaxis, :]
+
+
+def test_bias_steps():
+    ec = FakeTESStreamingClient(fast=[0.3, 0.5, 0.5], tau_s=0.005, slope=np.array([0.1, -0.2, 0.5]), npts=10)
+    cc = FakeCringeControl(ec)
+
+    def voltage_source(col):
+        def set_volt(dacvalue):
+            ec.set_dac(col, dacvalue)
+        return set_volt
+    pt = IVPointTaker("DB1", ["AX", "BX"], easy_client=ec, cringe_control=cc, delay_s=0,
+                      voltage_source=[voltage_source(col) for col in [0, 2]], column_number=[0, 2])
+    ec.set_dac(0, 5000)
+    ec.set_dac(2, 5000)
+    datas = BiasStepTaker(pt).get_bias_steps(5000, step_dac=100, n_periods=5, half_period_s=0.05,
+                                             phi0_fb=ec.phi0_fb)
+    assert len(datas) == 2
+    for data, col in zip(datas, [0, 2]):
+        assert data.column_number == col
+        assert np.allclose(data.dfb_ddac_slow, ec.slope, rtol=0.01, atol=1e-3)
+        assert np.allclose(data.dfb_ddac_fast, ec.fast, rtol=0.03)
+        assert np.allclose(data.tau_s[:2], ec.tau_s, rtol=0.05)
+        # the absolute level wraps with the autorelock, so compare modulo phi0
+        wrapped_error = (data.fb_mean-(8000+ec.slope*5000)+ec.phi0_fb/2) % ec.phi0_fb-ec.phi0_fb/2
+        assert np.all(np.abs(wrapped_error) < 10)
+    circuit = IVCircuit(rfb_ohm=4e3, rbias_ohm=1e3, rsh_ohm=200e-6, rpar_ohm=0, m_ratio=3.46,
+                        vfb_gain=1.0/2**14, vbias_gain=2.5/2**16)
+    small_signal = datas[0].small_signal(circuit, rn_ohm=0.01)
+    assert small_signal["rfrac"].shape == (ec.nrow,)
+    # no transient on row 2, so no electrothermal feedback
+    assert np.isclose(small_signal["loopgain"][2], 0, atol=1e-3)
+
+
+class FakeRampingAdr(AdrGuiControlDummy):
+    """the bath lags the setpoint by a fixed time"""
+    def __init__(self, lag_s=0.1):
+        self.setpoints = [(0, 0.1)]
+        self.lag_s = lag_s
+
+    def set_temp_k(self, setpoint_k):
+        self.setpoints.append((time.time(), setpoint_k))
+
+    def get_temp_k(self):
+        t = time.time()-self.lag_s
+        return [setpoint_k for t_set, setpoint_k in self.setpoints if t_set <= t][-1]
+
+
+def test_temp_ramp_sweep():
+    pt, ec, cc = make_point_taker([1, 3])
+    adr = FakeRampingAdr()
+    curve_taker = IVCurveTaker(pt, adr_gui_control=adr, zero_bias_and_relock_and_record_fb_at_end=False)
+    curve_taker.set_temp_and_settle = lambda setpoint_k: None
+    sweeper = IVTempRampSweeper(curve_taker, setpoint_update_s=0.02)
+    sdatas = sweeper.get_sweep([1000, 500, 0], 0.1, 0.11, ramp_rate_k_per_s=0.01, ramp_iv=False,
+                               ignore_prep_requirement=True)
+    assert curve_taker.adr_gui_control is adr
+    assert len(sdatas) == 2 and sdatas[1].data[0].column_number == 3
+    sdata = sdatas[0]
+    assert len(sdata.data) > 4
+    assert adr.setpoints[-1][1] == 0.11
+    temps_k = sdata.measured_temps_k()
+    assert np.allclose(temps_k, sdata.set_temps_k)
+    assert np.all(np.diff(temps_k) > 0)
+    assert temps_k[0] < 0.103 and temps_k[-1] > 0.107
+    for curve in sdata.data:
+        assert len(curve.extra_info["temp_trace_k"]) > 0
+    centers, mean, std, count = bin_vs_temp(temps_k, np.vstack([temps_k, 2*temps_k]).T, [0.099, 0.105, 0.111])
+    assert np.array_equal(count[:, 0], count[:, 1]) and np.sum(count[:, 0]) == len(temps_k)
+    assert np.allclose(mean[:, 1], 2*mean[:, 0])
@@ -0,0 +1,48 @@
+from detchar.kink_fit import fit_kinks, approx_kink_indices, find_kinks
+import numpy as np
+
+
+def kink_model(x, k, a, b, c):
+    return a + np.where(x < k, b * (x - k), c * (x - k))
+
+
+def test_fit_kinks_matches_brute_force():
+    rng = np.random.default_rng(0)
+    x = np.linspace(-3, 5, 80)
+    y = kink_model(x, 1.3, 2.0, 0.5, -4.0) + rng.normal(0, 0.3, size=(4, len(x)))
+    k, a, b, c, chi2, j = fit_kinks(y, x)
+    for row in range(len(y)):
+        # one linear least squares per candidate kink, like the scan in fit_kink_model
+        chi2s = []
+        for kk in x[1:-1]:
+            basis = np.vstack([np.ones_like(x), np.minimum(x - kk, 0), np.maximum(x - kk, 0)]).T
+            p, res, _, _ = np.linalg.lstsq(basis, y[row], rcond=None)
+            chi2s.append(np.sum((basis @ p - y[row]) ** 2))
+        best = np.argmin(chi2s)
+        assert k[row] == x[1:-1][best] and j[row] == best + 1
+        assert np.isclose(chi2[row], chi2s[best])
+    assert np.allclose(k, 1.3, atol=0.2)
+    assert np.allclose(b, 0.5, atol=0.2) and np.allclose(c, -4, atol=0.2)
+
+
+def find_kink_approx_loop(fb, delta_threshold=1000, pointstep=10):
+    """find_kink_approx from detchar/awg_iv/iv_analyze_saved_data.py, as a reference"""
+    for i in range(10, len(fb)):
+        a = fb[i]-fb[i-pointstep]
+        b = fb[pointstep] - fb[i]
+        if np.abs(b)-np.abs(a) > delta_threshold:
+            break
+    return i
+
+
+def test_find_kinks_on_ramps():
+    # a flat start then a ramp, like the start of the AWG profile, with noise and a random start per row
+    rng = np.random.default_rng(1)
+    t = np.arange(6000)
+    kinks = rng.integers(1000, 4000, size=12)
+    slopes = rng.choice([-1, 1], size=12)*rng.uniform(5, 20, size=12)
+    fb = np.array([kink_model(t, kink, 0, 0, slope) for kink, slope in zip(kinks, slopes)])
+    fb += rng.normal(0, 20, size=fb.shape)
+    approx = approx_kink_indices(fb)
+    assert np.array_equal(approx, [find_kink_approx_loop(trace) for trace in fb])
+    assert np.all(np.abs(find_kinks(fb)-kinks) <= 3)
@@ -0,0 +1,46 @@
+from cringe.tune.noise import measure_noise, WelchAccumulator
+import numpy as np
+import scipy.signal
+
+
+class FakeNoiseClient:
+    """white noise of a different rms in each channel on the feedback, plus a tone in channel (0, 1)"""
+
+    def __init__(self, ncol=2, nrow=3, sample_rate=1e5, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.sample_rate = sample_rate
+        self.rms = np.arange(1, ncol*nrow+1, dtype="float64").reshape(ncol, nrow, 1)
+        self.calls = 0
+
+    def getNewData(self, delaySeconds=0.001, minimumNumPoints=4000, exactNumPoints=False):
+        self.calls += 1
+        ncol, nrow = self.rms.shape[:2]
+        data = np.zeros((ncol, nrow, minimumNumPoints, 2), dtype="int64")
+        t = (np.arange(minimumNumPoints)+self.calls*minimumNumPoints)/self.sample_rate
+        fb = 1000+self.rms*self.rng.standard_normal((ncol, nrow, minimumNumPoints))*100
+        fb[0, 1] += 500*np.sin(2*np.pi*12500*t)
+        data[..., 1] = np.round(fb)
+        return data
+
+
+def test_measure_noise_white_level():
+    client = FakeNoiseClient()
+    noise = measure_noise(client.getNewData, client.sample_rate, num_points=2**12, navgs=20)
+    assert client.calls == 20
+    assert noise.asd.shape == (2, 3, 2**11+1)
+    expected = 100*client.rms[..., 0]*np.sqrt(2/client.sample_rate)
+    level = noise.band_level(20000, 45000)
+    assert np.allclose(level, expected, rtol=0.05)
+    assert np.isclose(noise.freqs[np.argmax(noise.asd[0, 1])], 12500)
+
+
+def test_welch_matches_scipy():
+    rng = np.random.default_rng(1)
+    blocks = rng.standard_normal((3, 2, 4, 1000))
+    welch = WelchAccumulator(256, 1000.0, overlap=0.5)
+    for block in blocks:
+        welch.add(block)
+    freqs, psd = scipy.signal.welch(blocks, 1000.0, nperseg=256, noverlap=128, axis=-1)
+    assert welch.nsegments == 3*6
+    assert np.allclose(welch.spectrum().freqs, freqs)
+    assert np.allclose(welch.spectrum().asd**2, psd.mean(axis=0))
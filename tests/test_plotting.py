@@ -0,0 +1,42 @@
+from cringe.tune.plotting import ColFigure, PngWriter
+import numpy as np
+
+
+class FakePick:
+    def __init__(self, artist, ind):
+        self.artist, self.ind = artist, ind
+
+
+def test_colfigure_reuses_artists():
+    cols = ColFigure.offscreen(3, 12)
+    x = np.arange(50)
+    y = np.random.default_rng(0).standard_normal((3, 12, 50)).cumsum(axis=-1)
+    cols.plot(x, y)
+    lines, points = list(cols.lines), [list(p) for p in cols.points]
+    assert len(cols.axes[0].collections) == 1
+    assert len(points[0]) == len(cols.cycle)  # one marker line per color, not per row
+    cols.plot(x, y+1000)
+    assert cols.lines == lines and cols.points == points
+    assert np.allclose(cols.lines[2].get_segments()[11], np.stack([x, y[2, 11]+1000], axis=-1))
+    assert cols.axes[2].get_ylim()[0] > 900
+    assert cols.picked(FakePick(cols.lines[1], [4])) == "col 1, row4"
+    # row 11 is the second row with the second color
+    assert cols.picked(FakePick(cols.points[1][1], [50+7])) == "col 1, row11"
+    cols.plotbigx(np.broadcast_to(x, y.shape), y)
+    assert cols.points == [None]*3 and cols.lines == lines
+    cols.cla()
+    assert len(cols.axes[0].collections) == 0
+
+
+def test_colfigure_log_axes_and_pngs(tmp_path):
+    cols = ColFigure.offscreen(2, 3)
+    y = np.zeros((2, 3, 10))
+    y[..., 5:] = 10
+    cols.semilogy(np.arange(10), y)
+    assert cols.axes[0].get_yscale() == "log"
+    assert np.all(np.isnan(cols.points[0][0].get_ydata()[:5]))
+    writer = PngWriter(str(tmp_path / "plots"))
+    path = writer.save(cols.figure, "bit errors")
+    writer.wait()
+    assert path.endswith("bit_errors.png")
+    assert (tmp_path / "plots" / "bit_errors.png").stat().st_size > 0
@@ -0,0 +1,69 @@
+from cringe.tune.sweep import SweepEngine, SweepResult, errfbStats
+import numpy as np
+import threading
+
+
+class FakeSweepClient:
+    """error is the parameter times the channel number, with some noise"""
+
+    def __init__(self, ncol=2, nrow=3):
+        self.rng = np.random.default_rng(0)
+        self.gain = np.arange(ncol*nrow).reshape(ncol, nrow, 1)
+        self.value = None
+        self.log = []
+
+    def set(self, value):
+        self.log.append(("set", value))
+        self.value = value
+
+    def getNewData(self, delaySeconds=0.001, minimumNumPoints=4000, divideNsamp=True):
+        self.log.append(("get", self.value))
+        data = np.zeros(self.gain.shape[:2]+(minimumNumPoints, 2))
+        data[..., 0] = self.gain*self.value+self.rng.standard_normal(data.shape[:3])
+        data[..., 1] = 7
+        return data
+
+
+def test_sweep_reduces_every_value(tmp_path):
+    client = FakeSweepClient()
+    threads = set()
+
+    def reduce(data):
+        threads.add(threading.get_ident())
+        return errfbStats(data)
+    vals = np.arange(0, 50, 10)
+    result = SweepEngine("SETT", client.set, vals, client.getNewData, reduce,
+                         acquisition=dict(minimumNumPoints=1000, divideNsamp=False),
+                         checkpoint=str(tmp_path / "sweep.npz")).run()
+    assert client.log == [(step, v) for v in vals for step in ["set", "get"]]
+    assert threads and threading.get_ident() not in threads
+    assert np.array_equal(result.values, vals) and not result.stopped
+    assert result["err"].shape == (2, 3, 5)
+    assert np.allclose(result["err"], client.gain*vals, atol=0.2)
+    assert np.all(result["fb"] == 7)
+    saved = SweepResult.load(str(tmp_path / "sweep.npz"))
+    assert saved.name == "SETT" and np.array_equal(saved.values, vals)
+    assert np.array_equal(saved["errstd"], result["errstd"])
+
+
+def test_sweep_stops_when_criterion_met(tmp_path):
+    client = FakeSweepClient()
+    vals = np.arange(0, 100, 10)
+    result = SweepEngine("SQ1b", client.set, vals, client.getNewData, errfbStats,
+                         acquisition=dict(minimumNumPoints=100),
+                         stopWhen=lambda reduced: np.max(reduced["err"]) > 100,
+                         checkpoint=str(tmp_path / "sweep.npz")).run()
+    # 5*30 > 100, the step after it was taken while 30 was reduced and is dropped
+    assert result.stopped
+    assert np.array_equal(result.values, [0, 10, 20, 30])
+    assert result["err"].shape == (2, 3, 4)
+    assert client.log[-1] == ("get", 40)
+    assert SweepResult.load(str(tmp_path / "sweep.npz")).stopped
+
+
+def test_sweep_settles_and_discards_after_each_set():
+    client = FakeSweepClient()
+    result = SweepEngine("SQ1b", client.set, [1, 2], client.getNewData, errfbStats,
+                         acquisition=dict(minimumNumPoints=10), settleS=0.01, discardData=True).run()
+    assert client.log == [("set", 1), ("get", 1), ("get", 1), ("set", 2), ("get", 2), ("get", 2)]
+    assert result["err"].shape == (2, 3, 2)
@@ -0,0 +1,35 @@
+from detchar.temp_settle import TempSettleDetector, FakeThermometer
+import numpy as np
+
+
+def make_detector(therm, **kwargs):
+    return TempSettleDetector(therm.get_temp_k, clock=therm.clock, sleep=therm.sleep, **kwargs)
+
+
+def test_settle_tracks_time_constant():
+    # settling time should follow the physics, a slow thermometer takes proportionally longer
+    settle_times_s = []
+    for tau_s in [20, 80]:
+        therm = FakeThermometer(0.1, tau_s=tau_s, noise_k=2e-6)
+        therm.set_temp_k(0.12)
+        detector = make_detector(therm, tolerance_k=2e-4, window_s=30, sample_period_s=1.0)
+        assert detector.wait(0.12, time_out_s=3600, verbose=False)
+        assert abs(therm.temp_k - 0.12) < 2e-4
+        settle_times_s.append(therm.t)
+    # 20 mK step within 0.2 mK needs about 4.6 tau, plus up to a window
+    assert 4.6*20 < settle_times_s[0] < 4.6*20+60
+    assert 4.6*80 < settle_times_s[1] < 4.6*80+60
+
+
+def test_already_settled_takes_one_window():
+    therm = FakeThermometer(0.1, noise_k=2e-6)
+    detector = make_detector(therm, tolerance_k=2e-4, window_s=30, sample_period_s=1.0)
+    assert detector.wait(0.1, time_out_s=600, verbose=False)
+    assert np.isclose(therm.t, 30)
+
+
+def test_noisy_thermometer_times_out():
+    therm = FakeThermometer(0.1, noise_k=1e-3)
+    detector = make_detector(therm, tolerance_k=2e-4, window_s=30, sample_period_s=1.0)
+    assert not detector.wait(0.1, time_out_s=300, verbose=False)
+    assert therm.t > 300